@@ -80,19 +80,20 @@ class SweepAlgorithm:
                 'maxWidth': int(math.ceil(source.sizeX / self.scale)),
                 'maxHeight': int(math.ceil(source.sizeY / self.scale)),
             }
-        for tile in source.tileIterator(
-            format=large_image.tilesource.TILE_FORMAT_NUMPY,
-            tile_size=dict(width=2048, height=2048),
-            **tiparams,
-        ):
+        axes = {p['axis']: iteration_id[i] for i, p in enumerate(self.param_order.values())}
+
+        def process(tile):
+            return tile, self.algorithm(tile['tile'], *params)
+
+        def write(count, result):
+            # This is called in order in this thread, so tiles are added to
+            # the sink one at a time
+            tile, altered_data = result
             scaled = tile.get('scaled', 1)
             if self.overlay:
                 self.addTile(
                     tilesink,
-                    tile['tile'], int(tile['x'] * scaled), int(tile['y'] * scaled),
-                    **{p['axis']: iteration_id[i] for i, p in enumerate(
-                        self.param_order.values())})
-            altered_data = self.algorithm(tile['tile'], *params)
+                    tile['tile'], int(tile['x'] * scaled), int(tile['y'] * scaled), **axes)
             mask = None
             if self.overlay:
                 if altered_data.shape[2] in {2, 4}:
@@ -104,13 +105,26 @@ class SweepAlgorithm:
             self.addTile(
                 tilesink,
                 altered_data, int(tile['x'] * scaled), int(tile['y'] * scaled), mask=mask,
-                **{p['axis']: iteration_id[i] for i, p in enumerate(self.param_order.values())})
+                **axes)
+            return count + 1
+
+        def progress(done, total):
+            nonlocal lastlogtime
+
             if time.time() - lastlogtime > 10:
-                sys.stdout.write(
-                    f'Processed {tile["tile_position"]["position"] + 1} of '
-                    f'{tile["iterator_range"]["position"]} tiles\n')
+                sys.stdout.write(f'Processed {done} of {total} tiles\n')
                 sys.stdout.flush()
                 lastlogtime = time.time()
+
+        # When several runs are processed at once, each run uses one worker
+        source.mapTiles(
+            process, reduce=write, initial=0,
+            workers=1 if len(self.combos) > 1 else self.max_workers,
+            executor='thread', progress=progress,
+            format=large_image.tilesource.TILE_FORMAT_NUMPY,
+            tile_size=dict(width=2048, height=2048),
+            **tiparams,
+        )
         return self.writeTileSink(tilesink, iteration_id)
 
     def run(self):
@@ -11,6 +11,26 @@ import large_image
 large_image.config.setConfig('cache_backend', 'python')
 
 
+def tile_mean(tile):
+    """
+    Compute the mean color of a tile.  This is run in worker processes, so it
+    is a module-level function.
+
+    :param tile: a tile dictionary from a tile iterator.
+    :returns: the tile's position and size and its mean color.
+    """
+    # The tile image data is in tile['tile'] and is a numpy
+    # multi-dimensional array
+    return {
+        'x': tile['x'],
+        'y': tile['y'],
+        'width': tile['width'],
+        'height': tile['height'],
+        'magnification': tile['magnification'],
+        'mean': np.mean(tile['tile'], axis=(0, 1)),
+    }
+
+
 def average_color(imagePath, magnification=None):
     """
     Print the average color for a tiled image file.
@@ -27,22 +47,20 @@ def average_color(imagePath, magnification=None):
     # We could save it, if we want to.
     # open('/tmp/thumbnail.jpg', 'wb').write(thumbnail)
 
-    tileMeans = []
-    tileWeights = []
-    # iterate through the tiles at a particular magnification:
-    for tile in source.tileIterator(
-            format=large_image.tilesource.TILE_FORMAT_NUMPY,
-            scale={'magnification': magnification},
-            resample=True):
-        # The tile image data is in tile['tile'] and is a numpy
-        # multi-dimensional array
-        mean = np.mean(tile['tile'], axis=(0, 1))
-        tileMeans.append(mean)
-        tileWeights.append(tile['width'] * tile['height'])
+    # process the tiles at a particular magnification in parallel; the results
+    # are in the same order as the tile iterator.
+    results = source.mapTiles(
+        tile_mean,
+        format=large_image.tilesource.TILE_FORMAT_NUMPY,
+        scale={'magnification': magnification},
+        resample=True)
+    for result in results:
         print('x: %d  y: %d  w: %d  h: %d  mag: %g  color: %g %g %g' % (
-            tile['x'], tile['y'], tile['width'], tile['height'],
-            tile['magnification'], mean[0], mean[1], mean[2]))
-    mean = np.average(tileMeans, axis=0, weights=tileWeights)
+            result['x'], result['y'], result['width'], result['height'],
+            result['magnification'], *result['mean'][:3]))
+    mean = np.average(
+        [result['mean'] for result in results], axis=0,
+        weights=[result['width'] * result['height'] for result in results])
     print('Average color: %g %g %g' % (mean[0], mean[1], mean[2]))
     return mean
 
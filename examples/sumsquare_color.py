@@ -8,6 +8,50 @@ import numpy as np
 import large_image
 
 
+def tile_sum_squares(tile):
+    """
+    Compute the sum-of-squares of each channel of a tile.  This is run in
+    worker processes, so it is a module-level function.
+
+    :param tile: a tile dictionary from a tile iterator.
+    :returns: the tile's position and size and its sums-of-squares.
+    """
+    # The tile image data is in tile['tile'] and is a numpy
+    # multi-dimensional array
+    data = tile['tile']
+    # trim off any overlap so we don't include it in our calculations.
+    data = data[
+        tile['tile_overlap']['top']:
+            data.shape[0] - tile['tile_overlap']['bottom'],
+        tile['tile_overlap']['left']:
+            data.shape[1] - tile['tile_overlap']['right'],
+        :]
+    return {
+        'x': tile['x'],
+        'y': tile['y'],
+        'width': tile['width'],
+        'height': tile['height'],
+        'magnification': tile['magnification'],
+        'sumsq': np.sum(data**2, axis=(0, 1)),
+    }
+
+
+def add_sum_squares(total, result):
+    """
+    Report the sum-of-squares of a tile and add it to the total.  mapTiles
+    calls this in the main process in the order of the tiles.
+
+    :param total: the total so far.
+    :param result: the result of tile_sum_squares for one tile.
+    :returns: the new total.
+    """
+    sumsq = result['sumsq']
+    print('x: %d  y: %d  w: %d  h: %d  mag: %g  sums: %d %d %d' % (
+        result['x'], result['y'], result['width'], result['height'],
+        result['magnification'], sumsq[0], sumsq[1], sumsq[2]))
+    return total + sumsq
+
+
 def sum_squares(imagePath, magnification=None, **kwargs):
     """
     Print the sum-of-squares of each color channel for a tiled image file.
@@ -17,28 +61,12 @@ def sum_squares(imagePath, magnification=None, **kwargs):
     """
     source = large_image.open(imagePath)
 
-    tileSumSquares = []
-    # iterate through the tiles at a particular magnification:
-    for tile in source.tileIterator(
-            format=large_image.tilesource.TILE_FORMAT_NUMPY,
-            scale={'magnification': magnification},
-            resample=True, **kwargs):
-        # The tile image data is in tile['tile'] and is a numpy
-        # multi-dimensional array
-        data = tile['tile']
-        # trim off any overlap so we don't include it in our calculations.
-        data = data[
-            tile['tile_overlap']['top']:
-                data.shape[0] - tile['tile_overlap']['bottom'],
-            tile['tile_overlap']['left']:
-                data.shape[1] - tile['tile_overlap']['right'],
-            :]
-        sumsq = np.sum(data**2, axis=(0, 1))
-        tileSumSquares.append(sumsq)
-        print('x: %d  y: %d  w: %d  h: %d  mag: %g  sums: %d %d %d' % (
-            tile['x'], tile['y'], tile['width'], tile['height'],
-            tile['magnification'], sumsq[0], sumsq[1], sumsq[2]))
-    sumsq = np.sum(tileSumSquares, axis=0)
+    # process the tiles at a particular magnification in parallel:
+    sumsq = source.mapTiles(
+        tile_sum_squares, reduce=add_sum_squares, initial=0,
+        format=large_image.tilesource.TILE_FORMAT_NUMPY,
+        scale={'magnification': magnification},
+        resample=True, **kwargs)
     print('Sum of squares: %d %d %d' % (sumsq[0], sumsq[1], sumsq[2]))
     return sumsq
 
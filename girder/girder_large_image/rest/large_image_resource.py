@@ -279,11 +279,19 @@ class LargeImageResource(Resource):
         }
 
     @describeRoute(
-        Description('Get information on caches.'),
+        Description('Get information on caches.')
+        .notes('Each cache includes statistics on hits, misses, and the time '
+               'spent computing missing values, overall and for each class '
+               'that used the cache.')
+        .param('resetStats', 'If true, reset the statistics after reporting '
+               'them.', required=False, dataType='boolean', default=False),
     )
     @access.admin(scope=TokenScope.DATA_READ)
     def cacheInfo(self, params):
-        return cache_util.cachesInfo()
+        info = cache_util.cachesInfo()
+        if self.boolParam('resetStats', params, default=False):
+            cache_util.cachesStatsReset()
+        return info
 
     @describeRoute(
         Description('Get public settings for large image display.'),
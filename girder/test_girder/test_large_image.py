@@ -302,6 +302,10 @@ def testCaches(server, admin):
     assert utilities.respStatus(resp) == 200
     results = resp.json
     assert 'tilesource' in results
+    assert 'hits' in results['tilesource']['stats']
+    resp = server.request(
+        path='/large_image/cache', user=admin, params={'resetStats': 'true'})
+    assert utilities.respStatus(resp) == 200
     resp = server.request(path='/large_image/cache/clear', method='PUT', user=admin)
     assert utilities.respStatus(resp) == 200
     results = resp.json
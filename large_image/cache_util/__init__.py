@@ -15,14 +15,21 @@
 #############################################################################
 
 import atexit
+import contextlib
 from typing import Any, Callable, Dict, List
 
-from .cache import (CacheProperties, LruCacheMetaclass, getTileCache,
-                    isTileCacheSetup, methodcache, strhash)
+from .base import BaseCache
+from .cache import (CacheProperties, LruCacheMetaclass, getCacheMany,
+                    getTileCache, isTileCacheSetup, methodcache, strhash)
 from .cachefactory import CacheFactory, pickAvailableCache
+from .codec import decodeValue, encodeValue
+from .pythoncache import PythonCache, estimateSize
+from .stats import CacheStats, cachesStatsNames, cachesStatsReset, getCacheStats
 
 MemCache: Any
 RedisCache: Any
+SharedMemoryCache: Any
+TieredCache: Any
 try:
     from .memcache import MemCache
 except ImportError:
@@ -31,6 +38,14 @@ try:
     from .rediscache import RedisCache
 except ImportError:
     RedisCache = None
+try:
+    from .shmcache import SharedMemoryCache
+except ImportError:
+    SharedMemoryCache = None
+try:
+    from .tieredcache import TieredCache
+except ImportError:
+    TieredCache = None
 
 _cacheClearFuncs: List[Callable] = []
 
@@ -66,14 +81,37 @@ def cachesClear(*args, **kwargs) -> None:
             pass
 
 
-def cachesInfo(*args, **kwargs) -> Dict[str, Dict[str, int]]:
+def _cacheStats(name: Any, cache: Any, used: Any) -> Dict[str, Any]:
+    """
+    Combine the recorded requests for a cache with what the cache reports
+    about itself.
+
+    :param name: the name of the cache.
+    :param cache: the cache.
+    :param used: the size that the cache reported.
+    :returns: a statistics dictionary.
+    """
+    stats = getCacheStats(name).report()
+    stats['evictions'] = getattr(cache, 'evictions', None)
+    stats['bytes'] = used if isinstance(cache, BaseCache) or getattr(
+        cache, 'sizeInBytes', False) else None
+    return stats
+
+
+def cachesInfo(*args, **kwargs) -> Dict[str, Dict[str, Any]]:
     """
     Report on each cache.
 
     :returns: a dictionary with the cache names as the keys and values that
-        include 'maxsize' and 'used', if known.
+        include 'maxsize' and 'used', if known.  Each cache also has 'stats',
+        with the number of 'hits', 'misses', and 'shared' requests (values
+        computed by another thread making the same request), the
+        'computeTime' and 'averageComputeTime' spent on misses in seconds,
+        the 'hitRatio', the same values for each class that used the cache
+        in 'classes', and 'evictions' and 'bytes' if known.  A tiered tile
+        cache also reports statistics for each tier in 'tiers'.
     """
-    info = {}
+    info: Dict[str, Dict[str, Any]] = {}
     for name in LruCacheMetaclass.namedCaches:
         with LruCacheMetaclass.namedCaches[name][1]:
             cache = LruCacheMetaclass.namedCaches[name][0]
@@ -81,29 +119,40 @@ def cachesInfo(*args, **kwargs) -> Dict[str, Dict[str, int]]:
                 'maxsize': cache.maxsize,
                 'used': cache.currsize,
             }
+            info[name]['stats'] = _cacheStats(name, cache, info[name]['used'])
     if isTileCacheSetup():
         tileCache, tileLock = getTileCache()
         try:
-            if tileLock:
-                with tileLock:
-                    info['tileCache'] = {
-                        'maxsize': tileCache.maxsize,
-                        'used': tileCache.currsize,
-                        'items': getattr(tileCache, 'curritems' if hasattr(
-                            tileCache, 'curritems') else 'currsize', None),
-                    }
-            else:
+            with tileLock or contextlib.nullcontext():
                 info['tileCache'] = {
                     'maxsize': tileCache.maxsize,
                     'used': tileCache.currsize,
                     'items': getattr(tileCache, 'curritems' if hasattr(
                         tileCache, 'curritems') else 'currsize', None),
                 }
+            info['tileCache']['stats'] = _cacheStats(
+                'tileCache', tileCache, info['tileCache']['used'])
+            if hasattr(tileCache, 'tierStats'):
+                info['tileCache']['tiers'] = tileCache.tierStats()
         except Exception:
             pass
     return info
 
 
+def cachesStats(*args, **kwargs) -> Dict[str, Dict[str, Any]]:
+    """
+    Report the requests recorded for each cache.  This includes requests to
+    caches used by methodcache other than the tile cache, which are reported
+    as 'methodcache'.
+
+    :returns: a dictionary with the cache names as the keys and statistics
+        as described in cachesInfo, without 'evictions' or 'bytes'.
+    """
+    return {name: getCacheStats(name).report() for name in cachesStatsNames()}
+
+
 __all__ = ('CacheFactory', 'getTileCache', 'isTileCacheSetup', 'MemCache', 'RedisCache',
-           'strhash', 'LruCacheMetaclass', 'pickAvailableCache', 'methodcache',
-           'CacheProperties')
+           'SharedMemoryCache', 'TieredCache', 'PythonCache', 'estimateSize', 'strhash',
+           'LruCacheMetaclass', 'pickAvailableCache', 'methodcache', 'getCacheMany',
+           'encodeValue', 'decodeValue', 'CacheProperties', 'CacheStats', 'getCacheStats',
+           'cachesStatsReset')
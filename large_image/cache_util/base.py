@@ -1,7 +1,7 @@
 import hashlib
 import threading
 import time
-from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, TypeVar
 
 import cachetools
 
@@ -65,6 +65,32 @@ class BaseCache(cachetools.Cache):
         # hashedKey = self._hashKey(key)
         raise NotImplementedError
 
+    def getMany(self, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Get several values from the cache.  Subclasses should override this
+        to fetch the values in as few requests as possible.
+
+        :param keys: the keys to look up.
+        :returns: a dictionary of the keys that were found and their values.
+        """
+        results = {}
+        for key in keys:
+            try:
+                results[key] = self[key]
+            except KeyError:
+                pass
+        return results
+
+    def setMany(self, items: Dict[str, Any]) -> None:
+        """
+        Store several values in the cache.  Subclasses should override this
+        to store the values in as few requests as possible.
+
+        :param items: a dictionary of keys and values to store.
+        """
+        for key, value in items.items():
+            self[key] = value
+
     @property
     def curritems(self) -> int:
         raise NotImplementedError
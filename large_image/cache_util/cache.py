@@ -1,8 +1,10 @@
+import contextlib
 import functools
 import pickle
 import threading
+import time
 import uuid
-from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple, TypeVar
 
 import cachetools
 from typing_extensions import ParamSpec
@@ -15,6 +17,7 @@ except ImportError:
 
 from .. import config
 from .cachefactory import CacheFactory, pickAvailableCache
+from .stats import CacheStats, getCacheStats
 
 P = ParamSpec('P')
 T = TypeVar('T')
@@ -68,62 +71,229 @@ def strhash(*args, **kwargs) -> str:
     return repr(args)
 
 
-def methodcache(key: Optional[Callable] = None) -> Callable:  # noqa
+class _InFlightCall:
+    """
+    A methodcache call that is being computed.  Other threads that make the
+    same call wait for its result rather than computing it again.
+    """
+
+    __slots__ = ('done', 'failed', 'thread', 'value')
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.thread = threading.get_ident()
+        self.failed = True
+        self.value: Any = None
+
+
+_inFlightCalls: Dict[Tuple[Callable, str], _InFlightCall] = {}
+_inFlightLock = threading.Lock()
+
+
+def _methodcacheKey(self, key: Optional[Callable], args: Any, kwargs: Any) -> str:
+    """
+    Get the cache key that methodcache uses for a call.
+
+    :param self: the instance the method is called on.
+    :param key: if a function, use that for the key, otherwise use
+        self.wrapKey.
+    :param args: the arguments of the call.
+    :param kwargs: the keyword arguments of the call.
+    :returns: the cache key.
+    """
+    k = key(*args, **kwargs) if key else self.wrapKey(*args, **kwargs)
+    lock = getattr(self, 'cache_lock', None)
+    ck = getattr(self, '_classkey', None)
+    if lock:
+        with self.cache_lock:
+            if hasattr(self, '_classkeyLock'):
+                if self._classkeyLock.acquire(blocking=False):
+                    self._classkeyLock.release()
+                else:
+                    ck = getattr(self, '_unlocked_classkey', ck)
+    if ck:
+        k = ck + ' ' + k
+    return k
+
+
+def _methodcacheStats(self) -> CacheStats:
+    """
+    Get the statistics object used to record methodcache requests.  Requests
+    to the tile cache are recorded as 'tileCache'; requests to other caches
+    are recorded as 'methodcache'.
+
+    :param self: the instance the method is called on.
+    :returns: a CacheStats object.
+    """
+    return getCacheStats(
+        'tileCache' if _tileCache is not None and self.cache is _tileCache else 'methodcache')
+
+
+def _methodcacheGet(self, lock: Any, k: str) -> Any:
+    """
+    Get the result of a methodcache call from self.cache.
+
+    :param self: the instance the method was called on.
+    :param lock: if not None, hold self.cache_lock while getting the value.
+    :param k: the cache key.
+    :returns: the cached value.  Raises a KeyError if there is no usable
+        value.
+    """
+    try:
+        if lock:
+            with self.cache_lock:
+                return self.cache[k]
+        return self.cache[k]
+    except (ValueError, pickle.UnpicklingError):
+        # this can happen if a different version of python wrote the record
+        raise KeyError(k)
+
+
+def _methodcacheStore(self, lock: Any, k: str, v: Any) -> None:
+    """
+    Store the result of a methodcache call in self.cache.
+
+    :param self: the instance the method was called on.
+    :param lock: if not None, hold self.cache_lock while storing the value.
+    :param k: the cache key.
+    :param v: the value to store.
+    """
+    try:
+        if lock:
+            with self.cache_lock:
+                self.cache[k] = v
+        else:
+            self.cache[k] = v
+    except ValueError:
+        pass  # value too large
+    except (KeyError, RuntimeError):
+        # the key was refused for some reason
+        config.getLogger().debug(
+            'Had a cache KeyError while trying to store a value to key %r' % (k))
+
+
+def methodcache(  # noqa
+        key: Optional[Callable] = None, ignore: Optional[Iterable[str]] = None) -> Callable:
     """
     Decorator to wrap a function with a memoizing callable that saves results
     in self.cache.  This is largely taken from cachetools, but uses a cache
     from self.cache rather than a passed value.  If self.cache_lock is
     present and not none, a lock is used.
 
+    Hits, misses, and the time spent computing missing values are recorded
+    for each class; see cachesInfo and cachesStats.
+
+    If several threads make the same call while its result is not cached,
+    only one of them calls the function; the others wait for and share its
+    result.  If that call raises an exception, each waiting thread calls the
+    function itself.
+
+    The wrapped function has a ``cacheKey(self, *args, **kwargs)`` attribute
+    that returns the cache key that would be used for a call.  This can be
+    used with getCacheMany to look up several calls at once.
+
     :param key: if a function, use that for the key, otherwise use self.wrapKey.
+    :param ignore: names of keyword arguments that don't change the result,
+        such as the number of workers.  These are left out of the key.
     """
+    ignored = frozenset(ignore or ())
+
+    def keyKwargs(kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        return {k: v for k, v in kwargs.items() if k not in ignored} if ignored else kwargs
+
     def decorator(func: Callable[P, T]) -> Callable[..., T]:
         @functools.wraps(func)
         def wrapper(self, *args: P.args, **kwargs: P.kwargs) -> T:
-            k = key(*args, **kwargs) if key else self.wrapKey(*args, **kwargs)
+            k = _methodcacheKey(self, key, args, keyKwargs(kwargs))
             lock = getattr(self, 'cache_lock', None)
-            ck = getattr(self, '_classkey', None)
-            if lock:
-                with self.cache_lock:
-                    if hasattr(self, '_classkeyLock'):
-                        if self._classkeyLock.acquire(blocking=False):
-                            self._classkeyLock.release()
-                        else:
-                            ck = getattr(self, '_unlocked_classkey', ck)
-            if ck:
-                k = ck + ' ' + k
+            stats = _methodcacheStats(self)
+            className = self.__class__.__name__
             try:
-                if lock:
-                    with self.cache_lock:
-                        return self.cache[k]
-                else:
-                    return self.cache[k]
+                v = _methodcacheGet(self, lock, k)
+                stats.record(className, 'hits')
+                return v
             except KeyError:
                 pass  # key not found
-            except (ValueError, pickle.UnpicklingError):
-                # this can happen if a different version of python wrote the record
-                pass
-            v = func(self, *args, **kwargs)
-            try:
-                if lock:
-                    with self.cache_lock:
-                        self.cache[k] = v
+            flightKey = (func, k)
+            with _inFlightLock:
+                call = _inFlightCalls.get(flightKey)
+                if call is None:
+                    call = _inFlightCalls[flightKey] = _InFlightCall()
+                    leader = True
                 else:
-                    self.cache[k] = v
-            except ValueError:
-                pass  # value too large
-            except (KeyError, RuntimeError):
-                # the key was refused for some reason
-                config.getLogger().debug(
-                    'Had a cache KeyError while trying to store a value to key %r' % (k))
+                    leader = False
+            if not leader:
+                # A recursive call from the computing thread can't wait for
+                # itself
+                if call.thread != threading.get_ident():
+                    call.done.wait()
+                    if not call.failed:
+                        stats.record(className, 'shared')
+                        return call.value
+                start = time.perf_counter()
+                v = func(self, *args, **kwargs)
+                stats.record(className, 'misses', time.perf_counter() - start)
+                _methodcacheStore(self, lock, k, v)
+                return v
+            try:
+                # Another thread may have stored the value between our lookup
+                # and becoming the leader
+                try:
+                    v = _methodcacheGet(self, lock, k)
+                    stats.record(className, 'hits')
+                except KeyError:
+                    start = time.perf_counter()
+                    v = func(self, *args, **kwargs)
+                    stats.record(className, 'misses', time.perf_counter() - start)
+                    _methodcacheStore(self, lock, k, v)
+                call.value = v
+                call.failed = False
+            finally:
+                with _inFlightLock:
+                    del _inFlightCalls[flightKey]
+                call.done.set()
             return v
+
+        def cacheKey(self, *args, **kwargs) -> str:
+            return _methodcacheKey(self, key, args, keyKwargs(kwargs))
+
+        wrapper.cacheKey = cacheKey  # type: ignore[attr-defined]
         return wrapper
     return decorator
 
 
+def getCacheMany(
+        cache: cachetools.Cache, cacheLock: Optional[threading.Lock],
+        keys: Iterable[str]) -> Dict[str, Any]:
+    """
+    Get several values from a cache.  If the cache has a getMany method, such
+    as the memcached and redis caches, the values are fetched with a single
+    request.  Otherwise, each key is checked in turn.
+
+    :param cache: the cache.
+    :param cacheLock: an optional lock to hold while accessing the cache.
+    :param keys: the keys to look up.
+    :returns: a dictionary of the keys that were found and their values.
+    """
+    keys = list(keys)
+    with cacheLock or contextlib.nullcontext():
+        if hasattr(cache, 'getMany'):
+            return cache.getMany(keys)
+        results = {}
+        for k in keys:
+            try:
+                results[k] = cache[k]
+            except KeyError:
+                pass
+            except (ValueError, pickle.UnpicklingError):
+                pass
+        return results
+
+
 class LruCacheMetaclass(type):
     namedCaches: Dict[str, Any] = {}
     classCaches: Dict[type, Any] = {}
+    classStats: Dict[type, CacheStats] = {}
 
     def __new__(metacls, name, bases, namespace, **kwargs):
         # Get metaclass parameters by finding and removing them from the class
@@ -168,11 +338,12 @@ class LruCacheMetaclass(type):
             (cache, cacheLock) = LruCacheMetaclass.namedCaches[cacheName]
 
         # Don't store the cache in cls.__dict__, because we don't want it to be
-        # part of the attribute lookup hierarchy
-        # TODO: consider putting it in cls.__dict__, to inspect statistics
+        # part of the attribute lookup hierarchy.  Statistics are reported by
+        # cachesInfo.
         # cls is hashable though, so use it to lookup the cache, in case an
         # identically-named class gets redefined
         LruCacheMetaclass.classCaches[cls] = (cache, cacheLock)
+        LruCacheMetaclass.classStats[cls] = getCacheStats(cacheName)
 
         return cls
 
@@ -190,6 +361,7 @@ class LruCacheMetaclass(type):
                 instance._unstyledInstance = subresult = cls(*args, **subkwargs)
             return instance
         cache, cacheLock = LruCacheMetaclass.classCaches[cls]
+        stats = LruCacheMetaclass.classStats[cls]
 
         if hasattr(cls, 'getLRUHash'):
             key = cls.getLRUHash(*args, **kwargs)
@@ -201,6 +373,7 @@ class LruCacheMetaclass(type):
                 result = cache[key]
                 if (not isinstance(result, tuple) or len(result) != 2 or
                         result[0] != _cacheLockKeyToken):
+                    stats.record(cls.__name__, 'hits')
                     return result
                 cacheLockForKey = result[1]
             except KeyError:
@@ -215,9 +388,11 @@ class LruCacheMetaclass(type):
                     result = cache[key]
                     if (not isinstance(result, tuple) or len(result) != 2 or
                             result[0] != _cacheLockKeyToken):
+                        stats.record(cls.__name__, 'shared')
                         return result
                 except KeyError:
                     pass
+            start = time.perf_counter()
             try:
                 # This conditionally copies a non-styled class and adds a style.
                 if (kwargs.get('style') and hasattr(cls, '_setStyle') and
@@ -236,6 +411,7 @@ class LruCacheMetaclass(type):
                     result._derivedSource = True
                     # Has to be after setting the _unstyledInstance
                     result._setStyle(kwargs['style'])
+                    stats.record(cls.__name__, 'misses', time.perf_counter() - start)
                     with cacheLock:
                         cache[key] = result
                         return result
@@ -255,6 +431,7 @@ class LruCacheMetaclass(type):
                 subkwargs['style'] = getattr(cls, '_unstyledStyle', None)
                 instance._unstyledInstance = subresult = cls(*args, **subkwargs)
                 instance._derivedSource = True
+            stats.record(cls.__name__, 'misses', time.perf_counter() - start)
             with cacheLock:
                 cache[key] = instance
         return instance
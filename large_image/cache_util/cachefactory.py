@@ -24,6 +24,7 @@ import cachetools
 from .. import config
 from ..exceptions import TileCacheError
 from .memcache import MemCache
+from .pythoncache import PythonCache, estimateSize
 from .rediscache import RedisCache
 
 # DO NOT MANUALLY ADD ANYTHING TO `_availableCaches`
@@ -119,18 +120,29 @@ def getFirstAvailableCache() -> Tuple[cachetools.Cache, Optional[threading.Lock]
 class CacheFactory:
     logged = False
 
+    def getCachePortion(self, cacheName: Optional[str] = None) -> int:
+        """
+        Get the inverse fraction of the total memory that an in-process cache
+        may use.
+
+        :param cacheName: the name of the cache used for configuration
+            lookups.
+        :returns: the portion; at least 3.
+        """
+        defaultPortion = 32
+        try:
+            portion = int(config.getConfig('cache_python_memory_portion', 0))
+            if cacheName:
+                portion = max(portion, int(config.getConfig(
+                    f'cache_{cacheName}_memory_portion', portion)))
+            portion = max(portion or defaultPortion, 3)
+        except ValueError:
+            portion = defaultPortion
+        return portion
+
     def getCacheSize(self, numItems: Optional[int], cacheName: Optional[str] = None) -> int:
         if numItems is None:
-            defaultPortion = 32
-            try:
-                portion = int(config.getConfig('cache_python_memory_portion', 0))
-                if cacheName:
-                    portion = max(portion, int(config.getConfig(
-                        f'cache_{cacheName}_memory_portion', portion)))
-                portion = max(portion or defaultPortion, 3)
-            except ValueError:
-                portion = defaultPortion
-            numItems = pickAvailableCache(256**2 * 4 * 2, portion)
+            numItems = pickAvailableCache(256**2 * 4 * 2, self.getCachePortion(cacheName))
         if cacheName:
             try:
                 maxItems = int(config.getConfig(f'cache_{cacheName}_maximum', 0))
@@ -140,6 +152,29 @@ class CacheFactory:
                 pass
         return numItems
 
+    def getCacheMemorySize(self, cacheName: Optional[str] = None) -> int:
+        """
+        Determine the number of bytes an in-process cache may use.  This is
+        ``cache_<cacheName>_memory_bytes`` or ``cache_python_memory_bytes`` if
+        either is set to a positive value.  Otherwise, it is based on the
+        portion of the total memory specified by
+        ``cache_<cacheName>_memory_portion`` or
+        ``cache_python_memory_portion``.
+
+        :param cacheName: the name of the cache used for configuration
+            lookups.
+        :returns: the maximum size of the cache in bytes.
+        """
+        for key in ([f'cache_{cacheName}_memory_bytes'] if cacheName else []) + [
+                'cache_python_memory_bytes']:
+            try:
+                memoryBytes = int(config.getConfig(key, 0) or 0)
+            except ValueError:
+                continue
+            if memoryBytes > 0:
+                return memoryBytes
+        return int(config.total_memory() // self.getCachePortion(cacheName))
+
     def getCache(
             self, numItems: Optional[int] = None,
             cacheName: Optional[str] = None,
@@ -160,7 +195,19 @@ class CacheFactory:
 
         if cache is None:  # fallback backend or inProcess
             cacheBackend = 'python'
-            cache = cachetools.LRUCache(self.getCacheSize(numItems, cacheName=cacheName))
+            if numItems is None:
+                # Limit the cache by the memory used by the cached values
+                maxItems = 0
+                if cacheName:
+                    try:
+                        maxItems = int(config.getConfig(f'cache_{cacheName}_maximum', 0))
+                    except ValueError:
+                        pass
+                cache = PythonCache(
+                    self.getCacheMemorySize(cacheName), getsizeof=estimateSize,
+                    maxitems=max(maxItems, 3) if maxItems > 0 else None)
+            else:
+                cache = PythonCache(self.getCacheSize(numItems, cacheName=cacheName))
             cacheLock = threading.Lock()
 
         if not inProcess and not CacheFactory.logged:
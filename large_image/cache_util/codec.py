@@ -0,0 +1,224 @@
+#############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#############################################################################
+
+import pickle
+import struct
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .. import config
+from ..exceptions import TileCacheCodecError
+
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Increment this if the encoded format changes.  Values written with a
+# different version are treated as cache misses.
+CodecVersion = 1
+
+# magic, version, value kind, compression
+_Magic = b'LIC'
+_HeaderFormat = '<3sBBB'
+_HeaderSize = struct.calcsize(_HeaderFormat)
+_KindPickle = 0
+_KindNumpy = 1
+_CompressNone = 0
+_CompressLz4 = 1
+_CompressZstd = 2
+# dtype length, number of dimensions
+_NumpyFormat = '<BB'
+_NumpySize = struct.calcsize(_NumpyFormat)
+# pickle length, number of out-of-band buffers
+_PickleFormat = '<QI'
+_PickleSize = struct.calcsize(_PickleFormat)
+# Raw buffers start at a multiple of this many bytes within the value
+_Alignment = 16
+
+
+def _padding(pos: int) -> bytes:
+    return b'\0' * (-pos % _Alignment)
+
+
+def _lz4Compress(data: bytes) -> bytes:
+    return lz4.block.compress(data, store_size=True)
+
+
+def _lz4Decompress(data: memoryview) -> bytearray:
+    return lz4.block.decompress(data, return_bytearray=True)
+
+
+def _zstdCompress(data: bytes) -> bytes:
+    return zstandard.ZstdCompressor(level=1).compress(data)
+
+
+def _zstdDecompress(data: memoryview) -> bytearray:
+    return bytearray(zstandard.ZstdDecompressor().decompress(data))
+
+
+_Compressors: Dict[str, Tuple[int, Optional[Callable[[bytes], bytes]]]] = {
+    'lz4': (_CompressLz4, _lz4Compress if lz4 is not None else None),
+    'zstd': (_CompressZstd, _zstdCompress if zstandard is not None else None),
+}
+_Decompressors: Dict[int, Optional[Callable[[memoryview], bytearray]]] = {
+    _CompressLz4: _lz4Decompress if lz4 is not None else None,
+    _CompressZstd: _zstdDecompress if zstandard is not None else None,
+}
+
+
+def _encodeNumpy(value: np.ndarray) -> Optional[List[Any]]:
+    dtype = value.dtype.str.encode()
+    if value.dtype.hasobject or value.dtype.fields is not None or len(dtype) > 255 or (
+            value.ndim > 255):
+        return None
+    if not value.flags.c_contiguous:
+        value = value.copy(order='C')
+    return [
+        struct.pack(_NumpyFormat, len(dtype), value.ndim),
+        dtype,
+        struct.pack('<%dQ' % value.ndim, *value.shape),
+        _padding(_NumpySize + len(dtype) + 8 * value.ndim),
+        memoryview(value.reshape(-1).view(np.uint8)),
+    ]
+
+
+def _encodePickle(value: Any) -> List[Any]:
+    buffers: List[pickle.PickleBuffer] = []
+    try:
+        data = pickle.dumps(value, protocol=5, buffer_callback=buffers.append)
+        raw = [buffer.raw() for buffer in buffers]
+    except BufferError:
+        # Non-contiguous buffers can't be sent out-of-band
+        data = pickle.dumps(value, protocol=5)
+        raw = []
+    parts = [
+        struct.pack(_PickleFormat, len(data), len(raw)),
+        struct.pack('<%dQ' % len(raw), *(buffer.nbytes for buffer in raw)),
+        data,
+    ]
+    pos = _PickleSize + 8 * len(raw) + len(data)
+    for buffer in raw:
+        parts.append(_padding(pos))
+        pos += len(parts[-1])
+        parts.append(buffer)
+        pos += buffer.nbytes
+    return parts
+
+
+def encodeValue(value: Any) -> bytes:
+    """
+    Encode a value so that it can be stored in a cache.  Numpy arrays are
+    stored as their dtype, shape, and raw data.  Other values are pickled,
+    with numpy arrays and other large buffers within them stored outside of
+    the pickle so that they are not copied into it.  If the
+    ``cache_codec_compression`` config value is ``lz4`` or ``zstd`` and that
+    library is installed, encoded values that are at least
+    ``cache_codec_compression_threshold`` bytes are compressed when that
+    makes them smaller.
+
+    :param value: the value to encode.
+    :returns: the encoded value.
+    """
+    parts = None
+    if type(value) is np.ndarray:
+        parts = _encodeNumpy(value)
+    kind = _KindNumpy
+    if parts is None:
+        kind = _KindPickle
+        parts = _encodePickle(value)
+    compression = _CompressNone
+    method = config.getConfig('cache_codec_compression', None)
+    if isinstance(method, str) and method.lower() in _Compressors:
+        compressionMethod, compressor = _Compressors[method.lower()]
+        try:
+            threshold = int(config.getConfig('cache_codec_compression_threshold', 0) or 0)
+        except ValueError:
+            threshold = 0
+        if compressor is not None and sum(len(part) for part in parts) >= threshold:
+            data = b''.join(parts)
+            compressed = compressor(data)
+            if len(compressed) < len(data):
+                compression = compressionMethod
+                parts = [compressed]
+    header = struct.pack(_HeaderFormat, _Magic, CodecVersion, kind, compression)
+    return b''.join([header, *parts])
+
+
+def decodeValue(data: Any) -> Any:
+    """
+    Decode a value encoded with encodeValue.  Numpy arrays in the result are
+    writable and do not share memory with the encoded data.
+
+    :param data: the encoded value as bytes or another buffer.
+    :returns: the decoded value.
+    :raises TileCacheCodecError: if the data was not encoded by this version
+        of the codec or cannot be decompressed.
+    """
+    view = memoryview(data).cast('B')
+    if len(view) < _HeaderSize:
+        msg = 'Cache value is too short to decode'
+        raise TileCacheCodecError(msg)
+    magic, version, kind, compression = struct.unpack_from(_HeaderFormat, view, 0)
+    if magic != _Magic or version != CodecVersion:
+        msg = 'Cache value was written by a different version of large_image'
+        raise TileCacheCodecError(msg)
+    if compression == _CompressNone:
+        # Copy once so that arrays referencing the data are writable
+        body = memoryview(bytearray(view[_HeaderSize:]))
+    else:
+        decompressor = _Decompressors.get(compression)
+        if decompressor is None:
+            msg = 'Cache value was compressed with an unavailable library'
+            raise TileCacheCodecError(msg)
+        try:
+            body = memoryview(decompressor(view[_HeaderSize:]))
+        except Exception as exc:
+            msg = f'Cache value could not be decompressed: {exc}'
+            raise TileCacheCodecError(msg) from exc
+    try:
+        if kind == _KindNumpy:
+            dtypeLen, ndim = struct.unpack_from(_NumpyFormat, body, 0)
+            pos = _NumpySize
+            dtype = np.dtype(bytes(body[pos:pos + dtypeLen]).decode())
+            pos += dtypeLen
+            shape = struct.unpack_from('<%dQ' % ndim, body, pos)
+            pos += 8 * ndim
+            pos += -pos % _Alignment
+            return np.frombuffer(body[pos:], dtype=dtype).reshape(shape)
+        if kind == _KindPickle:
+            dataLen, numBuffers = struct.unpack_from(_PickleFormat, body, 0)
+            pos = _PickleSize
+            bufferLens = struct.unpack_from('<%dQ' % numBuffers, body, pos)
+            pos += 8 * numBuffers
+            pickled = body[pos:pos + dataLen]
+            pos += dataLen
+            buffers = []
+            for bufferLen in bufferLens:
+                pos += -pos % _Alignment
+                buffers.append(body[pos:pos + bufferLen])
+                pos += bufferLen
+            return pickle.loads(pickled, buffers=buffers)
+    except (struct.error, TypeError, ValueError, pickle.UnpicklingError) as exc:
+        msg = f'Cache value could not be decoded: {exc}'
+        raise TileCacheCodecError(msg) from exc
+    msg = 'Cache value has an unknown kind'
+    raise TileCacheCodecError(msg)
@@ -17,10 +17,12 @@
 import copy
 import threading
 import time
-from typing import Any, Callable, List, Optional, Tuple, TypeVar, Union
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar, Union
 
 from .. import config
+from ..exceptions import TileCacheCodecError
 from .base import BaseCache
+from .codec import CodecVersion, decodeValue, encodeValue
 
 _VT = TypeVar('_VT')
 
@@ -76,6 +78,10 @@ class MemCache(BaseCache):
         # cache never contains key
         return False
 
+    def _hashKey(self, key: str) -> str:
+        # Keep values from versions with a different encoding separate
+        return super()._hashKey(f'codec{CodecVersion} {key}')
+
     def __delitem__(self, key: str) -> None:
         hashedKey = self._hashKey(key)
         del self._client[hashedKey]
@@ -83,8 +89,8 @@ class MemCache(BaseCache):
     def __getitem__(self, key: str) -> Any:
         hashedKey = self._hashKey(key)
         try:
-            return self._client[hashedKey]
-        except KeyError:
+            return decodeValue(self._client[hashedKey])
+        except (KeyError, TileCacheCodecError):
             return self.__missing__(key)
         except self.pylibmc.ServerDown:
             self.logError(self.pylibmc.ServerDown, config.getLogger('logprint').info,
@@ -99,7 +105,7 @@ class MemCache(BaseCache):
     def __setitem__(self, key: str, value: Any) -> None:
         hashedKey = self._hashKey(key)
         try:
-            self._client[hashedKey] = value
+            self._client[hashedKey] = encodeValue(value)
         except (TypeError, KeyError) as exc:
             valueSize = value.shape if hasattr(value, 'shape') else (
                 value.size if hasattr(value, 'size') else (
@@ -124,6 +130,50 @@ class MemCache(BaseCache):
                 self.logError(self.pylibmc.Error, config.getLogger('logprint').exception,
                               'pylibmc exception')
 
+    def getMany(self, keys: Iterable[str]) -> Dict[str, Any]:
+        hashedKeys = {self._hashKey(key): key for key in keys}
+        if not hashedKeys:
+            return {}
+        try:
+            found = self._client.get_multi(list(hashedKeys))
+        except self.pylibmc.ServerDown:
+            self.logError(self.pylibmc.ServerDown, config.getLogger('logprint').info,
+                          'Memcached ServerDown')
+            self._reconnect()
+            return {}
+        except self.pylibmc.Error:
+            self.logError(self.pylibmc.Error, config.getLogger('logprint').exception,
+                          'pylibmc exception')
+            return {}
+        results = {}
+        for hashedKey, value in found.items():
+            try:
+                results[hashedKeys[hashedKey]] = decodeValue(value)
+            except TileCacheCodecError:
+                pass
+        return results
+
+    def setMany(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        try:
+            self._client.set_multi({
+                self._hashKey(key): encodeValue(value) for key, value in items.items()})
+        except (TypeError, KeyError) as exc:
+            self.logError(
+                exc.__class__, config.getLogger('logprint').error,
+                '%s: Failed to save %d values' % (exc.__class__.__name__, len(items)))
+        except self.pylibmc.ServerDown:
+            self.logError(self.pylibmc.ServerDown, config.getLogger('logprint').info,
+                          'Memcached ServerDown')
+            self._reconnect()
+        except self.pylibmc.TooBig:
+            pass
+        except self.pylibmc.Error as exc:
+            if 'SUCCESS' not in repr(exc.args):
+                self.logError(self.pylibmc.Error, config.getLogger('logprint').exception,
+                              'pylibmc exception')
+
     @property
     def curritems(self) -> int:
         return self._getStat('curr_items')
@@ -0,0 +1,153 @@
+#############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#############################################################################
+
+import sys
+from typing import Any, Callable, Dict, Iterable, Optional, TypeVar
+
+import cachetools
+
+_VT = TypeVar('_VT')
+
+# Bytes per band for PIL image modes that aren't one byte per band.
+_PILModeBandBytes = {
+    '1': 1 / 8,
+    'I': 4,
+    'F': 4,
+    'I;16': 2,
+    'I;16B': 2,
+    'I;16L': 2,
+    'I;16N': 2,
+}
+
+
+def estimateSize(value: Any) -> int:
+    """
+    Estimate the memory used by a value that could be stored in a cache.  This
+    handles numpy arrays, bytes-like objects, PIL images, and tuples and lists
+    of those.  Other values are measured with sys.getsizeof, which does not
+    include referenced objects.
+
+    :param value: the value to measure.
+    :returns: the estimated size in bytes.
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return len(value)
+    if isinstance(value, memoryview) or (
+            hasattr(value, 'nbytes') and hasattr(value, 'dtype')):
+        # memoryview or numpy array
+        return int(value.nbytes)
+    if hasattr(value, 'getbands') and hasattr(value, 'size') and hasattr(value, 'mode'):
+        # PIL image
+        bandBytes = _PILModeBandBytes.get(value.mode, 1)
+        return int(value.size[0] * value.size[1] * len(value.getbands()) * bandBytes)
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimateSize(entry) for entry in value)
+    return sys.getsizeof(value)
+
+
+class PythonCache(cachetools.LRUCache):
+    """
+    An in-process least-recently-used cache.  If it is constructed with a
+    getsizeof function, the maximum size is in the units returned by that
+    function (for instance, bytes when using estimateSize), and the number of
+    items can optionally also be limited.  This tracks the number of hits,
+    misses, and evictions.
+    """
+
+    def __init__(
+            self, maxsize: float,
+            getsizeof: Optional[Callable[[_VT], float]] = None,
+            maxitems: Optional[int] = None) -> None:
+        """
+        Create the cache.
+
+        :param maxsize: the maximum size of the cache.  If getsizeof is None,
+            this is a number of items.
+        :param getsizeof: an optional function to determine the size of each
+            value in the cache.
+        :param maxitems: if specified, the cache never holds more than this
+            many items.
+        """
+        super().__init__(maxsize, getsizeof=getsizeof)
+        self.sizeInBytes = getsizeof is estimateSize
+        self.maxitems = maxitems if maxitems and maxitems > 0 else None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __repr__(self) -> str:
+        return '%s(maxsize=%r, currsize=%r, items=%r)' % (
+            self.__class__.__name__, self.maxsize, self.currsize, len(self))
+
+    def __getitem__(self, key: Any) -> Any:
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            self.misses += 1
+            raise
+        self.hits += 1
+        return value
+
+    def __setitem__(self, key: Any, value: Any) -> None:
+        if self.maxitems is not None and key not in self:
+            while len(self) >= self.maxitems:
+                self.popitem()
+        super().__setitem__(key, value)
+
+    def getMany(self, keys: Iterable[Any]) -> Dict[Any, Any]:
+        """
+        Get several values from the cache.
+
+        :param keys: the keys to look up.
+        :returns: a dictionary of the keys that were found and their values.
+        """
+        results = {}
+        for key in keys:
+            try:
+                results[key] = self[key]
+            except KeyError:
+                pass
+        return results
+
+    def setMany(self, items: Dict[Any, Any]) -> None:
+        """
+        Store several values in the cache.  Values that are too large for the
+        cache are skipped.
+
+        :param items: a dictionary of keys and values to store.
+        """
+        for key, value in items.items():
+            try:
+                self[key] = value
+            except ValueError:
+                pass
+
+    def popitem(self) -> Any:
+        # The base class fetches the value it is removing; that isn't a hit.
+        hits = self.hits
+        item = super().popitem()
+        self.hits = hits
+        self.evictions += 1
+        return item
+
+    def clear(self) -> None:
+        evictions = self.evictions
+        super().clear()
+        self.evictions = evictions
+
+    @property
+    def curritems(self) -> int:
+        return len(self)
@@ -14,15 +14,16 @@
 #  limitations under the License.
 #############################################################################
 
-import pickle
 import threading
 import time
-from typing import Any, Callable, Iterable, List, Optional, Sized, Tuple, TypeVar, Union, cast
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sized, Tuple, TypeVar, Union, cast
 
 from typing_extensions import Buffer
 
 from .. import config
+from ..exceptions import TileCacheCodecError
 from .base import BaseCache
+from .codec import CodecVersion, decodeValue, encodeValue
 
 _VT = TypeVar('_VT')
 
@@ -67,6 +68,10 @@ class RedisCache(BaseCache):
         _key = self._cache_key_prefix + self._hashKey(key)
         return bool(self._client.exists(_key))
 
+    def _hashKey(self, key: str) -> str:
+        # Keep values from versions with a different encoding separate
+        return super()._hashKey(f'codec{CodecVersion} {key}')
+
     def __delitem__(self, key: str) -> None:
         if not self.__contains__(key):
             raise KeyError
@@ -79,8 +84,8 @@ class RedisCache(BaseCache):
             # must determine if tke key exists , otherwise cache_test can not be passed.
             if not self.__contains__(key):
                 raise KeyError
-            return pickle.loads(cast(Buffer, self._client.get(_key)))
-        except KeyError:
+            return decodeValue(cast(Buffer, self._client.get(_key)))
+        except (KeyError, TileCacheCodecError):
             return self.__missing__(key)
         except self.redis.ConnectionError:
             self.logError(self.redis.ConnectionError, config.getLogger('logprint').info,
@@ -95,7 +100,7 @@ class RedisCache(BaseCache):
     def __setitem__(self, key: str, value: Any) -> None:
         _key = self._cache_key_prefix + self._hashKey(key)
         try:
-            self._client.set(_key, pickle.dumps(value))
+            self._client.set(_key, encodeValue(value))
         except (TypeError, KeyError) as exc:
             valueSize = value.shape if hasattr(value, 'shape') else (
                 value.size if hasattr(value, 'size') else (
@@ -112,6 +117,48 @@ class RedisCache(BaseCache):
                           'redis ConnectionError')
             self._reconnect()
 
+    def getMany(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        if not keys:
+            return {}
+        try:
+            values = cast(List[Any], self._client.mget([
+                self._cache_key_prefix + self._hashKey(key) for key in keys]))
+        except self.redis.ConnectionError:
+            self.logError(self.redis.ConnectionError, config.getLogger('logprint').info,
+                          'redis ConnectionError')
+            self._reconnect()
+            return {}
+        except self.redis.RedisError:
+            self.logError(self.redis.RedisError, config.getLogger('logprint').exception,
+                          'redis RedisError')
+            return {}
+        results = {}
+        for key, value in zip(keys, values):
+            if value is not None:
+                try:
+                    results[key] = decodeValue(value)
+                except TileCacheCodecError:
+                    pass
+        return results
+
+    def setMany(self, items: Dict[str, Any]) -> None:
+        if not items:
+            return
+        try:
+            pipeline = self._client.pipeline(transaction=False)
+            for key, value in items.items():
+                pipeline.set(self._cache_key_prefix + self._hashKey(key), encodeValue(value))
+            pipeline.execute()
+        except (TypeError, KeyError) as exc:
+            self.logError(
+                exc.__class__, config.getLogger('logprint').error,
+                '%s: Failed to save %d values' % (exc.__class__.__name__, len(items)))
+        except self.redis.ConnectionError:
+            self.logError(self.redis.ConnectionError, config.getLogger('logprint').info,
+                          'redis ConnectionError')
+            self._reconnect()
+
     @property
     def curritems(self) -> int:
         return cast(int, self._client.dbsize())
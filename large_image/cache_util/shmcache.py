@@ -0,0 +1,457 @@
+#############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#############################################################################
+
+import contextlib
+import fcntl
+import hashlib
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+import numpy as np
+
+from .. import config
+from ..exceptions import TileCacheError
+from .base import BaseCache
+
+_VT = TypeVar('_VT')
+
+# The arena file is laid out as a header, a table of shard heads, the index
+# slots of each shard, and then the data ring of each shard.
+_Magic = b'LISHMC01'
+# magic, shards, slots per shard, data bytes per shard
+_HeaderFormat = '<8sIIQ'
+_HeaderSize = 4096
+# absolute write position of the shard's data ring
+_ShardHeadFormat = '<Q'
+_ShardHeadSize = 64
+# key hash, absolute data position, record length, used flag
+_SlotFormat = '<16sQII'
+_SlotSize = struct.calcsize(_SlotFormat)
+# key hash, payload length
+_RecordFormat = '<16sQ'
+_RecordSize = struct.calcsize(_RecordFormat)
+# value kind, then for numpy arrays the dtype length and number of dimensions
+_ValueFormat = '<BBB'
+_ValueSize = struct.calcsize(_ValueFormat)
+_ValuePickle = 0
+_ValueNumpy = 1
+
+# How many slots to check when looking for or placing a key
+_Probes = 8
+
+
+class SharedMemoryCache(BaseCache):
+    """
+    Use a memory-mapped file that is shared by all processes on one host as
+    the backing cache.
+
+    The file is divided into shards, each with its own lock, index, and ring
+    buffer of values.  When a shard's ring is full, the oldest values are
+    overwritten.  Numpy arrays are stored as their raw buffer with their dtype
+    and shape; other values are pickled.
+    """
+
+    # The number of independently locked portions of the cache.
+    shards = 16
+    # The expected average size of a value; used to size the index.
+    expectedItemSize = 16 * 1024
+    # Locks on a file are held per process, so threads within a process also
+    # need to exclude each other for each path.
+    _pathLocks: Dict[str, List[threading.Lock]] = {}
+    _pathLocksLock = threading.Lock()
+
+    def __init__(
+            self, path: Optional[str] = None, size: Optional[int] = None,
+            getsizeof: Optional[Callable[[_VT], float]] = None) -> None:
+        """
+        Open or create a shared memory cache.
+
+        :param path: the path of the file to memory map.  Processes that use
+            the same path share the cache.  If None, a file in /dev/shm or
+            the temporary directory is used.
+        :param size: the approximate total size in bytes of the shared file.
+            This is only used if the file is created or has an incompatible
+            layout.
+        """
+        super().__init__(0, getsizeof=getsizeof)
+        if path is None:
+            basedir = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+            path = os.path.join(basedir, 'large_image_cache')
+        if not size:
+            size = int(config.total_memory() // 32)
+        self._path = path
+        with SharedMemoryCache._pathLocksLock:
+            self._threadLocks = SharedMemoryCache._pathLocks.setdefault(
+                os.path.realpath(path), [threading.Lock() for _ in range(self.shards + 1)])
+        while True:
+            self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            newFd = None
+            try:
+                with self._fileLock(None):
+                    # Another process may have replaced the file while we
+                    # waited for the lock
+                    replaced = self._isReplaced()
+                    if not replaced:
+                        newFd = self._openArena(size)
+            except Exception:
+                os.close(self._fd)
+                raise
+            if replaced:
+                os.close(self._fd)
+                continue
+            if newFd is not None:
+                os.close(self._fd)
+                self._fd = newFd
+            break
+
+    def _isReplaced(self) -> bool:
+        """
+        Check if the cache's path no longer refers to the open file.
+
+        :returns: True if the file was replaced or removed.
+        """
+        try:
+            pathStat = os.stat(self._path)
+        except FileNotFoundError:
+            return True
+        fileStat = os.fstat(self._fd)
+        return (pathStat.st_dev, pathStat.st_ino) != (fileStat.st_dev, fileStat.st_ino)
+
+    def _openArena(self, size: int) -> Optional[int]:
+        """
+        Map the shared file, initializing it if it isn't a valid cache.  This
+        must be called with the header lock held.
+
+        A file that isn't empty but doesn't have the expected layout could be
+        mapped by other processes, such as ones using a different number of
+        shards, so it is never changed.  Instead, a new file is created and
+        renamed in its place; processes that have the old file mapped keep
+        using it until they reopen the cache.
+
+        :param size: the desired total size in bytes.
+        :returns: None if the open file was used.  Otherwise, the descriptor
+            of the new file that replaced it.
+        """
+        header = os.pread(self._fd, struct.calcsize(_HeaderFormat), 0)
+        if len(header) == struct.calcsize(_HeaderFormat) and header[:8] == _Magic:
+            _, shards, slots, dataSize = struct.unpack(_HeaderFormat, header)
+            total = self._arenaSize(shards, slots, dataSize)
+            if shards == self.shards and os.fstat(self._fd).st_size >= total:
+                self._setLayout(slots, dataSize)
+                self._mmap = mmap.mmap(self._fd, total)
+                return None
+        if not os.fstat(self._fd).st_size:
+            self._initArena(self._fd, size)
+            return None
+        config.getLogger().info(
+            'Replacing the shared memory cache at %s, which has a different layout', self._path)
+        fd, tempPath = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self._path)),
+            prefix=os.path.basename(self._path) + '.')
+        try:
+            self._initArena(fd, size)
+            os.rename(tempPath, self._path)
+        except Exception:
+            os.close(fd)
+            os.unlink(tempPath)
+            raise
+        return fd
+
+    def _initArena(self, fd: int, size: int) -> None:
+        """
+        Size, map, and write the header of an empty cache file.
+
+        :param fd: the descriptor of the empty file.
+        :param size: the desired total size in bytes.
+        """
+        shardSize = max(size // self.shards, 1024 * 1024)
+        slots = max(64, shardSize // self.expectedItemSize)
+        dataSize = shardSize - _ShardHeadSize - slots * _SlotSize
+        total = self._arenaSize(self.shards, slots, dataSize)
+        if hasattr(os, 'posix_fallocate'):
+            # Reserve the space so that a full tmpfs fails now rather than
+            # later with a bus error when a page is first written.
+            os.posix_fallocate(fd, 0, total)
+        else:
+            os.ftruncate(fd, total)
+        self._setLayout(slots, dataSize)
+        self._mmap = mmap.mmap(fd, total)
+        struct.pack_into(_HeaderFormat, self._mmap, 0, _Magic, self.shards, slots, dataSize)
+
+    def _arenaSize(self, shards: int, slots: int, dataSize: int) -> int:
+        return _HeaderSize + shards * (_ShardHeadSize + slots * _SlotSize + dataSize)
+
+    def _setLayout(self, slots: int, dataSize: int) -> None:
+        self._slots = slots
+        self._dataSize = dataSize
+        self._slotsOffset = _HeaderSize + self.shards * _ShardHeadSize
+        self._dataOffset = self._slotsOffset + self.shards * slots * _SlotSize
+
+    @contextlib.contextmanager
+    def _fileLock(self, shard: Optional[int]) -> Iterator[None]:
+        """
+        Hold a lock on a shard across threads and processes.  Shard None is
+        the header lock.
+
+        :param shard: the shard to lock.
+        """
+        start = 0 if shard is None else 1 + shard
+        with self._threadLocks[start]:
+            fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, start)
+            try:
+                yield
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, start)
+
+    def _locate(self, key: Any) -> Tuple[bytes, int, int]:
+        """
+        Get the hash of a key and where it belongs.  Keys are converted to
+        strings, so every method treats a key the same way.
+
+        :param key: the cache key.
+        :returns: the 16-byte key hash, the shard, and the first slot.
+        """
+        digest = hashlib.sha256(str(key).encode()).digest()[:16]
+        value = int.from_bytes(digest[:8], 'little')
+        return digest, value % self.shards, (value // self.shards) % self._slots
+
+    def _slotOffset(self, shard: int, slot: int) -> int:
+        return self._slotsOffset + (shard * self._slots + slot) * _SlotSize
+
+    def _head(self, shard: int) -> int:
+        return struct.unpack_from(
+            _ShardHeadFormat, self._mmap, _HeaderSize + shard * _ShardHeadSize)[0]
+
+    def _find(self, digest: bytes, shard: int, slot: int) -> Optional[Tuple[int, int, int]]:
+        """
+        Find a valid record for a key.  This must be called with the shard
+        lock held.
+
+        :returns: None if the key is not present or has been overwritten.
+            Otherwise, the slot offset, the offset of the record in the file,
+            and the length of the payload.
+        """
+        head = self._head(shard)
+        for probe in range(_Probes):
+            slotOffset = self._slotOffset(shard, (slot + probe) % self._slots)
+            slotHash, pos, length, used = struct.unpack_from(_SlotFormat, self._mmap, slotOffset)
+            if not used or slotHash != digest:
+                continue
+            if pos + _RecordSize + length > head or head - pos > self._dataSize:
+                return None
+            recordOffset = self._dataOffset + shard * self._dataSize + pos % self._dataSize
+            recordHash, recordLength = struct.unpack_from(_RecordFormat, self._mmap, recordOffset)
+            if recordHash != digest or recordLength != length:
+                return None
+            return slotOffset, recordOffset + _RecordSize, length
+        return None
+
+    def _encode(self, value: Any) -> Tuple[bytes, Any]:
+        """
+        Encode a value as a header and a buffer.
+
+        :param value: the value to encode.
+        :returns: a header and an object supporting the buffer protocol.
+        """
+        if (isinstance(value, np.ndarray) and not value.dtype.hasobject and
+                value.dtype.names is None):
+            value = np.ascontiguousarray(value)
+            dtype = value.dtype.str.encode()
+            header = struct.pack(_ValueFormat, _ValueNumpy, len(dtype), value.ndim) + dtype
+            header += struct.pack('<%dQ' % value.ndim, *value.shape)
+            return header, memoryview(value).cast('B')
+        return struct.pack(_ValueFormat, _ValuePickle, 0, 0), pickle.dumps(
+            value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def _decode(self, offset: int, length: int) -> Any:
+        """
+        Decode a value from the shared file.  This must be called with the
+        shard lock held.
+
+        :param offset: the start of the encoded value in the file.
+        :param length: the length of the encoded value.
+        :returns: the value.
+        """
+        kind, dtypeLen, ndim = struct.unpack_from(_ValueFormat, self._mmap, offset)
+        if kind == _ValuePickle:
+            return pickle.loads(self._mmap[offset + _ValueSize:offset + length])
+        pos = offset + _ValueSize
+        dtype = np.dtype(self._mmap[pos:pos + dtypeLen].decode())
+        pos += dtypeLen
+        shape = struct.unpack_from('<%dQ' % ndim, self._mmap, pos)
+        pos += 8 * ndim
+        count = int(np.prod(shape)) if ndim else 1
+        return np.frombuffer(
+            self._mmap, dtype=dtype, count=count, offset=pos).reshape(shape).copy()
+
+    def __repr__(self) -> str:
+        return "SharedMemoryCache doesn't list its keys"
+
+    def __iter__(self):
+        # return invalid iter
+        return None
+
+    def __len__(self) -> int:
+        return self.curritems
+
+    def __contains__(self, key: object) -> bool:
+        digest, shard, slot = self._locate(key)
+        with self._fileLock(shard):
+            return self._find(digest, shard, slot) is not None
+
+    def __delitem__(self, key: str) -> None:
+        digest, shard, slot = self._locate(key)
+        with self._fileLock(shard):
+            found = self._find(digest, shard, slot)
+            if found is None:
+                raise KeyError(key)
+            struct.pack_into(_SlotFormat, self._mmap, found[0], b'', 0, 0, 0)
+
+    def __getitem__(self, key: str) -> Any:
+        digest, shard, slot = self._locate(key)
+        try:
+            with self._fileLock(shard):
+                found = self._find(digest, shard, slot)
+                if found is not None:
+                    return self._decode(found[1], found[2])
+        except (ValueError, TypeError, pickle.UnpicklingError, struct.error):
+            self.logError(ValueError, config.getLogger('logprint').info,
+                          'Failed to decode a value in the shared memory cache')
+        return self.__missing__(key)
+
+    def getMany(self, keys: Iterable[str]) -> Dict[str, Any]:
+        byShard: Dict[int, List[Tuple[str, bytes, int]]] = {}
+        for key in keys:
+            digest, shard, slot = self._locate(key)
+            byShard.setdefault(shard, []).append((key, digest, slot))
+        results = {}
+        for shard, entries in byShard.items():
+            with self._fileLock(shard):
+                for key, digest, slot in entries:
+                    found = self._find(digest, shard, slot)
+                    if found is None:
+                        continue
+                    try:
+                        results[key] = self._decode(found[1], found[2])
+                    except (ValueError, TypeError, pickle.UnpicklingError, struct.error):
+                        pass
+        return results
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        digest, shard, slot = self._locate(key)
+        try:
+            header, buffer = self._encode(value)
+        except (TypeError, pickle.PicklingError, AttributeError) as exc:
+            self.logError(
+                exc.__class__, config.getLogger('logprint').error,
+                '%s: Failed to save value with key %s' % (exc.__class__.__name__, key))
+            return
+        length = len(header) + memoryview(buffer).nbytes
+        total = _RecordSize + length
+        if total > self._dataSize:
+            # Too large to cache
+            return
+        with self._fileLock(shard):
+            head = self._head(shard)
+            pos = head
+            if pos % self._dataSize + total > self._dataSize:
+                # Don't wrap a record around the end of the ring
+                pos += self._dataSize - pos % self._dataSize
+            recordOffset = self._dataOffset + shard * self._dataSize + pos % self._dataSize
+            struct.pack_into(_RecordFormat, self._mmap, recordOffset, digest, length)
+            start = recordOffset + _RecordSize
+            self._mmap[start:start + len(header)] = header
+            self._mmap[start + len(header):start + length] = buffer
+            struct.pack_into(
+                _ShardHeadFormat, self._mmap, _HeaderSize + shard * _ShardHeadSize, pos + total)
+            # Use a slot with the same key, an unused or stale slot, or the
+            # slot with the oldest data, in that order.
+            sameKey = free = oldest = None
+            oldestPos = 0
+            for probe in range(_Probes):
+                slotOffset = self._slotOffset(shard, (slot + probe) % self._slots)
+                slotHash, slotPos, _, used = struct.unpack_from(
+                    _SlotFormat, self._mmap, slotOffset)
+                if used and slotHash == digest:
+                    sameKey = slotOffset
+                    break
+                if not used or pos + total - slotPos > self._dataSize:
+                    free = slotOffset if free is None else free
+                elif oldest is None or slotPos < oldestPos:
+                    oldest, oldestPos = slotOffset, slotPos
+            target = next(offset for offset in (sameKey, free, oldest) if offset is not None)
+            struct.pack_into(_SlotFormat, self._mmap, target, digest, pos, length, 1)
+
+    @property
+    def curritems(self) -> int:
+        count = 0
+        for shard in range(self.shards):
+            with self._fileLock(shard):
+                head = self._head(shard)
+                for slot in range(self._slots):
+                    _, pos, _, used = struct.unpack_from(
+                        _SlotFormat, self._mmap, self._slotOffset(shard, slot))
+                    if used and head - pos <= self._dataSize:
+                        count += 1
+        return count
+
+    @property
+    def currsize(self) -> int:
+        return sum(min(self._head(shard), self._dataSize) for shard in range(self.shards))
+
+    @property
+    def maxsize(self) -> int:
+        return self._dataSize * self.shards
+
+    def clear(self) -> None:
+        for shard in range(self.shards):
+            with self._fileLock(shard):
+                struct.pack_into(
+                    _ShardHeadFormat, self._mmap, _HeaderSize + shard * _ShardHeadSize, 0)
+                start = self._slotOffset(shard, 0)
+                self._mmap[start:start + self._slots * _SlotSize] = bytes(
+                    self._slots * _SlotSize)
+
+    @staticmethod
+    def getCache() -> Tuple[Optional['SharedMemoryCache'], threading.Lock]:
+        # The shared memory cache is only used when it is explicitly selected
+        backend = config.getConfig('cache_backend', None)
+        if isinstance(backend, str) and backend.lower() == 'tiered':
+            backend = config.getConfig('cache_tiered_backend', None)
+        if not isinstance(backend, str) or backend.lower() != 'sharedmemory':
+            msg = 'The shared memory cache must be explicitly selected.'
+            raise TileCacheError(msg)
+        cacheLock = threading.Lock()
+        path = config.getConfig('cache_sharedmemory_path') or None
+        try:
+            size = int(config.getConfig('cache_sharedmemory_bytes', 0) or 0)
+        except ValueError:
+            size = 0
+        if size <= 0:
+            from .cachefactory import CacheFactory
+
+            size = CacheFactory().getCacheMemorySize('sharedmemory')
+        try:
+            cache = SharedMemoryCache(path, size)
+        except Exception:
+            config.getLogger().info('Cannot use shared memory for caching.')
+            cache = None
+        return cache, cacheLock
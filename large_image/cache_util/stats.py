@@ -0,0 +1,124 @@
+#############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#############################################################################
+
+import threading
+from typing import Any, Dict, Hashable, List
+
+_StatKeys = ('hits', 'misses', 'shared', 'computeTime')
+
+
+class CacheStats:
+    """
+    Count requests to a cache, grouped by the class of the object that made
+    them.  Each request is a hit, a miss (where the value was computed and
+    the time spent computing it is recorded), or shared (where the value was
+    computed by another thread making the same request).
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._classes: Dict[str, Dict[str, float]] = {}
+
+    def record(self, className: str, kind: str, computeTime: float = 0) -> None:
+        """
+        Record a request.
+
+        :param className: the name of the class that made the request.
+        :param kind: one of 'hits', 'misses', or 'shared'.
+        :param computeTime: for misses, the time in seconds spent computing
+            the value.
+        """
+        with self._lock:
+            counts = self._classes.get(className)
+            if counts is None:
+                counts = self._classes[className] = dict.fromkeys(_StatKeys, 0)
+            counts[kind] += 1
+            counts['computeTime'] += computeTime
+
+    def reset(self) -> None:
+        """Discard all recorded requests."""
+        with self._lock:
+            self._classes = {}
+
+    @staticmethod
+    def _summarize(counts: Dict[str, float]) -> Dict[str, Any]:
+        result: Dict[str, Any] = dict(counts)
+        result['averageComputeTime'] = (
+            counts['computeTime'] / counts['misses'] if counts['misses'] else None)
+        requests = counts['hits'] + counts['misses'] + counts['shared']
+        result['hitRatio'] = counts['hits'] / requests if requests else None
+        return result
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Report the recorded requests.
+
+        :returns: a dictionary with 'hits', 'misses', 'shared',
+            'computeTime', 'averageComputeTime' (the mean time spent on a
+            miss, or None), 'hitRatio' (or None if there were no requests),
+            and 'classes', which has the same values for each class that made
+            requests.
+        """
+        with self._lock:
+            classes = {name: dict(counts) for name, counts in self._classes.items()}
+        total = dict.fromkeys(_StatKeys, 0)
+        for counts in classes.values():
+            for key in _StatKeys:
+                total[key] += counts[key]
+        result = self._summarize(total)
+        result['classes'] = {
+            name: self._summarize(counts) for name, counts in sorted(classes.items())}
+        return result
+
+
+_cacheStats: Dict[str, CacheStats] = {}
+_cacheStatsLock = threading.Lock()
+
+
+def getCacheStats(cacheName: Hashable) -> CacheStats:
+    """
+    Get the request statistics for a cache, creating them if needed.
+
+    :param cacheName: the name of the cache, such as 'tileCache' or
+        'tilesource'.  Caches that are named by a class use the name of that
+        class.
+    :returns: the CacheStats object for the cache.
+    """
+    if not isinstance(cacheName, str):
+        cacheName = getattr(cacheName, '__name__', str(cacheName))
+    stats = _cacheStats.get(cacheName)
+    if stats is None:
+        with _cacheStatsLock:
+            stats = _cacheStats.setdefault(cacheName, CacheStats())
+    return stats
+
+
+def cachesStatsNames() -> List[str]:
+    """
+    List the caches that have request statistics.
+
+    :returns: a sorted list of cache names.
+    """
+    with _cacheStatsLock:
+        return sorted(_cacheStats)
+
+
+def cachesStatsReset() -> None:
+    """Discard the request statistics for all caches."""
+    with _cacheStatsLock:
+        stats = list(_cacheStats.values())
+    for entry in stats:
+        entry.reset()
@@ -0,0 +1,250 @@
+#############################################################################
+#  Copyright Kitware Inc.
+#
+#  Licensed under the Apache License, Version 2.0 ( the "License" );
+#  you may not use this file except in compliance with the License.
+#  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+#  Unless required by applicable law or agreed to in writing, software
+#  distributed under the License is distributed on an "AS IS" BASIS,
+#  WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  See the License for the specific language governing permissions and
+#  limitations under the License.
+#############################################################################
+
+import contextlib
+import threading
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import cachetools
+
+from .. import config
+from ..exceptions import TileCacheError
+from .base import BaseCache
+from .pythoncache import PythonCache, estimateSize
+
+_Missing = object()
+
+
+class TieredCache(BaseCache):
+    """
+    Keep a small in-process cache in front of another cache, such as memcached
+    or redis.  Values are written to both tiers.  Values that are only found
+    in the second tier are copied to the first tier if promote is True.
+
+    Each tier is locked separately, so hits in the first tier never wait for
+    requests to the second tier.
+    """
+
+    def __init__(
+            self, l2: cachetools.Cache, l2Lock: Optional[threading.Lock] = None,
+            maxsize: int = 256 * 1024 ** 2, maxitems: Optional[int] = None,
+            promote: bool = True) -> None:
+        """
+        Create the cache.
+
+        :param l2: the second tier cache.
+        :param l2Lock: an optional lock to hold while accessing the second
+            tier.
+        :param maxsize: the maximum size of the first tier in bytes.
+        :param maxitems: if specified, the first tier never holds more than
+            this many items.
+        :param promote: if True, values found in the second tier are added to
+            the first tier.
+        """
+        super().__init__(0)
+        self.l1 = PythonCache(maxsize, getsizeof=estimateSize, maxitems=maxitems)
+        self.l1Lock = threading.Lock()
+        self.l2 = l2
+        self.l2Lock = l2Lock
+        self.promote = promote
+        self.l2Hits = 0
+        self.l2Misses = 0
+        self.promotions = 0
+
+    def __repr__(self) -> str:
+        return '%s(l1=%r, l2=%s)' % (
+            self.__class__.__name__, self.l1, self.l2.__class__.__name__)
+
+    def __iter__(self):
+        return iter(self.l2)
+
+    def __len__(self) -> int:
+        return len(self.l2)
+
+    def __contains__(self, key: object) -> bool:
+        with self.l1Lock:
+            if key in self.l1:
+                return True
+        with self.l2Lock or contextlib.nullcontext():
+            return key in self.l2
+
+    def __delitem__(self, key: str) -> None:
+        found = False
+        with self.l1Lock:
+            if key in self.l1:
+                del self.l1[key]
+                found = True
+        with self.l2Lock or contextlib.nullcontext():
+            try:
+                del self.l2[key]
+                found = True
+            except KeyError:
+                pass
+        if not found:
+            raise KeyError(key)
+
+    def _promote(self, items: Dict[str, Any]) -> None:
+        if not self.promote or not items:
+            return
+        with self.l1Lock:
+            for key, value in items.items():
+                try:
+                    self.l1[key] = value
+                    self.promotions += 1
+                except ValueError:
+                    pass
+
+    def __getitem__(self, key: str) -> Any:
+        with self.l1Lock:
+            try:
+                return self.l1[key]
+            except KeyError:
+                pass
+        with self.l2Lock or contextlib.nullcontext():
+            try:
+                value = self.l2[key]
+                self.l2Hits += 1
+            except KeyError:
+                self.l2Misses += 1
+                value = _Missing
+        if value is _Missing:
+            return self.__missing__(key)
+        self._promote({key: value})
+        return value
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        with self.l1Lock:
+            try:
+                self.l1[key] = value
+            except ValueError:
+                # Too large for the first tier, but the second tier may take it
+                pass
+        with self.l2Lock or contextlib.nullcontext():
+            self.l2[key] = value
+
+    def getMany(self, keys: Iterable[str]) -> Dict[str, Any]:
+        keys = list(keys)
+        with self.l1Lock:
+            results = self.l1.getMany(keys)
+        remaining = [key for key in keys if key not in results]
+        if remaining:
+            with self.l2Lock or contextlib.nullcontext():
+                if hasattr(self.l2, 'getMany'):
+                    found = self.l2.getMany(remaining)
+                else:
+                    found = {}
+                    for key in remaining:
+                        try:
+                            found[key] = self.l2[key]
+                        except KeyError:
+                            pass
+                self.l2Hits += len(found)
+                self.l2Misses += len(remaining) - len(found)
+            self._promote(found)
+            results.update(found)
+        return results
+
+    def setMany(self, items: Dict[str, Any]) -> None:
+        with self.l1Lock:
+            self.l1.setMany(items)
+        with self.l2Lock or contextlib.nullcontext():
+            if hasattr(self.l2, 'setMany'):
+                self.l2.setMany(items)
+            else:
+                for key, value in items.items():
+                    self.l2[key] = value
+
+    def tierStats(self) -> Dict[str, Dict[str, Any]]:
+        """
+        Report statistics on each tier.
+
+        :returns: a dictionary with 'l1' and 'l2' keys.  The first tier
+            reports 'hits', 'misses', 'evictions', 'promotions', 'items',
+            'used', and 'maxsize' (the last two in bytes).  The second tier
+            reports 'hits' and 'misses', which only include requests that
+            weren't satisfied by the first tier.
+        """
+        with self.l1Lock:
+            l1 = {
+                'hits': self.l1.hits,
+                'misses': self.l1.misses,
+                'evictions': self.l1.evictions,
+                'promotions': self.promotions,
+                'items': self.l1.curritems,
+                'used': self.l1.currsize,
+                'maxsize': self.l1.maxsize,
+            }
+        return {'l1': l1, 'l2': {'hits': self.l2Hits, 'misses': self.l2Misses}}
+
+    @property
+    def curritems(self) -> int:
+        return self.l2.curritems if hasattr(self.l2, 'curritems') else len(self.l2)
+
+    @property
+    def currsize(self) -> int:
+        return self.l2.currsize
+
+    @property
+    def maxsize(self) -> int:
+        return self.l2.maxsize
+
+    def clear(self) -> None:
+        with self.l1Lock:
+            self.l1.clear()
+        with self.l2Lock or contextlib.nullcontext():
+            self.l2.clear()
+
+    @staticmethod
+    def getCache() -> Tuple[Optional['TieredCache'], Optional[threading.Lock]]:
+        # The tiered cache is only used when it is explicitly selected
+        backend = config.getConfig('cache_backend', None)
+        if not isinstance(backend, str) or backend.lower() != 'tiered':
+            msg = 'The tiered cache must be explicitly selected.'
+            raise TileCacheError(msg)
+        from .cachefactory import CacheFactory, _availableCaches, loadCaches
+
+        loadCaches()
+        l2Backend = config.getConfig('cache_tiered_backend', None)
+        if isinstance(l2Backend, str) and l2Backend.lower() not in {'', 'tiered', 'python'}:
+            candidates = [l2Backend.lower()]
+        else:
+            candidates = [name for name in _availableCaches if name != 'tiered']
+        l2, l2Lock = None, None
+        for name in candidates:
+            if name not in _availableCaches:
+                continue
+            try:
+                l2, l2Lock = _availableCaches[name].getCache()  # type: ignore
+            except TileCacheError:
+                continue
+            if l2 is not None:
+                break
+        if l2 is None:
+            config.getLogger().info('Cannot use a tiered cache without a second tier.')
+            return None, threading.Lock()
+        maxItems = 0
+        try:
+            maxItems = int(config.getConfig('cache_tiered_maximum', 0) or 0)
+        except ValueError:
+            pass
+        cache = TieredCache(
+            l2, l2Lock,
+            maxsize=CacheFactory().getCacheMemorySize('tiered'),
+            maxitems=maxItems if maxItems > 0 else None,
+            promote=str(config.getConfig('cache_tiered_promote', True)).lower() not in {
+                'false', '0'})
+        # Each tier is locked by the cache itself
+        return cache, None
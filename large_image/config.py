@@ -26,15 +26,42 @@ ConfigValues = {
     'logprint': fallbackLogger,
 
     # For tiles
-    'cache_backend': None,  # 'python', 'redis' or 'memcached'
+    # 'python', 'redis', 'memcached', 'sharedmemory', or 'tiered'
+    'cache_backend': None,
     # 'python' cache can use 1/(val) of the available memory
     'cache_python_memory_portion': 32,
+    # If >0, the 'python' cache is limited to this many bytes rather than a
+    # portion of the available memory.  This can also be specified per cache,
+    # such as 'cache_tileCache_memory_bytes'.
+    'cache_python_memory_bytes': 0,
     # cache_memcached_url may be a list
     'cache_memcached_url': '127.0.0.1',
     'cache_memcached_username': None,
     'cache_memcached_password': None,
     'cache_redis_url': '127.0.0.1:6379',
     'cache_redis_password': None,
+    # Values stored in memcached and redis can be compressed with 'lz4' or
+    # 'zstd' if that library is installed.  Only values that are at least the
+    # threshold in bytes are compressed.
+    'cache_codec_compression': None,
+    'cache_codec_compression_threshold': 65536,
+    # The 'sharedmemory' cache is a file that is memory mapped by all
+    # processes on a host.  If the path is None, it is created in /dev/shm or
+    # the temporary directory.  If the size is 0, it is based on the 'python'
+    # memory portion.
+    'cache_sharedmemory_path': None,
+    'cache_sharedmemory_bytes': 0,
+    # The 'tiered' cache keeps a small python cache in front of another
+    # backend.  If the backend is None, the first available one is used.  The
+    # python tier uses 1/(val) of the available memory unless
+    # 'cache_tiered_memory_bytes' is set.  If 'cache_tiered_maximum' is >0, it
+    # also limits the number of tiles in the python tier.
+    'cache_tiered_backend': None,
+    'cache_tiered_memory_portion': 128,
+    'cache_tiered_memory_bytes': 0,
+    'cache_tiered_maximum': 0,
+    # If True, tiles found in the backend are added to the python tier
+    'cache_tiered_promote': True,
 
     # If set to False, the default will be to not cache tile sources.  This has
     # substantial performance penalties if sources are used multiple times, so
@@ -34,6 +34,10 @@ class TileCacheConfigurationError(TileCacheError):
     pass
 
 
+class TileCacheCodecError(TileCacheError, ValueError):
+    pass
+
+
 TileGeneralException = TileGeneralError
 TileSourceException = TileSourceError
 TileSourceAssetstoreException = TileSourceAssetstoreError
@@ -1,16 +1,20 @@
+import collections
 import functools
 import io
 import json
 import math
 import os
 import pathlib
+import pickle
+import stat
 import tempfile
 import threading
 import time
 import types
 import uuid
-from typing import Any, Dict, Iterator, List, Optional, Tuple, Union, cast
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple, Union, cast
 
+import cachetools
 import numpy as np
 import numpy.typing as npt
 import PIL
@@ -21,11 +25,17 @@ import PIL.ImageDraw
 
 from .. import config, exceptions
 from ..cache_util import getTileCache, methodcache, strhash
+from ..cache_util.cache import _methodcacheStore
 from ..constants import (TILE_FORMAT_IMAGE, TILE_FORMAT_NUMPY, TILE_FORMAT_PIL,
                          SourcePriority, TileInputUnits, TileOutputMimeTypes,
                          TileOutputPILFormat)
 from . import utilities
+from .foreground import foregroundMask
+from .histogram import HistogramAccumulator
 from .jupyter import IPyLeafletMixin
+from .resample import resizeArray
+from .stylelut import StyleBandLUT
+from .tilearray import TileArray
 from .tiledict import LazyTileDict
 from .tileiterator import TileIterator
 from .utilities import (ImageBytes, JSONDict, _imageToNumpy,  # noqa: F401
@@ -33,6 +43,88 @@ from .utilities import (ImageBytes, JSONDict, _imageToNumpy,  # noqa: F401
                         getPaletteColors, histogramThreshold, nearPowerOfTwo)
 
 
+def _reduceTileShard(
+        source: 'TileSource', makeAccumulator: Callable[[], Any],
+        positions: range, kwargs: Dict[str, Any]) -> Any:
+    """
+    Add a contiguous range of tiles from a tile iterator to a new accumulator.
+    This is a module-level function so that it can be run in another process.
+
+    :param source: the tile source.
+    :param makeAccumulator: a function that returns a new accumulator.
+    :param positions: the range of indices in the iterator's plan to add.
+    :param kwargs: parameters to pass to the tileIterator.
+    :returns: the accumulator.
+    """
+    accumulator = makeAccumulator()
+    tileIter = source.tileIterator(**kwargs)
+    for index in positions:
+        accumulator.add(tileIter.tile(index)['tile'])
+    return accumulator
+
+
+# The state of a mapTiles worker process.  See _mapTilesInitWorker.
+_mapTilesWorker: Dict[str, Any] = {}
+
+
+def _mapTilesInitWorker(
+        pickledSource: bytes, func: Callable[[LazyTileDict], Any],
+        kwargs: Dict[str, Any]) -> None:
+    """
+    Reopen the source of mapTiles once in a worker process.
+
+    :param pickledSource: the pickled tile source.
+    :param func: the function to apply to each tile.
+    :param kwargs: parameters to pass to the tileIterator.
+    """
+    source = pickle.loads(pickledSource)
+    _mapTilesWorker['iterator'] = source.tileIterator(**kwargs)
+    _mapTilesWorker['func'] = func
+
+
+def _mapTilesRange(
+        start: int, stop: int, tileIter: Optional[TileIterator] = None,
+        func: Optional[Callable[[LazyTileDict], Any]] = None) -> List[Any]:
+    """
+    Apply a function to a range of tiles of a tile iterator's plan.
+
+    :param start: the index of the first tile.
+    :param stop: the index after the last tile.
+    :param tileIter: the tile iterator.  If None, use the iterator of the
+        worker process.
+    :param func: the function to apply to each tile.  If None, use the
+        function of the worker process.
+    :returns: a list of the function's results.
+    """
+    if tileIter is None or func is None:
+        tileIter, func = _mapTilesWorker['iterator'], _mapTilesWorker['func']
+    return [func(tileIter.tile(index)) for index in range(start, stop)]
+
+
+def _mapTilesToSinkTile(
+        tile: LazyTileDict,
+        func: Callable[[LazyTileDict], Any]) -> Tuple[np.ndarray, int, int]:
+    """
+    Apply a filter to a tile for mapTilesToSink and trim its halo.
+
+    :param tile: a tile dictionary with a tile_overlap entry.
+    :param func: a function that takes the tile dictionary and returns an
+        image with the same width and height as the tile.
+    :returns: the filtered image without the halo and its position in the
+        iterated region.
+    """
+    result, _ = _imageToNumpy(func(tile))
+    if result.shape[:2] != (tile['height'], tile['width']):
+        msg = (f'The filter must return an image the same size as the tile '
+               f'({tile["width"]} x {tile["height"]}), not '
+               f'{result.shape[1]} x {result.shape[0]}.')
+        raise ValueError(msg)
+    overlap = tile['tile_overlap']
+    result = result[overlap['top']:result.shape[0] - overlap['bottom'],
+                    overlap['left']:result.shape[1] - overlap['right']]
+    return result, tile['x'] + overlap['left'], tile['y'] + overlap['top']
+
+
 class TileSource(IPyLeafletMixin):
     # Name of the tile source
     name = None
@@ -69,6 +161,15 @@ class TileSource(IPyLeafletMixin):
     # _maxSkippedLevels, such large gaps are composited in stages.
     _maxSkippedLevels = 3
 
+    # If reading tiles holds the GIL for most of the time it takes, set this to
+    # False.  Threads don't speed up reading such a source, so tiles are read
+    # one at a time unless processes are explicitly requested.
+    _readsReleaseGIL = True
+
+    # The total size in bytes of the lookup tables for styles of a source.
+    # See _styleBandLUT.
+    _styleLUTCacheBytes = 64 * 1024 ** 2
+
     _initValues: Tuple[Tuple[Any, ...], Dict[str, Any]]
     _iccprofilesObjects: List[Any]
 
@@ -238,6 +339,14 @@ class TileSource(IPyLeafletMixin):
                 except (TypeError, json.decoder.JSONDecodeError):
                     msg = 'Style is not a valid json object.'
                     raise exceptions.TileSourceError(msg)
+        # Lookup tables for uint16 bands are up to a few megabytes each, so
+        # they are limited by size.  There is always room for a table for
+        # each entry of the style, so a tile never has to rebuild them.
+        entries = len(style.get('bands') or [None]) if isinstance(style, dict) else 1
+        self._styleLUTs: cachetools.LRUCache = cachetools.LRUCache(
+            maxsize=max(self._styleLUTCacheBytes, entries * StyleBandLUT.maxBytes),
+            getsizeof=lambda lut: lut.nbytes)
+        self._styleLUTLock = threading.Lock()
 
     def getBounds(self, *args, **kwargs) -> Dict[str, Any]:
         return {
@@ -529,13 +638,16 @@ class TileSource(IPyLeafletMixin):
         # compatibility could be an issue.
         return False
 
-    @methodcache()
-    def histogram(  # noqa
+    @methodcache(ignore=('max_workers', 'executor'))
+    def histogram(
             self, dtype: npt.DTypeLike = None, onlyMinMax: bool = False,
             bins: int = 256, density: bool = False, format: Any = None,
-            *args, **kwargs) -> Dict[str, Union[np.ndarray, List[Dict[str, Any]]]]:
+            *args, max_workers: Optional[int] = -4, executor: Optional[str] = None,
+            **kwargs) -> Dict[str, Union[np.ndarray, List[Dict[str, Any]]]]:
         """
-        Get a histogram for a region.
+        Get a histogram for a region.  The region is read once, in parallel
+        if max_workers allows; see HistogramAccumulator for how values are
+        binned.
 
         :param dtype: if specified, the tiles must be this numpy.dtype.
         :param onlyMinMax: if True, only return the minimum and maximum value
@@ -547,6 +659,10 @@ class TileSource(IPyLeafletMixin):
             samples.
         :param format: ignored.  Used to override the format for the
             tileIterator.
+        :param max_workers: maximum workers for reading tiles in parallel.
+            See _reduceTiles.  This isn't part of the cache key.
+        :param executor: None, 'thread', or 'process'.  See _reduceTiles.
+            This isn't part of the cache key.
         :param range: if None, use the computed min and (max + 1).  Otherwise,
             this is the range passed to numpy.histogram.  Note this is only
             accessible via kwargs as it otherwise overloads the range function.
@@ -565,104 +681,289 @@ class TileSource(IPyLeafletMixin):
             number of bins used.  bin_edges is an array one longer than the
             hist array that contains the boundaries between bins.
         """
-        lastlog = time.time()
         kwargs = kwargs.copy()
         histRange = kwargs.pop('range', None)
-        results: Optional[Dict[str, Any]] = None
-        for itile in self.tileIterator(format=TILE_FORMAT_NUMPY, **kwargs):
-            if time.time() - lastlog > 10:
-                self.logger.info(
-                    'Calculating histogram min/max %d/%d',
-                    itile['tile_position']['position'], itile['iterator_range']['position'])
-                lastlog = time.time()
-            tile = itile['tile']
-            if dtype is not None and tile.dtype != dtype:
-                if tile.dtype == np.uint8 and dtype == np.uint16:
-                    tile = np.array(tile, dtype=np.uint16) * 257
+        accumulator = self._reduceTiles(
+            functools.partial(HistogramAccumulator, bins, histRange, onlyMinMax, dtype),
+            max_workers, executor, format=TILE_FORMAT_NUMPY, **kwargs)
+        integerRound = None
+        if histRange == 'round' and accumulator.count:
+            integerRound = bool(np.issubdtype(dtype or self.dtype, np.integer))
+        return accumulator.result(density, integerRound)
+
+    def _reduceTiles(
+            self, makeAccumulator: Callable[[], Any],
+            max_workers: Optional[int] = -4, executor: Optional[str] = None,
+            **kwargs) -> Any:
+        """
+        Read the tiles of a tile iterator and combine them with accumulators.
+        An accumulator has an add(tile) method that takes a numpy array and a
+        merge(accumulator) method that adds the results of another accumulator
+        to it.
+
+        When reading in parallel, the tiles are split into contiguous shards,
+        each shard is added to its own accumulator, and the accumulators are
+        merged in order.  By default, threads are used unless the source's
+        _readsReleaseGIL attribute is False, in which case threads wouldn't
+        help and the tiles are read in the current thread.  Processes are only
+        used when asked for and the source can be pickled; each shard is then
+        read in a separate process by reopening the source there.
+
+        :param makeAccumulator: a function that returns a new accumulator.
+            This must be picklable if processes could be used, such as a
+            class or a functools.partial of a class.
+        :param max_workers: maximum workers for parallelism.  If negative, use
+            the minimum of the absolute value of this number or
+            multiprocessing.cpu_count().  If 1, tiles are read one at a time in
+            the current thread.
+        :param executor: None to pick threads or the current thread based on
+            the source, 'thread' to always use threads, or 'process' to use
+            processes.
+        :param kwargs: parameters to pass to the tileIterator.
+        :returns: an accumulator with all of the tiles added.
+        """
+        import concurrent.futures
+
+        if executor not in {None, 'process', 'thread'}:
+            msg = "executor must be None, 'process', or 'thread'."
+            raise ValueError(msg)
+        lastlog = time.time()
+        if max_workers is not None and max_workers < 0:
+            max_workers = min(-max_workers, config.cpu_count(False))
+        if executor is None and not self._readsReleaseGIL:
+            max_workers = 1
+        tileIter = self.tileIterator(**kwargs)
+        count = len(tileIter.plan) if tileIter.plan is not None else 0
+        if max_workers == 1 or count < 2 or kwargs.get('tile_position') is not None:
+            accumulator = makeAccumulator()
+            for tile in tileIter:
+                if time.time() - lastlog > 10:
+                    self.logger.info(
+                        'Reading tiles %d/%d',
+                        tile['tile_position']['position'], tile['iterator_range']['position'])
+                    lastlog = time.time()
+                accumulator.add(tile['tile'])
+            return accumulator
+        tileIter.close()
+        workers = max_workers or config.cpu_count(False)
+        numShards = min(count, workers * 4)
+        shards = [range(count * idx // numShards, count * (idx + 1) // numShards)
+                  for idx in range(numShards)]
+        useProcesses = (executor == 'process' and hasattr(self, '_initValues') and
+                        not hasattr(self, '_unpickleable'))
+        poolClass = (concurrent.futures.ProcessPoolExecutor if useProcesses else
+                     concurrent.futures.ThreadPoolExecutor)
+        accumulator = makeAccumulator()
+        with poolClass(max_workers=max_workers) as pool:
+            futures = [pool.submit(
+                _reduceTileShard, self, makeAccumulator, shard, kwargs) for shard in shards]
+            for idx, future in enumerate(futures):
+                accumulator.merge(future.result())
+                if time.time() - lastlog > 10:
+                    self.logger.info(
+                        'Reading tiles %d/%d', shards[idx].stop, count)
+                    lastlog = time.time()
+        return accumulator
+
+    def mapTiles(
+            self, func: Callable[[LazyTileDict], Any],
+            reduce: Optional[Callable[[Any, Any], Any]] = None,
+            initial: Any = None, workers: int = -4, executor: str = 'process',
+            progress: Optional[Callable[[int, int], None]] = None,
+            **kwargs) -> Any:
+        """
+        Apply a function to every tile of a tile iterator in parallel.
+
+        The tiles of the iterator's plan are split into small batches that
+        are processed by a pool of workers.  With processes, the source is
+        pickled and reopened once in each worker; if the source can't be
+        pickled, threads are used instead.  Results are returned to this
+        process as batches finish, but are always used in the order of the
+        iteration, and only a few batches per worker are pending at any time,
+        so memory use stays bounded however many tiles there are.
+
+        :param func: a function that takes a tile dictionary as yielded by
+            tileIterator and returns a value.  With processes, this must be
+            picklable, such as a module-level function, and so must its
+            results.
+        :param reduce: if None, return a list of the results of func for each
+            tile.  Otherwise, a function that takes the accumulated value and
+            the result of one tile and returns the new accumulated value.
+            This is called in this process in the order of the iteration.
+        :param initial: the starting value for reduce.  If None, the first
+            result is the starting value.
+        :param workers: the number of workers.  If negative, use the minimum
+            of the absolute value of this and the number of cpus.  If 1, the
+            tiles are processed one at a time in the current thread.
+        :param executor: 'process' or 'thread'.
+        :param progress: if not None, a function that is called with the
+            number of tiles that have been processed and the total number of
+            tiles after each batch.
+        :param kwargs: parameters to pass to tileIterator.  The format
+            defaults to TILE_FORMAT_NUMPY.  Parameters such as shard and
+            foreground can be used to select the tiles.
+        :returns: the list of results or the reduced value.
+        """
+        if executor not in {'process', 'thread'}:
+            msg = "executor must be 'process' or 'thread'."
+            raise ValueError(msg)
+        if workers < 0:
+            workers = min(-workers, config.cpu_count(False))
+        workers = max(1, workers)
+        kwargs.setdefault('format', TILE_FORMAT_NUMPY)
+        tileIter = self.tileIterator(**kwargs)
+        count = len(tileIter.plan) if tileIter.plan is not None else 0
+        results: List[Any] = []
+        accumulated = initial
+        done = 0
+        lastlog = time.time()
+
+        def addResults(batch: List[Any]) -> None:
+            nonlocal accumulated, done, lastlog
+
+            for result in batch:
+                if reduce is None:
+                    results.append(result)
+                elif initial is None and not done:
+                    accumulated = result
                 else:
-                    continue
-            tilemin = np.array([
-                np.amin(tile[:, :, idx]) for idx in range(tile.shape[2])], tile.dtype)
-            tilemax = np.array([
-                np.amax(tile[:, :, idx]) for idx in range(tile.shape[2])], tile.dtype)
-            tilesum: np.ndarray = np.array([
-                np.sum(tile[:, :, idx]) for idx in range(tile.shape[2])], float)
-            tilesum2: np.ndarray = np.array([
-                np.sum(np.array(tile[:, :, idx], float) ** 2)
-                for idx in range(tile.shape[2])], float)
-            tilecount = tile.shape[0] * tile.shape[1]
-            if results is None:
-                results = {
-                    'min': tilemin,
-                    'max': tilemax,
-                    'sum': tilesum,
-                    'sum2': tilesum2,
-                    'count': tilecount,
-                }
-            else:
-                results['min'] = np.minimum(results['min'], tilemin[:len(results['min'])])
-                results['max'] = np.maximum(results['max'], tilemax[:len(results['min'])])
-                results['sum'] += tilesum[:len(results['min'])]
-                results['sum2'] += tilesum2[:len(results['min'])]
-                results['count'] += tilecount
-        if results is None:
-            return {}
-        results['mean'] = results['sum'] / results['count']
-        results['stdev'] = np.maximum(
-            results['sum2'] / results['count'] - results['mean'] ** 2,
-            [0] * results['sum2'].shape[0]) ** 0.5
-        results.pop('sum', None)
-        results.pop('sum2', None)
-        results.pop('count', None)
-        if results is None or onlyMinMax:
-            return results
-        results['histogram'] = [{
-            'min': results['min'][idx],
-            'max': results['max'][idx],
-            'mean': results['mean'][idx],
-            'stdev': results['stdev'][idx],
-            'range': ((results['min'][idx], results['max'][idx] + 1)
-                      if histRange is None or histRange == 'round' else histRange),
-            'hist': None,
-            'bin_edges': None,
-            'bins': bins,
-            'density': bool(density),
-        } for idx in range(len(results['min']))]
-        if histRange == 'round' and np.issubdtype(dtype or self.dtype, np.integer):
-            for record in results['histogram']:
-                if (record['range'][1] - record['range'][0]) < bins * 10:
-                    step = int(math.ceil((record['range'][1] - record['range'][0]) / bins))
-                    rbins = int(math.ceil((record['range'][1] - record['range'][0]) / step))
-                    record['range'] = (record['range'][0], record['range'][0] + step * rbins)
-                    record['bins'] = rbins
-        for tile in self.tileIterator(format=TILE_FORMAT_NUMPY, **kwargs):
+                    accumulated = reduce(accumulated, result)
+                done += 1
+            if progress is not None:
+                progress(done, count)
             if time.time() - lastlog > 10:
-                self.logger.info(
-                    'Calculating histogram %d/%d',
-                    tile['tile_position']['position'], tile['iterator_range']['position'])
+                self.logger.info('Processed tiles %d/%d', done, count)
                 lastlog = time.time()
-            tile = tile['tile']
-            if dtype is not None and tile.dtype != dtype:
-                if tile.dtype == np.uint8 and dtype == np.uint16:
-                    tile = np.array(tile, dtype=np.uint16) * 257
-                else:
-                    continue
-            for idx in range(len(results['min'])):
-                entry = results['histogram'][idx]
-                hist, bin_edges = np.histogram(
-                    tile[:, :, idx], entry['bins'], entry['range'], density=False)
-                if entry['hist'] is None:
-                    entry['hist'] = hist
-                    entry['bin_edges'] = bin_edges
-                else:
-                    entry['hist'] += hist
-        for idx in range(len(results['min'])):
-            entry = results['histogram'][idx]
-            if entry['hist'] is not None:
-                entry['samples'] = np.sum(entry['hist'])
-                if density:
-                    entry['hist'] = entry['hist'].astype(float) / entry['samples']
-        return results
+
+        batchSize = max(1, min(32, count // (workers * 4)))
+        batches = [(start, min(count, start + batchSize))
+                   for start in range(0, count, batchSize)]
+        if workers == 1 or len(batches) < 2:
+            for start, stop in batches:
+                addResults(_mapTilesRange(start, stop, tileIter, func))
+        else:
+            self._mapTilesPool(
+                tileIter, func, batches, workers, executor == 'process', addResults, kwargs)
+        return results if reduce is None else accumulated
+
+    def _mapTilesPool(
+            self, tileIter: TileIterator, func: Callable[[LazyTileDict], Any],
+            batches: List[Tuple[int, int]], workers: int, useProcesses: bool,
+            addResults: Callable[[List[Any]], None], kwargs: Dict[str, Any]) -> None:
+        """
+        Process batches of tiles for mapTiles with a pool of workers.
+
+        :param tileIter: the tile iterator.
+        :param func: the function to apply to each tile.
+        :param batches: a list of (start, stop) ranges of the plan.
+        :param workers: the number of workers.
+        :param useProcesses: if True and the source can be pickled, use
+            processes.  Otherwise, use threads.
+        :param addResults: a function that is called with the results of
+            each batch in order.
+        :param kwargs: parameters to pass to the tileIterator in worker
+            processes.
+        """
+        import concurrent.futures
+
+        poolKwargs: Dict[str, Any] = {'max_workers': workers}
+        poolClass: Any = concurrent.futures.ThreadPoolExecutor
+        localArgs: Tuple[Any, ...] = (tileIter, func)
+        if useProcesses and hasattr(self, '_initValues') and not hasattr(self, '_unpickleable'):
+            poolClass = concurrent.futures.ProcessPoolExecutor
+            poolKwargs['initializer'] = _mapTilesInitWorker
+            poolKwargs['initargs'] = (pickle.dumps(self), func, kwargs)
+            localArgs = ()
+        pending: Deque[concurrent.futures.Future] = collections.deque()
+        with poolClass(**poolKwargs) as pool:
+            try:
+                for start, stop in batches:
+                    if len(pending) >= workers * 2:
+                        addResults(pending.popleft().result())
+                    pending.append(pool.submit(_mapTilesRange, start, stop, *localArgs))
+                while pending:
+                    addResults(pending.popleft().result())
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def mapTilesToSink(
+            self, func: Callable[[LazyTileDict], Any], sink: Optional['TileSource'] = None,
+            halo: int = 0, path: Optional[str] = None,
+            writeParams: Optional[Dict[str, Any]] = None, **kwargs) -> 'TileSource':
+        """
+        Filter an image tile by tile into a new image.
+
+        This is a pipeline from this source to a sink, such as one made with
+        large_image.new().  Tiles are read and filtered in parallel by
+        mapTiles, so only a few tiles per worker are in memory at any time.
+        Each tile is read with a halo of extra pixels on every side that
+        filters such as convolutions can use; the filtered tile is trimmed to
+        the part that doesn't overlap its neighbors and added to the sink in
+        the order of the iteration.  These parts start on multiples of the
+        sink's tile size, so each one fills whole chunks of the sink.  At the
+        edges of the image, tiles don't extend past the image, so there is no
+        halo on those sides.
+
+        Tiles are read from a level of this source without resampling, and
+        the output has the size of the region at that level.
+
+        :param func: a function that takes a tile dictionary as yielded by
+            tileIterator and returns a numpy array or image with the same
+            width and height as the tile.  The band count and dtype of the
+            result can differ from the tile.  With processes, this must be
+            picklable.
+        :param sink: a tile source that supports addTile.  If None, a new
+            image is made with large_image.new().
+        :param halo: the number of extra pixels to read on each side of every
+            tile.
+        :param path: if not None, write the sink to this path when all tiles
+            are added.  This generates the lower resolution levels of the
+            output.
+        :param writeParams: parameters to pass to the sink's write method,
+            such as lossy.
+        :param kwargs: parameters to pass to mapTiles and tileIterator, such
+            as workers, executor, progress, region, output, and frame.  The
+            tile size, overlap, and format are determined by the sink and
+            halo.
+        :returns: the sink.
+        """
+        for key in ('tile_size', 'tile_overlap', 'tile_offset', 'format', 'resample',
+                    'reduce', 'initial'):
+            if key in kwargs:
+                msg = f'mapTilesToSink does not take the {key} parameter.'
+                raise ValueError(msg)
+        if halo < 0:
+            msg = 'halo must not be negative.'
+            raise ValueError(msg)
+        if sink is None:
+            from . import new
+
+            sink = new()
+        tileWidth = getattr(sink, 'tileWidth', None) or 512
+        tileHeight = getattr(sink, 'tileHeight', None) or 512
+        kwargs['tile_size'] = {'width': tileWidth + halo * 2, 'height': tileHeight + halo * 2}
+        kwargs['tile_overlap'] = {'x': halo * 2, 'y': halo * 2, 'edges': True}
+        kwargs['tile_offset'] = {'auto': True}
+        kwargs['resample'] = False
+        info = self.tileIterator(**{
+            k: v for k, v in kwargs.items()
+            if k not in {'workers', 'executor', 'progress'}}).info
+        if info is None:
+            return sink
+        region = info['region']
+
+        def addTile(count: int, result: Tuple[np.ndarray, int, int]) -> int:
+            tile, x, y = result
+            sink.addTile(tile, x - region['left'], y - region['top'])
+            return count + 1
+
+        self.mapTiles(
+            functools.partial(_mapTilesToSinkTile, func=func), reduce=addTile,
+            initial=0, **kwargs)
+        if path is not None:
+            sink.write(path, **(writeParams or {}))
+        return sink
 
     def _scanForMinMax(
             self, dtype: npt.DTypeLike, frame: Optional[int] = None,
@@ -677,18 +978,220 @@ class TileSource(IPyLeafletMixin):
         :param onlyMinMax: if True, only find the min and max.  If False, get
             the entire histogram.
         """
-        self._bandRanges[frame] = getattr(self, '_unstyledInstance', self).histogram(
-            dtype=dtype,
-            onlyMinMax=onlyMinMax,
-            output={'maxWidth': min(self.sizeX, analysisSize),
-                    'maxHeight': min(self.sizeY, analysisSize)},
-            resample=False,
-            frame=frame, **kwargs)
+        # This is often called while producing a tile, so don't add threads
+        kwargs.setdefault('max_workers', 1)
+        key = self._bandRangesCacheKey(dtype, frame, analysisSize, onlyMinMax, **kwargs)
+        try:
+            if key is None:
+                raise KeyError
+            if self.cache_lock:
+                with self.cache_lock:
+                    self._bandRanges[frame] = self.cache[key]
+            else:
+                self._bandRanges[frame] = self.cache[key]
+        except (KeyError, ValueError, pickle.UnpicklingError):
+            self._bandRanges[frame] = getattr(self, '_unstyledInstance', self).histogram(
+                dtype=dtype,
+                onlyMinMax=onlyMinMax,
+                output={'maxWidth': min(self.sizeX, analysisSize),
+                        'maxHeight': min(self.sizeY, analysisSize)},
+                resample=False,
+                frame=frame, **kwargs)
+            if key is not None:
+                _methodcacheStore(self, self.cache_lock, key, self._bandRanges[frame])
         if self._bandRanges[frame]:
             self.logger.info('Style range is %r', {
                 k: v for k, v in self._bandRanges[frame].items() if k in {
                     'min', 'max', 'mean', 'stdev'}})
 
+    def _bandRangesCacheKey(
+            self, dtype: npt.DTypeLike, frame: Optional[int], *args,
+            **kwargs) -> Optional[str]:
+        """
+        Get the tile cache key used to store the band ranges of a frame.
+        Unlike most cache keys, this doesn't depend on the instance, so band
+        ranges are reused when a source is reopened and, if the tile cache is
+        shared, by other processes.  Sources are identified by how they were
+        opened, ignoring the style, and for files by the file's modification
+        time and size.
+
+        :param dtype: the numpy dtype used for the scan.
+        :param frame: the frame that is scanned.
+        :param args: other parameters of the scan.
+        :param kwargs: other parameters of the scan.
+        :returns: a cache key or None if the source can't be identified.
+        """
+        return self._sourceCacheKey(
+            'bandRanges', str(np.dtype(dtype)) if dtype is not None else None,
+            frame, *args, **kwargs)
+
+    def _sourceCacheKey(self, kind: str, *args, **kwargs) -> Optional[str]:
+        """
+        Get a tile cache key for a value computed from the whole source that
+        doesn't depend on the instance or the style.  See _bandRangesCacheKey.
+
+        :param kind: the kind of value that is stored.
+        :param args: parameters of the computation.
+        :param kwargs: parameters of the computation.
+        :returns: a cache key or None if the source can't be identified.
+        """
+        source = getattr(self, '_unstyledInstance', self)
+        if not hasattr(source, '_initValues'):
+            return None
+        fingerprint = source._sourceFingerprint()
+        if fingerprint is None:
+            return None
+        initArgs, initKwargs = source._initValues
+        initKwargs = {k: v for k, v in initKwargs.items() if k not in {'style', 'noCache'}}
+        return '%s %s %s' % (kind, source.__class__.__name__, strhash(
+            initArgs, initKwargs, fingerprint, *args, **kwargs))
+
+    def _sourceFingerprint(self) -> Optional[Tuple[Any, ...]]:
+        """
+        Identify the current data of the source for _sourceCacheKey.  Values
+        stored with that key are shared between processes and don't expire,
+        so this must change whenever the data changes.
+
+        By default, a source opened from a regular file is identified by the
+        file's modification time and size, and a source that wasn't opened
+        from a path is identified by its parameters alone.  Other paths, such
+        as directories, files that refer to other files, and urls, can't be
+        checked cheaply, so they return None.  Sources can override this.
+
+        :returns: a tuple that identifies the data or None if the data can't
+            be identified.
+        """
+        initArgs = self._initValues[0] if hasattr(self, '_initValues') else ()
+        if not initArgs or initArgs[0] is None:
+            return ()
+        if not isinstance(initArgs[0], (str, os.PathLike)):
+            return None
+        try:
+            fileStat = os.stat(initArgs[0])
+        except (OSError, ValueError):
+            return None
+        if not stat.S_ISREG(fileStat.st_mode):
+            return None
+        return (fileStat.st_mtime_ns, fileStat.st_size)
+
+    def getForegroundMask(
+            self, method: Union[str, Callable[[np.ndarray], np.ndarray]] = 'tissue',
+            frame: Optional[int] = None, size: int = 512,
+            threshold: Optional[float] = None, nodata: Optional[Any] = None) -> np.ndarray:
+        """
+        Get a low resolution mask of the foreground of the image, such as the
+        tissue on a slide.  The mask is computed from the unstyled source and
+        is cached.
+
+        :param method: one of 'tissue', 'alpha', 'nodata', or a function that
+            takes an image and returns a two dimensional boolean array.  See
+            foreground.foregroundMask.
+        :param frame: the frame to use.
+        :param size: the maximum width and height of the mask.
+        :param threshold: for 'tissue', the intensity threshold between 0 and
+            1.  None to compute it from the image.
+        :param nodata: for 'nodata', the value of background pixels.  This
+            can be a value per band.
+        :returns: a two dimensional boolean array that covers the whole image.
+            Masks from functions are not cached, since a function can't be
+            compared with a later one.
+        """
+        if not hasattr(self, '_foregroundMasks'):
+            self._foregroundMasks: Dict[Tuple, np.ndarray] = {}
+        if nodata is not None and not np.isscalar(nodata):
+            nodata = tuple(np.asarray(nodata).ravel().tolist())
+        params = (method, frame, size, threshold, nodata)
+        cached = isinstance(method, str)
+        if cached and params in self._foregroundMasks:
+            return self._foregroundMasks[params]
+        key = self._sourceCacheKey('foregroundMask', *params) if cached else None
+        mask = None
+        if key is not None:
+            try:
+                if self.cache_lock:
+                    with self.cache_lock:
+                        mask = self.cache[key]
+                else:
+                    mask = self.cache[key]
+            except (KeyError, ValueError, pickle.UnpicklingError):
+                pass
+        if mask is None:
+            image, _ = getattr(self, '_unstyledInstance', self).getRegion(
+                output={'maxWidth': min(self.sizeX, size), 'maxHeight': min(self.sizeY, size)},
+                format=TILE_FORMAT_NUMPY, frame=frame)
+            mask = foregroundMask(image, method, threshold, nodata)
+            if key is not None:
+                _methodcacheStore(self, self.cache_lock, key, mask)
+        if cached:
+            self._foregroundMasks[params] = mask
+        return mask
+
+    def _scanStyleFrames(
+            self, style: JSONDict, frames: List[int], dtype: np.dtype) -> None:
+        """
+        Find the band ranges of all of the frames that a style will need that
+        haven't been found yet.  When several frames are needed, they are
+        scanned concurrently.
+
+        :param style: a style object with a list of bands.
+        :param frames: the frame used by each band entry of the style.
+        :param dtype: the numpy dtype of the image being styled.
+        """
+        import concurrent.futures
+
+        needed: Dict[int, bool] = {}
+        for entry, frame in zip(style['bands'], frames):
+            for minmax in ('min', 'max'):
+                try:
+                    value, threshold = self._parseMinMaxValue(entry.get(minmax, 'auto'))
+                except ValueError:
+                    value, threshold = 'auto', 0
+                if value in {'min', 'max', 'auto'} and (
+                        frame not in self._bandRanges or (
+                            threshold and 'histogram' not in self._bandRanges[frame])):
+                    needed[frame] = needed.get(frame, False) or bool(threshold)
+        if len(needed) < 2:
+            return
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(len(needed), config.cpu_count(False))) as pool:
+            for future in [pool.submit(
+                    self._scanForMinMax, dtype, frame, onlyMinMax=not threshold)
+                    for frame, threshold in needed.items()]:
+                future.result()
+
+    def _parseMinMaxValue(
+            self, value: Union[str, float]) -> Tuple[Union[str, int, float], float]:
+        """
+        Parse a min/max setting into a specific string or float value and a
+        threshold.
+
+        :param value: the specified value.  See _validateMinMaxValue.
+        :returns: the value and a threshold from [0-1].
+        :raises ValueError: if the value is not valid.
+        """
+        threshold: float = 0
+        if value not in {'min', 'max', 'auto', 'full'}:
+            if ':' in str(value) and cast(str, value).split(':', 1)[0] in {
+                    'min', 'max', 'auto'}:
+                threshold = float(cast(str, value).split(':', 1)[1])
+                value = cast(str, value).split(':', 1)[0]
+            else:
+                value = float(value)
+        return value, threshold
+
+    def _minMaxUsesBandRanges(self, value: Union[str, float]) -> bool:
+        """
+        Check if a min/max setting depends on the band ranges of a frame.
+
+        :param value: the specified value.  See _validateMinMaxValue.
+        :returns: True unless the value is a number or 'full'.
+        """
+        try:
+            return self._parseMinMaxValue(value)[0] in {'min', 'max', 'auto'}
+        except ValueError:
+            # Invalid values are treated as 'auto'
+            return True
+
     def _validateMinMaxValue(
         self, value: Union[str, float], frame: int, dtype: npt.DTypeLike,
     ) -> Tuple[Union[str, int, float], Union[float, int]]:
@@ -707,17 +1210,11 @@ class TileSource(IPyLeafletMixin):
         :returns: the validated value and a threshold from [0-1].
         """
         threshold: float = 0
-        if value not in {'min', 'max', 'auto', 'full'}:
-            try:
-                if ':' in str(value) and cast(str, value).split(':', 1)[0] in {
-                        'min', 'max', 'auto'}:
-                    threshold = float(cast(str, value).split(':', 1)[1])
-                    value = cast(str, value).split(':', 1)[0]
-                else:
-                    value = float(value)
-            except ValueError:
-                self.logger.warning('Style min/max value of %r is not valid; using "auto"', value)
-                value = 'auto'
+        try:
+            value, threshold = self._parseMinMaxValue(value)
+        except ValueError:
+            self.logger.warning('Style min/max value of %r is not valid; using "auto"', value)
+            value = 'auto'
         if value in {'min', 'max', 'auto'} and (
                 frame not in self._bandRanges or (
                     threshold and 'histogram' not in self._bandRanges[frame])):
@@ -956,6 +1453,53 @@ class TileSource(IPyLeafletMixin):
                 self.logger.exception('Failed to apply ICC profile')
         return sc.iccimage
 
+    def _styleBandLUT(
+            self, sc: types.SimpleNamespace, entry: Dict[str, Any],
+            image: np.ndarray, frame: Optional[int]) -> Optional[StyleBandLUT]:
+        """
+        Get a style band entry compiled to lookup tables, compiling it the
+        first time it is used.  Only integer bands styled without style
+        functions are compiled; other bands are styled pixel by pixel.
+
+        :param sc: the style context.  The band, bandidx, styleIndex, and
+            composite must be set.
+        :param entry: the style band entry.
+        :param image: the image the band is from.
+        :param frame: the frame to use for auto ranging.
+        :returns: the compiled entry or None if it can't be compiled.
+        """
+        if (sc.band.dtype not in (np.uint8, np.uint16) or
+                sc.output.dtype != np.float32 or sc.style.get('function') or
+                any(band.get('function') for band in sc.style['bands'])):
+            return None
+        # The table only differs by frame if the range comes from the frame's
+        # band ranges
+        autoRange = any(
+            self._minMaxUsesBandRanges(entry.get(minmax, 'auto')) for minmax in ('min', 'max'))
+        key = (sc.styleIndex, sc.bandidx, (frame or 0) if autoRange else None,
+               image.dtype.str, sc.band.dtype.str, sc.output.shape[2])
+        with self._styleLUTLock:
+            lut = self._styleLUTs.get(key)
+        if lut is None:
+            lut = StyleBandLUT(
+                getPaletteColors(entry.get(
+                    'palette', ['#000', '#FFF']
+                    if entry.get('band') != 'alpha' else ['#FFF0', '#FFFF'])),
+                self._getMinMax(
+                    'min', entry.get('min', 'auto'), image.dtype, sc.bandidx, frame),
+                self._getMinMax(
+                    'max', entry.get('max', 'auto'), image.dtype, sc.bandidx, frame),
+                nodata=entry.get('nodata'),
+                clamp=entry.get('clamp', True),
+                discrete=entry.get('scheme') == 'discrete',
+                composite=sc.composite,
+                first=not sc.styleIndex,
+                channels=sc.output.shape[2],
+                dtype=sc.band.dtype)
+            with self._styleLUTLock:
+                self._styleLUTs[key] = lut
+        return lut
+
     def _applyStyle(  # noqa
             self, image: np.ndarray, style: Optional[JSONDict], x: int, y: int,
             z: int, frame: Optional[int] = None) -> np.ndarray:
@@ -996,6 +1540,21 @@ class TileSource(IPyLeafletMixin):
                 (image.shape[0], image.shape[1], newwidth),
                 np.float32 if image.dtype != np.float64 else image.dtype)
         image = self._applyStyleFunction(image, sc, 'pre')
+        entryFrames = [
+            None if ((entry.get('frame') is None and not entry.get('framedelta')) or
+                     entry.get('frame') == sc.mainFrame) else
+            entry['frame'] if entry.get('frame') is not None else
+            sc.mainFrame + entry['framedelta']
+            for entry in sc.style['bands']]
+        rangeFrames = [(sc.mainFrame if entryFrame is None else entryFrame) or 0
+                       for entryFrame in entryFrames]
+        if any(rangeFrame not in self._bandRanges for rangeFrame in rangeFrames):
+            self._scanStyleFrames(sc.style, rangeFrames, image.dtype)
+        frameImages: Dict[int, Any] = {}
+        if any(entryFrame is not None for entryFrame in entryFrames):
+            frameImages = getattr(self, '_unstyledInstance', self).getFrameTiles(
+                x, y, z, [entryFrame for entryFrame in entryFrames if entryFrame is not None],
+                numpyAllowed=True)
         for eidx, entry in enumerate(sc.style['bands']):
             sc.styleIndex = eidx
             sc.dtype = sc.dtype if sc.dtype is not None else entry.get('dtype')
@@ -1007,15 +1566,12 @@ class TileSource(IPyLeafletMixin):
             sc.axis = sc.axis if sc.axis is not None else entry.get('axis')
             sc.bandidx = 0 if image.shape[2] <= 2 else 1  # type: ignore[misc]
             sc.band = None
-            if ((entry.get('frame') is None and not entry.get('framedelta')) or
-                    entry.get('frame') == sc.mainFrame):
+            if entryFrames[eidx] is None:
                 image = sc.mainImage
                 frame = sc.mainFrame
             else:
-                frame = entry['frame'] if entry.get('frame') is not None else (
-                    sc.mainFrame + entry['framedelta'])
-                image = getattr(self, '_unstyledInstance', self).getTile(
-                    x, y, z, frame=frame, numpyAllowed=True)
+                frame = entryFrames[eidx]
+                image = frameImages[frame]
                 image = image[:sc.mainImage.shape[0],
                               :sc.mainImage.shape[1],
                               :sc.mainImage.shape[2]]
@@ -1044,6 +1600,11 @@ class TileSource(IPyLeafletMixin):
                     :, :, sc.bandidx  # type: ignore[index]
                     if sc.bandidx is not None and sc.bandidx < image.shape[2]  # type: ignore[misc]
                     else 0]
+            lut = self._styleBandLUT(sc, entry, image, frame)
+            if lut is not None:
+                lut.apply(sc.output, sc.band)
+                sc.output = self._applyStyleFunction(sc.output, sc, 'postband')
+                continue
             sc.band = self._applyStyleFunction(sc.band, sc, 'preband')
             sc.palette = getPaletteColors(entry.get(
                 'palette', ['#000', '#FFF']
@@ -1123,7 +1684,7 @@ class TileSource(IPyLeafletMixin):
 
     def _outputTileNumpyStyle(
             self, intile: Any, applyStyle: bool, x: int, y: int, z: int,
-            frame: Optional[int] = None) -> Tuple[np.ndarray, str]:
+            frame: Optional[int] = None, bands: Any = None) -> Tuple[np.ndarray, str]:
         """
         Convert a tile to a numpy array.  Optionally apply the style to a tile.
         Always returns a numpy tile.
@@ -1134,6 +1695,8 @@ class TileSource(IPyLeafletMixin):
         :param y: the y tile position; used for multi-frame styles.
         :param z: the z tile position; used for multi-frame styles.
         :param frame: the frame to use for auto-ranging.
+        :param bands: if not None, a 1-based band number or list of band
+            numbers to keep after applying the style.
         :returns: a numpy array and a target PIL image mode.
         """
         tile, mode = _imageToNumpy(intile)
@@ -1141,6 +1704,9 @@ class TileSource(IPyLeafletMixin):
                 (not getattr(self, 'style', None) or len(self.style) != 1 or
                  self.style.get('icc') is not False)):
             tile = self._applyStyle(tile, getattr(self, 'style', None), x, y, z, frame)
+        if bands is not None:
+            tile, mode = _imageToNumpy(
+                tile[:, :, self._bandIndices(bands, tile.shape[2])])  # type: ignore[misc]
         if tile.shape[0] != self.tileHeight or tile.shape[1] != self.tileWidth:
             extend = np.zeros(
                 (self.tileHeight, self.tileWidth, tile.shape[2]),  # type: ignore[misc]
@@ -1169,9 +1735,13 @@ class TileSource(IPyLeafletMixin):
         :param numpyAllowed: True if a numpy image may be returned.  'always'
             to return a numpy array.
         :param applyStyle: if True and there is a style, apply it.
+        :param bands: if not None, a 1-based band number or list of band
+            numbers to return.  These are selected after any style is
+            applied.
         :returns: either a numpy array, a PIL image, or a memory object with an
             image file.
         """
+        bands = kwargs.get('bands')
         isEdge = False
         if self.edge:
             sizeX = int(self.sizeX * 2 ** (z - (self.levels - 1)))
@@ -1184,7 +1754,7 @@ class TileSource(IPyLeafletMixin):
             getattr(self, 'style', {}).get('icc', config.getConfig('icc_correction', True)))
         if (tileEncoding not in (TILE_FORMAT_PIL, TILE_FORMAT_NUMPY) and
                 numpyAllowed != 'always' and tileEncoding == self.encoding and
-                not isEdge and (not applyStyle or not hasStyle)):
+                not isEdge and (not applyStyle or not hasStyle) and bands is None):
             return tile
 
         if self._dtype is None or (isinstance(self._dtype, str) and self._dtype == 'check'):
@@ -1201,9 +1771,9 @@ class TileSource(IPyLeafletMixin):
 
         mode = None
         if (numpyAllowed == 'always' or tileEncoding == TILE_FORMAT_NUMPY or
-                (applyStyle and hasStyle) or isEdge):
+                (applyStyle and hasStyle) or isEdge or bands is not None):
             tile, mode = self._outputTileNumpyStyle(
-                tile, applyStyle, x, y, z, self._getFrame(**kwargs))
+                tile, applyStyle, x, y, z, self._getFrame(**kwargs), bands)
         if isEdge:
             contentWidth = min(self.tileWidth,
                                sizeX - (maxX - self.tileWidth))
@@ -1437,6 +2007,45 @@ class TileSource(IPyLeafletMixin):
             frame = int(self.style['bands'][0]['frame'])
         return frame
 
+    def _bandIndices(
+            self, bands: Union[int, List[int], Tuple[int, ...]],
+            count: Optional[int]) -> List[int]:
+        """
+        Convert a band selection to a list of 0-based band indices.
+
+        :param bands: a 1-based band number or a list of 1-based band numbers.
+        :param count: the number of bands that can be selected from.  If None,
+            the numbers are not checked.
+        :returns: a list of 0-based indices.
+        """
+        if isinstance(bands, (int, np.integer)):
+            bands = [bands]
+        indices = [int(band) - 1 for band in bands]
+        for idx in indices:
+            if idx < 0 or (count is not None and idx >= count):
+                msg = f'Band {idx + 1} does not exist'
+                raise exceptions.TileSourceError(msg)
+        return indices
+
+    def _sourceBands(self, bands: Any = None, **kwargs) -> Optional[List[int]]:
+        """
+        Get the bands that a source needs to read for a tile.  Sources that
+        can read a subset of their bands more efficiently than all of them
+        can use this in getTile.  If this returns a list, the tile passed to
+        _outputTile must contain only those bands, in that order, and bands
+        must be set to None in the parameters passed to _outputTile.
+
+        :param bands: the bands parameter passed to getTile.
+        :returns: None to read all bands, or a list of 0-based band indices.
+        """
+        if (bands is None or getattr(self, '_style', None) or
+                hasattr(self, '_iccprofiles')):
+            return None
+        # Make sure the dtype and band count are known before reading a
+        # subset of the bands.
+        _ = self.dtype
+        return self._bandIndices(bands, self.bandCount)
+
     def _xyzInRange(
             self, x: int, y: int, z: int, frame: Optional[int] = None,
             numFrames: Optional[int] = None) -> None:
@@ -1556,11 +2165,48 @@ class TileSource(IPyLeafletMixin):
             so, interpolate the needed data for this tile.
         :param frame: the frame number within the tile source.  None is the
             same as 0 for multi-frame sources.
+        :param bands: if present, a 1-based band number or a list of band
+            numbers to return.  Sources may read only these bands; otherwise
+            they are selected from the whole tile.  If the source has a
+            style, the bands are selected from the styled tile.
         :returns: either a numpy array, a PIL image, or a memory object with an
             image file.
         """
         raise NotImplementedError
 
+    def getFrameTiles(
+            self, x: int, y: int, z: int, frames: List[int],
+            max_workers: Optional[int] = -4, **kwargs) -> Dict[int, Any]:
+        """
+        Get the same tile from several frames.  Tiles are read concurrently
+        unless the source's _readsReleaseGIL attribute is False.  Sources that
+        can read several planes more efficiently than one at a time can
+        override this.
+
+        :param x: the 0-based x position of the tile on the specified z level.
+        :param y: the 0-based y position of the tile on the specified z level.
+        :param z: the z level of the tile.
+        :param frames: a list of frame numbers.
+        :param max_workers: maximum workers for reading tiles in parallel.  If
+            negative, use the minimum of the absolute value of this number or
+            multiprocessing.cpu_count().  If 1, tiles are read one at a time.
+        :param kwargs: additional parameters to pass to getTile, such as
+            numpyAllowed.
+        :returns: a dictionary of tiles keyed by frame number.
+        """
+        import concurrent.futures
+
+        frames = list(dict.fromkeys(frames))
+        if max_workers is not None and max_workers < 0:
+            max_workers = min(-max_workers, config.cpu_count(False))
+        if max_workers == 1 or len(frames) < 2 or not self._readsReleaseGIL:
+            return {frame: self.getTile(x, y, z, frame=frame, **kwargs) for frame in frames}
+        with concurrent.futures.ThreadPoolExecutor(
+                max_workers=min(max_workers or len(frames), len(frames))) as pool:
+            futures = {frame: pool.submit(self.getTile, x, y, z, frame=frame, **kwargs)
+                       for frame in frames}
+            return {frame: future.result() for frame, future in futures.items()}
+
     def getTileMimeType(self) -> str:
         """
         Return the default mimetype for image tiles.
@@ -1711,8 +2357,11 @@ class TileSource(IPyLeafletMixin):
                 del targetRegion[key]
         return targetRegion
 
-    def getRegion(self, format: Union[str, Tuple[str]] = (TILE_FORMAT_IMAGE, ), **kwargs) -> Tuple[
-            Union[np.ndarray, PIL.Image.Image, ImageBytes, bytes, pathlib.Path], str]:
+    def getRegion(
+            self, format: Union[str, Tuple[str]] = (TILE_FORMAT_IMAGE, ),
+            max_workers: Optional[int] = 1,
+            out: Optional[Union[np.ndarray, str, os.PathLike]] = None, **kwargs) -> Tuple[
+                Union[np.ndarray, PIL.Image.Image, ImageBytes, bytes, pathlib.Path], str]:
         """
         Get a rectangular region from the current tile source.  Aspect ratio is
         preserved.  If neither width nor height is given, the original size of
@@ -1723,6 +2372,19 @@ class TileSource(IPyLeafletMixin):
             Formats are members of (TILE_FORMAT_PIL, TILE_FORMAT_NUMPY,
             TILE_FORMAT_IMAGE).  If TILE_FORMAT_IMAGE, encoding may be
             specified.
+        :param max_workers: maximum workers for reading the tiles that make up
+            the region in parallel.  If negative, use the minimum of the
+            absolute value of this number or multiprocessing.cpu_count().  If
+            1, tiles are read one at a time.  Tiles are only read in parallel
+            if they do not overlap and the encoding is not TILED.
+        :param out: if not None, the region is stored in this rather than in a
+            newly allocated array.  This is either a numpy array, such as a
+            numpy.memmap, with a shape of (height, width, bands), or
+            the path of a file to create as a numpy.memmap.  A memmap file has
+            the data type and number of bands of the first tile read.  Tiles
+            are converted to the number of bands of a supplied array.  If the
+            format is TILE_FORMAT_NUMPY, the returned image is out (or the
+            created memmap).  This cannot be used with the TILED encoding.
         :param kwargs: optional arguments.  Some options are region, output,
             encoding, jpegQuality, jpegSubsampling, tiffCompression, fill.  See
             tileIterator.
@@ -1734,7 +2396,7 @@ class TileSource(IPyLeafletMixin):
         if 'tile_position' in kwargs:
             kwargs = kwargs.copy()
             kwargs.pop('tile_position', None)
-        tiled = TILE_FORMAT_IMAGE in format and kwargs.get('encoding') == 'TILED'
+        tiled = utilities._isTiledOutput(format, kwargs.get('encoding'), out)
         if not tiled and 'tile_offset' not in kwargs and 'tile_size' not in kwargs:
             kwargs = kwargs.copy()
             kwargs['tile_size'] = {
@@ -1756,8 +2418,18 @@ class TileSource(IPyLeafletMixin):
         mode = None if TILE_FORMAT_NUMPY in format else tileIter.info['mode']
         outWidth = tileIter.info['output']['width']
         outHeight = tileIter.info['output']['height']
+        maxWidth = kwargs.get('output', {}).get('maxWidth')
+        maxHeight = kwargs.get('output', {}).get('maxHeight')
+        letterbox = kwargs.get('fill') and maxWidth and maxHeight
+        outWidth = int(math.floor(outWidth))
+        outHeight = int(math.floor(outHeight))
+        # Assemble the region in out unless it will be scaled or letterboxed
+        regionOut = out if (
+            outWidth == regionWidth and outHeight == regionHeight and not letterbox) else None
         image: Optional[Union[np.ndarray, PIL.Image.Image, ImageBytes, bytes]] = None
         tiledimage = None
+        if max_workers != 1 and not tiled:
+            image = self._getRegionParallel(tileIter, max_workers, regionOut)
         for tile in tileIter:
             # Add each tile to the image
             subimage, _ = _imageToNumpy(tile['tile'])
@@ -1767,37 +2439,36 @@ class TileSource(IPyLeafletMixin):
                     tiledimage, subimage, x0, y0, regionWidth, regionHeight, tile, **kwargs)
             else:
                 image = utilities._addSubimageToImage(
-                    cast(Optional[np.ndarray], image), subimage, x0, y0, regionWidth, regionHeight)
+                    cast(Optional[np.ndarray], image), subimage, x0, y0,
+                    regionWidth, regionHeight, regionOut)
             # Somehow discarding the tile here speeds things up.
             del tile
             del subimage
         # Scale if we need to
-        outWidth = int(math.floor(outWidth))
-        outHeight = int(math.floor(outHeight))
         if tiled:
             return self._encodeTiledImage(
                 cast(Dict[str, Any], tiledimage), outWidth, outHeight, tileIter.info, **kwargs)
         if outWidth != regionWidth or outHeight != regionHeight:
-            dtype = cast(np.ndarray, image).dtype
-            if dtype == np.uint8 or resample is not None:
-                image = _imageToPIL(cast(np.ndarray, image), mode).resize(
+            image = cast(np.ndarray, image)
+            if image.dtype == np.uint8 and (len(image.shape) < 3 or image.shape[2] <= 4):
+                image = _imageToPIL(image, mode).resize(
                     (outWidth, outHeight),
                     getattr(PIL.Image, 'Resampling', PIL.Image).NEAREST
                     if resample is None else
                     getattr(PIL.Image, 'Resampling', PIL.Image).BICUBIC
                     if outWidth > regionWidth else
                     getattr(PIL.Image, 'Resampling', PIL.Image).LANCZOS)
-                if dtype == np.uint16 and TILE_FORMAT_NUMPY in format:
-                    image = _imageToNumpy(image)[0].astype(dtype) * 257
             else:
-                cols = [int(idx * regionWidth / outWidth) for idx in range(outWidth)]
-                rows = [int(idx * regionHeight / outHeight) for idx in range(outHeight)]
-                image = np.take(np.take(image, rows, axis=0), cols, axis=1)
-        maxWidth = kwargs.get('output', {}).get('maxWidth')
-        maxHeight = kwargs.get('output', {}).get('maxHeight')
-        if kwargs.get('fill') and maxWidth and maxHeight:
+                # Other data types and band counts are resized in numpy so
+                # that they keep their full precision
+                image = resizeArray(
+                    image, outWidth, outHeight,
+                    'nearest' if resample is None else
+                    'bicubic' if outWidth > regionWidth else 'lanczos')
+        if letterbox:
             image = utilities._letterboxImage(
                 _imageToPIL(cast(np.ndarray, image), mode), maxWidth, maxHeight, kwargs['fill'])
+        image = utilities._regionResult(image, out, regionOut is not None)
         return utilities._encodeImage(cast(np.ndarray, image), format=format, **kwargs)
 
     def _encodeTiledImage(
@@ -1906,11 +2577,74 @@ class TileSource(IPyLeafletMixin):
                 pass
             raise exc
 
+    def _getRegionParallel(
+            self, tileIter: TileIterator, max_workers: Optional[int],
+            out: Optional[Union[np.ndarray, str, os.PathLike]] = None) -> Optional[np.ndarray]:
+        """
+        Assemble the tiles of a region, reading them in parallel.  The first
+        tile determines the data type and number of bands of the output, which
+        is allocated once.  The other tiles are read and copied into it in
+        worker threads; since the tiles do not overlap, each worker writes to
+        a separate part of the output.
+
+        :param tileIter: a tile iterator over the region.  If its tiles
+            overlap or there is only one tile, this does nothing.  Otherwise,
+            the iterator is exhausted when this returns.
+        :param max_workers: maximum workers for parallelism.  If negative, use
+            the minimum of the absolute value of this number or
+            multiprocessing.cpu_count().
+        :param out: if not None, a caller-supplied array or memmap path to
+            assemble the region in.  See utilities._addSubimageToImage.
+        :returns: the assembled region as a numpy array or None if the tiles
+            were not read.
+        """
+        import concurrent.futures
+
+        if (tileIter.info['tile_overlap']['x'] or tileIter.info['tile_overlap']['y'] or
+                tileIter.info['tile_count'] < 2):
+            return None
+        if max_workers is not None and max_workers < 0:
+            max_workers = min(-max_workers, config.cpu_count(False))
+        regionWidth = tileIter.info['region']['width']
+        regionHeight = tileIter.info['region']['height']
+        top = tileIter.info['region']['top']
+        left = tileIter.info['region']['left']
+        tile = next(tileIter)
+        subimage, _ = _imageToNumpy(tile['tile'])
+        image = utilities._addSubimageToImage(
+            None, subimage, tile['x'] - left, tile['y'] - top, regionWidth, regionHeight, out)
+        del tile, subimage
+
+        def addTile(
+                image: np.ndarray, tile: LazyTileDict) -> Optional[Tuple[np.ndarray, int, int]]:
+            subimage, _ = _imageToNumpy(tile['tile'])
+            x0, y0 = tile['x'] - left, tile['y'] - top
+            tile.release()
+            if out is None and (
+                    len(subimage.shape) != len(image.shape) or
+                    subimage.shape[-1] != image.shape[-1]):
+                # Changing the number of bands replaces the output, so this
+                # is done after all of the workers are finished.
+                return subimage, x0, y0
+            utilities._addSubimageToImage(
+                image, subimage, x0, y0, regionWidth, regionHeight, out)
+            return None
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(addTile, image, tile) for tile in tileIter]
+            deferred = [future.result() for future in futures]
+        for entry in deferred:
+            if entry is not None:
+                image = utilities._addSubimageToImage(
+                    image, entry[0], entry[1], entry[2], regionWidth, regionHeight, out)
+        return image
+
     def tileFrames(
             self, format: Union[str, Tuple[str]] = (TILE_FORMAT_IMAGE, ),
             frameList: Optional[List[int]] = None,
             framesAcross: Optional[int] = None,
-            max_workers: Optional[int] = -4, **kwargs) -> Tuple[
+            max_workers: Optional[int] = -4,
+            out: Optional[Union[np.ndarray, str, os.PathLike]] = None, **kwargs) -> Tuple[
                 Union[np.ndarray, PIL.Image.Image, ImageBytes, bytes, pathlib.Path], str]:
         """
         Given the parameters for getRegion, plus a list of frames and the
@@ -1931,6 +2665,8 @@ class TileSource(IPyLeafletMixin):
         :param max_workers: maximum workers for parallelism.  If negative, use
             the minimum of the absolute value of this number or
             multiprocessing.cpu_count().
+        :param out: if not None, a numpy array or the path of a numpy.memmap
+            file to store the combined image in.  See getRegion.
         :returns: regionData, formatOrRegionMime: the image data and either the
             mime type, if the format is TILE_FORMAT_IMAGE, or the format.
         """
@@ -1946,14 +2682,14 @@ class TileSource(IPyLeafletMixin):
         if not frameList:
             frameList = list(range(numFrames))
         if len(frameList) == 1:
-            return self.getRegion(format=format, frame=frameList[0], **kwargs)
+            return self.getRegion(format=format, frame=frameList[0], out=out, **kwargs)
         if not framesAcross:
             framesAcross = int(math.ceil(len(frameList) ** 0.5))
         framesAcross = min(len(frameList), framesAcross)
         framesHigh = int(math.ceil(len(frameList) / framesAcross))
         if not isinstance(format, (tuple, set, list)):
             format = (format, )
-        tiled = TILE_FORMAT_IMAGE in format and kwargs.get('encoding') == 'TILED'
+        tiled = utilities._isTiledOutput(format, kwargs.get('encoding'), out)
         tileIter = TileIterator(self, format=TILE_FORMAT_NUMPY, resample=None,
                                 frame=frameList[0], **kwargs)
         if tileIter.info is None:
@@ -1997,10 +2733,11 @@ class TileSource(IPyLeafletMixin):
                 else:
                     image = utilities._addSubimageToImage(
                         image, cast(np.ndarray, subimage), offsetX, offsetY,
-                        outWidth, outHeight)
+                        outWidth, outHeight, out)
         if tiled:
             return self._encodeTiledImage(
                 cast(Dict[str, Any], tiledimage), outWidth, outHeight, tileIter.info, **kwargs)
+        image = utilities._regionResult(image, out, True)
         return utilities._encodeImage(cast(np.ndarray, image), format=format, **kwargs)
 
     def getRegionAtAnotherScale(
@@ -2301,11 +3038,68 @@ class TileSource(IPyLeafletMixin):
             Some of these are aliased: 'none', 'lzw', 'deflate'.
         :param frame: the frame number within the tile source.  None is the
             same as 0 for multi-frame sources.
+        :param frames: if present, a list of frame numbers.  Each tile is a
+            numpy array of shape (frames, height, width, bands) with the same
+            tile from each frame, fetched together with getFrameTiles so that
+            sources can read several frames at once.  The format must allow
+            TILE_FORMAT_NUMPY.  Tiles include a 'frames' entry with the list.
+        :param prefetch: if a positive number, load the data of up to this
+            many upcoming tiles in background threads while the current tile
+            is processed.  Tiles are still yielded in order with their data
+            loaded.  Call close() on the iterator to stop early and discard
+            prefetched tiles.
+        :param workers: the number of threads used for prefetching.  If
+            negative, use the minimum of the absolute value of this and the
+            number of cpus.  If None, use the minimum of prefetch and the
+            number of cpus.
+        :param shard: if present, a tuple of (index, count) or (index, count,
+            method) to only yield one of count disjoint parts of the tiles,
+            such as the part for one of several workers.  method is one of
+            'contiguous' (the default) for blocks of consecutive tiles,
+            'roundrobin' for every count-th tile, or 'zorder' for blocks of
+            tiles along a Z-order curve, which keeps each part compact.  Tile
+            positions are still those of the full iteration.
+        :param foreground: if present and not False, only yield the tiles
+            that overlap the foreground of the image, so background tiles are
+            never read.  This is True to find tissue on a brightfield image,
+            'alpha' for pixels with non-zero alpha, 'nodata' for pixels with
+            a band that isn't 0, a function that takes a low resolution image
+            and returns a boolean mask, or a dictionary of parameters for
+            getForegroundMask.  The mask is computed once and cached.  By
+            default, it is computed from the frame of the iteration.
+        :param start_position: if present, skip the tiles before the tile with
+            this tile_position position in the order of the iteration.
+        :param checkpoint: if present, a value returned by the checkpoint
+            method of an iterator with the same parameters.  The iteration
+            continues after the last tile that that iterator yielded.
         :param kwargs: optional arguments.
-        :yields: an iterator that returns a dictionary as listed above.
+        :yields: an iterator that returns a dictionary as listed above.  The
+            iterator's `plan` attribute is a TilePlan with the tiles that
+            will be yielded as arrays, which can be used to count or inspect
+            the tiles without making their dictionaries.
         """
         return TileIterator(self, format=format, resample=resample, **kwargs)
 
+    def asarray(
+            self, level: Optional[int] = None, frame: Optional[int] = None,
+            frames: Optional[List[int]] = None) -> TileArray:
+        """
+        Get a lazily evaluated array view of one level of the source.  Indexing
+        the array only reads the tiles needed for the selected pixels, and the
+        array's chunks match the source's tiles, so it can be passed to dask
+        with ``dask.array.from_array(arr, chunks=arr.chunks)``.
+
+        :param level: the level to use.  None is the maximum resolution
+            level.
+        :param frame: the frame to use.
+        :param frames: if not None, a list of frames.  The array has a leading
+            axis with one entry per frame, and tiles are read with
+            getFrameTiles.
+        :returns: a TileArray with axes (y, x, bands) or (frames, y, x,
+            bands).
+        """
+        return TileArray(self, level=level, frame=frame, frames=frames)
+
     def tileIteratorAtAnotherScale(
             self, sourceRegion: Dict[str, Any],
             sourceScale: Optional[Dict[str, float]] = None,
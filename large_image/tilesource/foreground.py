@@ -0,0 +1,89 @@
+from typing import Any, Callable, Optional, Union
+
+import numpy as np
+
+ForegroundMethods = ('tissue', 'alpha', 'nodata')
+
+
+def _otsuThreshold(values: np.ndarray, bins: int = 256) -> float:
+    """
+    Find the threshold that best separates values into two classes by
+    maximizing the variance between the classes.
+
+    :param values: an array of values in the range [0, 1].
+    :param bins: the number of histogram bins to use.
+    :returns: the threshold.
+    """
+    hist, edges = np.histogram(values, bins=bins, range=(0, 1))
+    centers = (edges[:-1] + edges[1:]) / 2
+    weightLow = np.cumsum(hist)
+    weightHigh = weightLow[-1] - weightLow
+    sumLow = np.cumsum(hist * centers)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        meanLow = sumLow / weightLow
+        meanHigh = (sumLow[-1] - sumLow) / weightHigh
+        variance = weightLow * weightHigh * (meanLow - meanHigh) ** 2
+    return float(edges[np.nanargmax(variance[:-1]) + 1]) if bins > 1 else 1.0
+
+
+def _intensity(image: np.ndarray) -> np.ndarray:
+    """
+    Get the intensity of an image scaled to [0, 1].  For color images this is
+    the mean of the color bands; an alpha band is ignored.
+
+    :param image: an image of shape (height, width, bands).
+    :returns: a two dimensional float array.
+    """
+    bands = image.shape[2]
+    colorBands = 3 if bands >= 3 else 1
+    values = image[:, :, :colorBands].astype(float).mean(axis=2)
+    if image.dtype.kind in {'u', 'i'}:
+        info = np.iinfo(image.dtype)
+        return (values - info.min) / (info.max - info.min)
+    low, high = np.nanmin(values), np.nanmax(values)
+    return (values - low) / (high - low) if high > low else np.zeros(values.shape)
+
+
+def foregroundMask(
+        image: np.ndarray,
+        method: Union[str, Callable[[np.ndarray], np.ndarray]] = 'tissue',
+        threshold: Optional[float] = None, nodata: Optional[Any] = None) -> np.ndarray:
+    """
+    Determine which pixels of an image are foreground.
+
+    :param image: an image of shape (height, width, bands).
+    :param method: one of ForegroundMethods or a function that takes the image
+        and returns a two dimensional boolean array.  'tissue' is for
+        brightfield images: pixels that are darker than the background, such
+        as tissue on glass, are foreground.  'alpha' uses pixels whose alpha
+        band is non-zero; images without an alpha band are all foreground.
+        'nodata' uses pixels with at least one band that isn't the nodata
+        value.
+    :param threshold: for 'tissue', pixels with an intensity below this are
+        foreground, where intensity is scaled to [0, 1].  If None, this is
+        found with Otsu's method but is never more than 0.9, so a blank image
+        has no foreground.
+    :param nodata: for 'nodata', the value of background pixels.  Default
+        0.
+    :returns: a two dimensional boolean array.
+    """
+    if image.ndim == 2:
+        image = image[:, :, np.newaxis]
+    if callable(method):
+        return np.asarray(method(image), dtype=bool)
+    if method == 'alpha':
+        if image.shape[2] not in {2, 4}:
+            return np.ones(image.shape[:2], dtype=bool)
+        return image[:, :, -1] != 0
+    if method == 'nodata':
+        return np.any(image != (0 if nodata is None else nodata), axis=2)
+    if method != 'tissue':
+        msg = f'Foreground method must be a function or one of {", ".join(ForegroundMethods)}.'
+        raise ValueError(msg)
+    intensity = _intensity(image)
+    valid = ~np.isnan(intensity)
+    if image.shape[2] in {2, 4}:
+        valid &= image[:, :, -1] != 0
+    if threshold is None:
+        threshold = min(_otsuThreshold(intensity[valid]), 0.9) if np.any(valid) else 0
+    return valid & (intensity < threshold)
@@ -0,0 +1,407 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple, Union, cast
+
+import numpy as np
+import numpy.typing as npt
+
+# The maximum number of fine bins kept per band for data that isn't counted
+# exactly.
+SketchBins = 65536
+
+
+def _exactDomain(dtype: np.dtype) -> Optional[Tuple[int, int]]:
+    """
+    Get the range of values that is counted exactly for a data type.
+
+    :param dtype: a numpy dtype.
+    :returns: None if values of this type are not counted exactly, otherwise
+        the minimum value and the number of possible values.
+    """
+    if dtype.kind in {'u', 'i'} and dtype.itemsize <= 2:
+        info = np.iinfo(dtype)
+        return int(info.min), int(info.max) - int(info.min) + 1
+    return None
+
+
+class _Sketch:
+    """
+    Counts of values in fine bins of equal width for one band.  The bin width
+    is a power of two and bins are aligned to multiples of it, so sketches
+    with different widths can be merged exactly by combining bins of the
+    narrower one.  There are never more than SketchBins bins; the width is
+    increased as the range of values grows.  The result is exact for integer
+    values whenever the bin width is at most 1.
+    """
+
+    def __init__(self) -> None:
+        self.exponent: Optional[int] = None
+        self.base = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _minimumExponent(lo: float, hi: float) -> int:
+        # Keep bin indices within the precision of a float
+        return math.frexp(max(abs(lo), abs(hi)) or 1.0)[1] - 52
+
+    def _rebin(self, exponent: int) -> None:
+        if self.exponent is None:
+            self.exponent = exponent
+            return
+        shift = exponent - cast(int, self.exponent)
+        if shift <= 0:
+            return
+        shift = min(shift, 63)
+        indices = (self.base + np.arange(len(self.counts), dtype=np.int64)) >> shift
+        base = self.base >> shift
+        self.counts = np.bincount(
+            indices - base, weights=self.counts).astype(np.int64)
+        self.base = int(base)
+        self.exponent = exponent
+
+    def _fit(self, lo: float, hi: float) -> None:
+        """
+        Make sure the sketch can hold values in a range.
+
+        :param lo: the lowest value that will be added.
+        :param hi: the highest value that will be added.
+        """
+        if len(self.counts):
+            width = math.ldexp(1.0, cast(int, self.exponent))
+            lo = min(lo, self.base * width)
+            hi = max(hi, (self.base + len(self.counts)) * width)
+        exponent = self._minimumExponent(lo, hi)
+        if hi > lo:
+            exponent = max(exponent, math.frexp((hi - lo) / (SketchBins - 2))[1])
+        if self.exponent is not None:
+            exponent = max(exponent, self.exponent)
+        while math.floor(hi / math.ldexp(1.0, exponent)) - math.floor(
+                lo / math.ldexp(1.0, exponent)) >= SketchBins:
+            exponent += 1
+        self._rebin(exponent)
+
+    def _add(self, indices: np.ndarray, counts: Optional[np.ndarray] = None) -> None:
+        base = min(self.base, int(indices.min())) if len(self.counts) else int(indices.min())
+        length = max(
+            self.base + len(self.counts) if len(self.counts) else base,
+            int(indices.max()) + 1) - base
+        combined = np.bincount(indices - base, weights=counts, minlength=length)
+        if counts is not None:
+            combined = combined.astype(np.int64)
+        if len(self.counts):
+            combined[self.base - base:self.base - base + len(self.counts)] += self.counts
+        self.base = base
+        self.counts = combined
+
+    def add(self, values: np.ndarray, lo: float, hi: float) -> None:
+        """
+        Count values.
+
+        :param values: a one dimensional float64 array of values.  Values that
+            are not finite are ignored.
+        :param lo: the minimum of the values.
+        :param hi: the maximum of the values.
+        """
+        if not math.isfinite(lo) or not math.isfinite(hi):
+            values = values[np.isfinite(values)]
+            if not values.size:
+                return
+            lo, hi = float(values.min()), float(values.max())
+        self._fit(lo, hi)
+        # Scaling by a power of two is exact
+        scaled = values * math.ldexp(1.0, -cast(int, self.exponent))
+        self._add(np.floor(scaled, out=scaled).astype(np.int64))
+
+    def merge(self, other: '_Sketch') -> None:
+        """
+        Add the counts from another sketch to this one.
+
+        :param other: the sketch to merge.
+        """
+        if other.exponent is None or not len(other.counts):
+            return
+        width = math.ldexp(1.0, other.exponent)
+        self._fit(other.base * width, (other.base + len(other.counts)) * width)
+        other = other.copy()
+        other._rebin(cast(int, self.exponent))
+        self._add(other.base + np.arange(len(other.counts), dtype=np.int64), other.counts)
+
+    def copy(self) -> '_Sketch':
+        result = _Sketch()
+        result.exponent = self.exponent
+        result.base = self.base
+        result.counts = self.counts.copy()
+        return result
+
+    def values(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the lower edge of each fine bin that has values and the number of
+        values in it.
+
+        :returns: an array of values and an array of counts.
+        """
+        if self.exponent is None:
+            return np.zeros(0), np.zeros(0, dtype=np.int64)
+        used = np.nonzero(self.counts)[0]
+        return ((self.base + used) * math.ldexp(1.0, self.exponent),
+                self.counts[used])
+
+
+class HistogramAccumulator:
+    """
+    Accumulate per-band statistics and histograms of tiles in a single pass.
+    Accumulators for different tiles, frames, or workers can be merged.
+
+    8- and 16-bit integer data is counted exactly for every possible value, so
+    the histogram can be computed for any range once all tiles have been
+    added.  If a range is specified, other data is binned directly as each
+    tile is added.  Otherwise, other data is counted in a sketch of up to
+    SketchBins fine bins per band, which is rebinned to the requested bins
+    when the result is computed.  In that case, values within one fine bin of
+    a bin edge may be counted in the neighboring bin.
+    """
+
+    def __init__(
+            self, bins: int = 256,
+            histRange: Optional[Union[str, Tuple[float, float], List[float]]] = None,
+            onlyMinMax: bool = False, dtype: npt.DTypeLike = None) -> None:
+        """
+        Create an accumulator.
+
+        :param bins: the number of bins in the histogram.
+        :param histRange: None to use the range of the data, 'round' to use
+            the range of the data but round the bins for integer data, or a
+            range to pass to numpy.histogram.
+        :param onlyMinMax: if True, only collect statistics, not histograms.
+        :param dtype: if specified, tiles that are not this numpy.dtype are
+            skipped, except that uint8 tiles are scaled to uint16 if that is
+            the dtype.
+        """
+        self.bins = bins
+        self.histRange = histRange
+        self.onlyMinMax = onlyMinMax
+        self.requiredDtype = dtype
+        self.dtype: Optional[np.dtype] = None
+        self.bands = 0
+        self.count = 0
+        self.min: Optional[np.ndarray] = None
+        self.max: Optional[np.ndarray] = None
+        self.sum: Optional[np.ndarray] = None
+        self.sum2: Optional[np.ndarray] = None
+        self.exact: Optional[np.ndarray] = None
+        self.sketches: Optional[List[_Sketch]] = None
+        self.hist: Optional[List[np.ndarray]] = None
+        self.binEdges: Optional[List[np.ndarray]] = None
+
+    @property
+    def _fixedRange(self) -> bool:
+        return self.histRange is not None and not isinstance(self.histRange, str)
+
+    def _start(self, dtype: np.dtype, bands: int) -> None:
+        self.dtype = dtype
+        self.bands = bands
+        domain = _exactDomain(dtype)
+        if domain is not None:
+            self.exact = np.zeros((bands, domain[1]), dtype=np.int64)
+            return
+        self.min = np.zeros(0, dtype=dtype)
+        self.max = np.zeros(0, dtype=dtype)
+        self.sum = np.zeros(bands, dtype=float)
+        self.sum2 = np.zeros(bands, dtype=float)
+        if self.onlyMinMax:
+            return
+        if self._fixedRange:
+            self.hist = [None] * bands  # type: ignore[list-item]
+            self.binEdges = [None] * bands  # type: ignore[list-item]
+        else:
+            self.sketches = [_Sketch() for _ in range(bands)]
+
+    def add(self, tile: np.ndarray) -> None:
+        """
+        Add the values of a tile.
+
+        :param tile: a numpy array of y, x, bands.  After the first tile, the
+            tile is converted to the data type and truncated to the number of
+            bands of the first tile.
+        """
+        if self.requiredDtype is not None and tile.dtype != self.requiredDtype:
+            if tile.dtype == np.uint8 and self.requiredDtype == np.uint16:
+                tile = np.array(tile, dtype=np.uint16) * 257
+            else:
+                return
+        if not tile.shape[0] or not tile.shape[1]:
+            return
+        if len(tile.shape) == 2:
+            tile = tile[:, :, np.newaxis]
+        if self.dtype is None:
+            self._start(tile.dtype, tile.shape[2])
+        if tile.dtype != self.dtype:
+            tile = tile.astype(self.dtype)
+        flat = tile[:, :, :self.bands].reshape(-1, self.bands)
+        self.count += flat.shape[0]
+        if self.exact is not None:
+            domain = _exactDomain(cast(np.dtype, self.dtype))
+            offset = np.arange(self.bands, dtype=np.intp) * domain[1] - domain[0]  # type: ignore
+            self.exact += np.bincount(
+                (flat.astype(np.intp) + offset).ravel(),
+                minlength=self.exact.size).reshape(self.exact.shape)
+            return
+        # Reducing along contiguous rows is much faster than along columns
+        planes = np.ascontiguousarray(flat.T)
+        tilemin = planes.min(axis=1)
+        tilemax = planes.max(axis=1)
+        self.min = tilemin if not len(self.min) else np.minimum(  # type: ignore
+            self.min, tilemin)
+        self.max = tilemax if not len(self.max) else np.maximum(  # type: ignore
+            self.max, tilemax)
+        values = planes.astype(np.float64)
+        self.sum += values.sum(axis=1)
+        self.sum2 += np.einsum('ij,ij->i', values, values)
+        if self.sketches is not None:
+            for idx, sketch in enumerate(self.sketches):
+                sketch.add(values[idx], float(tilemin[idx]), float(tilemax[idx]))
+        elif self.hist is not None:
+            for idx in range(self.bands):
+                hist, binEdges = np.histogram(
+                    planes[idx], self.bins, self.histRange, density=False)
+                if self.hist[idx] is None:
+                    self.hist[idx] = hist
+                    self.binEdges[idx] = binEdges  # type: ignore
+                else:
+                    self.hist[idx] += hist
+
+    def merge(self, other: 'HistogramAccumulator') -> None:
+        """
+        Add the values accumulated by another accumulator with the same bins
+        and range.
+
+        :param other: the accumulator to merge into this one.
+        """
+        if other.dtype is None:
+            return
+        if self.dtype is None:
+            self._start(other.dtype, other.bands)
+        if self.dtype != other.dtype or self.bands != other.bands:
+            msg = 'Cannot merge histograms of data with a different type or number of bands.'
+            raise ValueError(msg)
+        self.count += other.count
+        if self.exact is not None:
+            self.exact += other.exact  # type: ignore[operator]
+            return
+        if len(other.min):  # type: ignore[arg-type]
+            self.min = other.min.copy() if not len(self.min) else np.minimum(  # type: ignore
+                self.min, other.min)
+            self.max = other.max.copy() if not len(self.max) else np.maximum(  # type: ignore
+                self.max, other.max)
+        self.sum += other.sum  # type: ignore
+        self.sum2 += other.sum2  # type: ignore
+        if self.sketches is not None and other.sketches is not None:
+            for sketch, otherSketch in zip(self.sketches, other.sketches):
+                sketch.merge(otherSketch)
+        elif self.hist is not None and other.hist is not None:
+            for idx in range(self.bands):
+                if other.hist[idx] is None:
+                    continue
+                if self.hist[idx] is None:
+                    self.hist[idx] = other.hist[idx].copy()
+                    self.binEdges[idx] = other.binEdges[idx]  # type: ignore
+                else:
+                    self.hist[idx] += other.hist[idx]
+
+    def _bandValues(self, idx: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Get the distinct values (or fine bins) of a band and their counts.
+
+        :param idx: the band index.
+        :returns: an array of values and an array of counts.
+        """
+        if self.exact is not None:
+            domain = _exactDomain(cast(np.dtype, self.dtype))
+            used = np.nonzero(self.exact[idx])[0]
+            return (used + domain[0]).astype(self.dtype), self.exact[idx][used]  # type: ignore
+        values, counts = self.sketches[idx].values()  # type: ignore[index]
+        # The lowest fine bin can start below the minimum value
+        values = np.clip(values, self.min[idx], self.max[idx])  # type: ignore[index]
+        return values.astype(self.dtype), counts
+
+    def _statistics(self) -> Dict[str, Any]:
+        if self.exact is not None:
+            mins, maxs, sums, sum2s = [], [], [], []
+            for idx in range(self.bands):
+                values, counts = self._bandValues(idx)
+                mins.append(values[0])
+                maxs.append(values[-1])
+                fvalues = values.astype(float)
+                sums.append(np.dot(fvalues, counts))
+                sum2s.append(np.dot(fvalues * fvalues, counts))
+            return {
+                'min': np.array(mins, self.dtype),
+                'max': np.array(maxs, self.dtype),
+                'sum': np.array(sums, float),
+                'sum2': np.array(sum2s, float),
+            }
+        return {'min': self.min, 'max': self.max, 'sum': self.sum, 'sum2': self.sum2}
+
+    def result(
+            self, density: bool = False,
+            integerRound: Optional[bool] = None) -> Dict[str, Any]:
+        """
+        Compute the statistics and histograms of all values added.
+
+        :param density: if True, scale the histograms based on the number of
+            samples.
+        :param integerRound: if the range is 'round', round the bins if this
+            is True.  If None, round the bins for integer data.
+        :returns: an empty dictionary if no values were added.  Otherwise, a
+            dictionary with min, max, mean, and stdev, each of which is an
+            array with a value per band.  Unless onlyMinMax was set, this also
+            has 'histogram' with a list of histograms per band.  Each entry is
+            a dictionary with min, max, mean, stdev, range, hist, bins,
+            bin_edges, density, and samples.
+        """
+        if self.dtype is None or not self.count:
+            return {}
+        results = self._statistics()
+        results['mean'] = results['sum'] / self.count
+        results['stdev'] = np.maximum(
+            results['sum2'] / self.count - results['mean'] ** 2,
+            [0] * results['sum2'].shape[0]) ** 0.5
+        results.pop('sum', None)
+        results.pop('sum2', None)
+        if self.onlyMinMax:
+            return results
+        histRange = self.histRange
+        bins = self.bins
+        results['histogram'] = [{
+            'min': results['min'][idx],
+            'max': results['max'][idx],
+            'mean': results['mean'][idx],
+            'stdev': results['stdev'][idx],
+            'range': ((results['min'][idx], results['max'][idx] + 1)
+                      if histRange is None or histRange == 'round' else histRange),
+            'hist': None,
+            'bin_edges': None,
+            'bins': bins,
+            'density': bool(density),
+        } for idx in range(self.bands)]
+        if integerRound is None:
+            integerRound = np.issubdtype(self.dtype, np.integer)
+        if histRange == 'round' and integerRound:
+            for record in results['histogram']:
+                if (record['range'][1] - record['range'][0]) < bins * 10:
+                    step = int(math.ceil((record['range'][1] - record['range'][0]) / bins))
+                    rbins = int(math.ceil((record['range'][1] - record['range'][0]) / step))
+                    record['range'] = (record['range'][0], record['range'][0] + step * rbins)
+                    record['bins'] = rbins
+        for idx, entry in enumerate(results['histogram']):
+            if self.hist is not None:
+                entry['hist'] = self.hist[idx]
+                entry['bin_edges'] = self.binEdges[idx]  # type: ignore[index]
+            else:
+                values, counts = self._bandValues(idx)
+                entry['hist'], entry['bin_edges'] = np.histogram(
+                    values, entry['bins'], entry['range'], weights=counts, density=False)
+            if entry['hist'] is not None:
+                entry['samples'] = np.sum(entry['hist'])
+                if density:
+                    entry['hist'] = entry['hist'].astype(float) / entry['samples']
+        return results
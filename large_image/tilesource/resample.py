@@ -1,5 +1,5 @@
 from enum import Enum
-from typing import Dict
+from typing import Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 from PIL import Image
@@ -38,65 +38,154 @@ def pilResize(
     return result
 
 
+def _blockSelect(
+        selection: np.ndarray, choices: Tuple[np.ndarray, ...]) -> np.ndarray:
+    """
+    Pick one of several arrays for each pixel.
+
+    :param selection: a two-dimensional array of indices into choices.
+    :param choices: arrays of shape (height, width, bands).
+    :returns: an array with the selected value of each pixel.
+    """
+    result = np.empty(choices[0].shape, dtype=choices[0].dtype)
+    for index, choice in enumerate(choices):
+        np.copyto(result, choice, where=(selection == index)[:, :, np.newaxis])
+    return result
+
+
+def _pixelsEqual(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+    """
+    Check which pixels of two images have the same value in every band.
+
+    :param first: an array of shape (height, width, bands).
+    :param second: an array of the same shape.
+    :returns: a two-dimensional boolean array.
+    """
+    equal = first[:, :, 0] == second[:, :, 0]
+    for band in range(1, first.shape[2]):
+        equal &= first[:, :, band] == second[:, :, band]
+    return equal
+
+
+def _halveTile(tile: np.ndarray, resample_method: ResampleMethod) -> np.ndarray:
+    """
+    Reduce a tile by a factor of two with one of the numpy resample methods.
+    Each output pixel is computed from a 2x2 block of input pixels; the
+    blocks are views of the tile, so no stacked copies are made.  Tiles with
+    an odd size are padded by repeating the last row or column.
+
+    :param tile: a numpy array of shape (height, width) or (height, width,
+        bands).
+    :param resample_method: a numpy ResampleMethod.
+    :returns: the reduced tile with the same dtype.
+    """
+    if resample_method == ResampleMethod.NP_NEAREST:
+        return tile[::2, ::2]
+    squeeze = len(tile.shape) == 2
+    if squeeze:
+        tile = tile[:, :, np.newaxis]
+    if tile.shape[0] % 2 or tile.shape[1] % 2:
+        tile = np.pad(
+            tile, ((0, tile.shape[0] % 2), (0, tile.shape[1] % 2), (0, 0)), mode='edge')
+    blocks = tile.reshape(tile.shape[0] // 2, 2, tile.shape[1] // 2, 2, tile.shape[2])
+    # In the same order as stacking tile[0::2, 0::2], tile[1::2, 0::2],
+    # tile[0::2, 1::2], and tile[1::2, 1::2]
+    views = (blocks[:, 0, :, 0], blocks[:, 1, :, 0], blocks[:, 0, :, 1], blocks[:, 1, :, 1])
+    # Small unsigned integers are averaged exactly with integer arithmetic;
+    # truncating the mean is the same as a floor division.
+    exact = tile.dtype.kind == 'u' and tile.dtype.itemsize <= 2
+    workType = (np.uint32 if exact else
+                tile.dtype if tile.dtype.kind == 'f' else np.float64)
+    if resample_method == ResampleMethod.NP_MEAN:
+        total = views[0].astype(workType)
+        for view in views[1:]:
+            total += view
+        result = total // 4 if exact else total / 4
+    elif resample_method == ResampleMethod.NP_MEDIAN:
+        # The median of four values is the mean of the middle two, which are
+        # the larger of the pairwise minimums and the smaller of the pairwise
+        # maximums
+        total = np.maximum(
+            np.minimum(views[0], views[1]), np.minimum(views[2], views[3])).astype(workType)
+        total += np.minimum(np.maximum(views[0], views[1]), np.maximum(views[2], views[3]))
+        result = total // 2 if exact else total / 2
+    elif resample_method in {ResampleMethod.NP_MAX, ResampleMethod.NP_MIN}:
+        func = np.maximum if resample_method == ResampleMethod.NP_MAX else np.minimum
+        result = func(func(views[0], views[1]), func(views[2], views[3]))
+    elif resample_method == ResampleMethod.NP_MODE:
+        # if a pixel occurs twice in a set of four, it is a mode
+        # if no mode, default to pixel 0. check for minimal matches 1=2, 1=3, 2=3
+        selection = np.where(
+            _pixelsEqual(views[1], views[2]) | _pixelsEqual(views[1], views[3]),
+            1, np.where(_pixelsEqual(views[2], views[3]), 2, 0))
+        result = _blockSelect(selection, views)
+    elif resample_method in {ResampleMethod.NP_MAX_COLOR, ResampleMethod.NP_MIN_COLOR}:
+        # Pick the first pixel with the largest or smallest sum of bands
+        # Adding bands one at a time is much faster than summing along the
+        # last axis
+        summed = tile[:, :, 0].astype(np.zeros(0, dtype=tile.dtype).sum().dtype)
+        for band in range(1, tile.shape[2]):
+            summed += tile[:, :, band]
+        summed = summed.reshape(tile.shape[0] // 2, 2, tile.shape[1] // 2, 2)
+        sums = [summed[:, 0, :, 0], summed[:, 1, :, 0], summed[:, 0, :, 1], summed[:, 1, :, 1]]
+        best = sums[0]
+        selection = np.zeros(best.shape, dtype=np.uint8)
+        for index in range(1, len(sums)):
+            better = (sums[index] > best if resample_method == ResampleMethod.NP_MAX_COLOR
+                      else sums[index] < best)
+            selection[better] = index
+            best = np.where(better, sums[index], best)
+        result = _blockSelect(selection, views)
+    else:
+        msg = f'Unknown resample method {resample_method}.'
+        raise ValueError(msg)
+    result = result.astype(tile.dtype, copy=False)
+    return result[:, :, 0] if squeeze else result
+
+
 def numpyResize(
     tile: np.ndarray,
     new_shape: Dict,
     resample_method: ResampleMethod,
 ) -> np.ndarray:
-    if resample_method == ResampleMethod.NP_NEAREST:
-        return tile[::2, ::2]
-    else:
-        if tile.shape[0] % 2 != 0:
-            tile = np.append(tile, np.expand_dims(tile[-1], axis=0), axis=0)
-        if tile.shape[1] % 2 != 0:
-            tile = np.append(tile, np.expand_dims(tile[:, -1], axis=1), axis=1)
-
-        pixel_selection = None
-        subarrays = np.asarray(
-            [
-                tile[0::2, 0::2],
-                tile[1::2, 0::2],
-                tile[0::2, 1::2],
-                tile[1::2, 1::2],
-            ],
-        )
-
-        if resample_method == ResampleMethod.NP_MEAN:
-            return np.mean(subarrays, axis=0).astype(tile.dtype)
-        elif resample_method == ResampleMethod.NP_MEDIAN:
-            return np.median(subarrays, axis=0).astype(tile.dtype)
-        elif resample_method == ResampleMethod.NP_MAX:
-            return np.max(subarrays, axis=0).astype(tile.dtype)
-        elif resample_method == ResampleMethod.NP_MIN:
-            return np.min(subarrays, axis=0).astype(tile.dtype)
-        elif resample_method == ResampleMethod.NP_MAX_COLOR:
-            summed = np.sum(subarrays, axis=3)
-            pixel_selection = np.argmax(summed, axis=0)
-        elif resample_method == ResampleMethod.NP_MIN_COLOR:
-            summed = np.sum(subarrays, axis=3)
-            pixel_selection = np.argmin(summed, axis=0)
-        elif resample_method == ResampleMethod.NP_MODE:
-            # if a pixel occurs twice in a set of four, it is a mode
-            # if no mode, default to pixel 0. check for minimal matches 1=2, 1=3, 2=3
-            pixel_selection = np.where(
-                (
-                    (subarrays[1] == subarrays[2]).all(axis=2) |
-                    (subarrays[1] == subarrays[3]).all(axis=2)
-                ),
-                1, np.where(
-                    (subarrays[2] == subarrays[3]).all(axis=2),
-                    2, 0,
-                ),
-            )
+    return _halveTile(tile, resample_method)
 
-        if pixel_selection is not None:
-            if len(tile.shape) > 2:
-                pixel_selection = np.expand_dims(pixel_selection, axis=2)
-                pixel_selection = np.repeat(pixel_selection, tile.shape[2], axis=2)
-            return np.choose(pixel_selection, subarrays).astype(tile.dtype)
-        else:
-            msg = f'Unknown resample method {resample_method}.'
-            raise ValueError(msg)
+
+def downsampleTileLevels(
+        tile: np.ndarray, resample_method: ResampleMethod, levels: int,
+        limits: Optional[List[Tuple[int, int]]] = None) -> List[np.ndarray]:
+    """
+    Reduce a tile by successive factors of two with one of the numpy resample
+    methods, producing several pyramid levels in one pass.  Each level is
+    computed from the previous one, so the results are the same as halving
+    the tile repeatedly.  A tile whose position and size (other than at the
+    right and bottom of the image) are multiples of 2 ** levels produces
+    whole tiles of each reduced level.
+
+    :param tile: a numpy array of shape (height, width) or (height, width,
+        bands).
+    :param resample_method: a numpy ResampleMethod.
+    :param levels: the number of times to halve the tile.
+    :param limits: if not None, a list with the maximum (height, width) of
+        each reduced level that is used when reducing it further.  If a limit
+        leaves no data, no further levels are produced.
+    :returns: a list of up to levels tiles, each half the size of the one
+        before.
+    """
+    if resample_method.value <= ResampleMethod.PIL_MAX_ENUM.value:
+        msg = f'Resample method {resample_method} is not a numpy method.'
+        raise ValueError(msg)
+    results: List[np.ndarray] = []
+    for _ in range(levels):
+        if results:
+            tile = results[-1]
+            if limits is not None:
+                height, width = limits[len(results) - 1]
+                tile = tile[:max(0, height), :max(0, width)]
+            if not tile.shape[0] or not tile.shape[1]:
+                break
+        results.append(_halveTile(tile, resample_method))
+    return results
 
 
 def downsampleTileHalfRes(
@@ -127,3 +216,197 @@ def downsampleTileHalfRes(
             return pilResize(tile, new_shape, resample_method)
     else:
         return numpyResize(tile, new_shape, resample_method)
+
+
+def _boxFilter(x: np.ndarray) -> np.ndarray:
+    return ((x > -0.5) & (x <= 0.5)).astype(np.float64)
+
+
+def _triangleFilter(x: np.ndarray) -> np.ndarray:
+    return np.maximum(1.0 - np.abs(x), 0.0)
+
+
+def _bicubicFilter(x: np.ndarray) -> np.ndarray:
+    a = -0.5
+    x = np.abs(x)
+    return np.where(
+        x < 1, ((a + 2) * x - (a + 3)) * x * x + 1,
+        np.where(x < 2, (((x - 5) * x + 8) * x - 4) * a, 0.0))
+
+
+def _lanczosFilter(x: np.ndarray) -> np.ndarray:
+    return np.where(np.abs(x) < 3, np.sinc(x) * np.sinc(x / 3), 0.0)
+
+
+# The support and function of each filter.  These match the filters PIL uses
+# for the same names.
+_ResizeFilters: Dict[str, Tuple[float, Callable[[np.ndarray], np.ndarray]]] = {
+    'area': (0.5, _boxFilter),
+    'bilinear': (1.0, _triangleFilter),
+    'bicubic': (2.0, _bicubicFilter),
+    'lanczos': (3.0, _lanczosFilter),
+}
+
+# The number of output pixels along an axis computed in one matrix product
+_ResizeBlock = 64
+
+# PIL resampling filters and the equivalent resizeArray methods
+_PILResizeMethods = {
+    Image.Resampling.NEAREST: 'nearest',
+    Image.Resampling.BOX: 'area',
+    Image.Resampling.BILINEAR: 'bilinear',
+    Image.Resampling.BICUBIC: 'bicubic',
+    Image.Resampling.LANCZOS: 'lanczos',
+}
+
+
+def resizeMethod(resample: Union[bool, int, str, None]) -> Optional[str]:
+    """
+    Get the resizeArray method that is equivalent to a resample value used by
+    the tile iterator.
+
+    :param resample: True for the default (lanczos), a PIL resampling
+        filter, or a resizeArray method name.
+    :returns: a method name or None if there is no equivalent.
+    """
+    if resample is True:
+        return 'lanczos'
+    if isinstance(resample, str):
+        return resample if resample == 'nearest' or resample in _ResizeFilters else None
+    try:
+        return _PILResizeMethods.get(Image.Resampling(resample))
+    except (TypeError, ValueError):
+        return None
+
+
+def _axisWeights(
+        inSize: int, outSize: int, method: str) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Compute the source indices and weights used to resize one axis.  When
+    reducing, the filter is widened by the reduction factor so that every
+    source pixel contributes to the result.
+
+    :param inSize: the length of the axis in the source.
+    :param outSize: the length of the axis in the result.
+    :param method: one of the keys of _ResizeFilters.
+    :returns: two arrays of shape (outSize, taps): the source index and the
+        normalized weight of each tap.
+    """
+    support, func = _ResizeFilters[method]
+    scale = inSize / outSize
+    filterScale = max(scale, 1.0)
+    support *= filterScale
+    centers = (np.arange(outSize) + 0.5) * scale
+    first = np.maximum((centers - support + 0.5).astype(int), 0)
+    last = np.minimum((centers + support + 0.5).astype(int), inSize)
+    taps = max(1, int((last - first).max()))
+    indices = first[:, np.newaxis] + np.arange(taps)
+    weights = func((indices - centers[:, np.newaxis] + 0.5) / filterScale)
+    weights[indices >= last[:, np.newaxis]] = 0
+    total = weights.sum(axis=1, keepdims=True)
+    weights /= np.where(total != 0, total, 1)
+    return np.minimum(indices, inSize - 1), weights
+
+
+def _resizeBlocks(
+        flat: np.ndarray, indices: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Resize the first axis of an array using a matrix product for each block
+    of output pixels.  This is fast, but a non-finite source value spreads to
+    every output pixel of the blocks that use it.
+
+    :param flat: a two dimensional array to resize along its first axis.
+    :param indices: the source index of each tap from _axisWeights.
+    :param weights: the weight of each tap from _axisWeights.
+    :returns: the resized array.
+    """
+    outSize = indices.shape[0]
+    resized = np.empty((outSize, flat.shape[1]), dtype=flat.dtype)
+    # Each block of output pixels is a matrix product of its weights and
+    # the span of source pixels that it uses
+    for block in range(0, outSize, _ResizeBlock):
+        blockIndices = indices[block:block + _ResizeBlock]
+        low = int(blockIndices.min())
+        matrix = np.zeros(
+            (blockIndices.shape[0], int(blockIndices.max()) + 1 - low), dtype=flat.dtype)
+        np.add.at(
+            matrix, (np.arange(blockIndices.shape[0])[:, np.newaxis], blockIndices - low),
+            weights[block:block + _ResizeBlock])
+        np.matmul(
+            matrix, flat[low:low + matrix.shape[1]],
+            out=resized[block:block + _ResizeBlock])
+    return resized
+
+
+def _resizeTaps(
+        flat: np.ndarray, indices: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """
+    Resize the first axis of an array by summing the weighted taps of each
+    output pixel.  This is slower than _resizeBlocks, but a non-finite source
+    value only affects the output pixels whose filter covers it.
+
+    :param flat: a two dimensional array to resize along its first axis.
+    :param indices: the source index of each tap from _axisWeights.
+    :param weights: the weight of each tap from _axisWeights.
+    :returns: the resized array.
+    """
+    resized = np.zeros((indices.shape[0], flat.shape[1]), dtype=flat.dtype)
+    for tap in range(indices.shape[1]):
+        tapWeights = weights[:, tap, np.newaxis].astype(flat.dtype)
+        # Taps past the end of a filter have no weight and may repeat the
+        # last source pixel, so they are skipped
+        used = tapWeights[:, 0] != 0
+        if used.all():
+            resized += tapWeights * flat[indices[:, tap]]
+        elif used.any():
+            resized[used] += tapWeights[used] * flat[indices[used, tap]]
+    return resized
+
+
+def resizeArray(
+        image: np.ndarray, width: int, height: int,
+        method: str = 'lanczos') -> np.ndarray:
+    """
+    Resize an image with numpy.  This works with any data type and number of
+    bands and matches PIL's results for 8-bit images to within rounding.
+    Integer results are rounded and clipped to the range of the data type.
+    Non-finite values, such as NaN, only affect the output pixels whose
+    filter covers them.
+
+    :param image: a numpy array of shape (height, width) or (height, width,
+        bands).
+    :param width: the width of the result.
+    :param height: the height of the result.
+    :param method: one of 'nearest', 'area', 'bilinear', 'bicubic', or
+        'lanczos'.  'nearest' uses the pixel at the top-left of the area that
+        each output pixel covers.
+    :returns: the resized image with the same data type and bands.
+    """
+    if method != 'nearest' and method not in _ResizeFilters:
+        msg = f'Unknown resize method {method}.'
+        raise ValueError(msg)
+    inHeight, inWidth = image.shape[:2]
+    if method == 'nearest':
+        rows = (np.arange(height) * inHeight / height).astype(int)
+        cols = (np.arange(width) * inWidth / width).astype(int)
+        return np.take(np.take(image, rows, axis=0), cols, axis=1)
+    dtype = image.dtype
+    workType = np.float64 if dtype.itemsize > 2 and dtype != np.float32 else np.float32
+    result = image.astype(workType)
+    for axis, inSize, outSize in ((0, inHeight, height), (1, inWidth, width)):
+        if inSize == outSize:
+            continue
+        indices, weights = _axisWeights(inSize, outSize, method)
+        source = np.moveaxis(result, axis, 0)
+        flat = source.reshape(inSize, -1)
+        if dtype.kind == 'f' and not np.isfinite(flat).all():
+            resized = _resizeTaps(flat, indices, weights)
+        else:
+            resized = _resizeBlocks(flat, indices, weights)
+        result = np.moveaxis(resized.reshape((outSize, ) + source.shape[1:]), 0, axis)
+    if dtype.kind in {'u', 'i'}:
+        info = np.iinfo(dtype)
+        result = np.clip(np.rint(result), info.min, info.max)
+    elif dtype.kind == 'b':
+        result = result >= 0.5
+    return result.astype(dtype, copy=False)
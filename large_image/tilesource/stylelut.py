@@ -0,0 +1,117 @@
+from typing import Any, Optional
+
+import numpy as np
+import numpy.typing as npt
+
+
+class StyleBandLUT:
+    """
+    A style band entry compiled to lookup tables for integer data.  For uint8
+    and uint16 bands, the contribution of a band to each output channel is a
+    fixed function of the pixel value, so it is computed once for every
+    possible value.  Applying the entry is then a single take from the table
+    and a composite with the output.  The results are the same as evaluating
+    the style for each pixel.
+    """
+
+    # The largest possible size of the table in bytes: a double precision
+    # table for uint16 values with four channels.
+    maxBytes = 65536 * 4 * 8
+
+    def __init__(
+            self, palette: np.ndarray, minimum: float, maximum: float,
+            nodata: Optional[Any] = None, clamp: bool = True,
+            discrete: bool = False, composite: str = 'lighten',
+            first: bool = True, channels: int = 4,
+            dtype: npt.DTypeLike = np.uint8) -> None:
+        """
+        Compile a style band entry.
+
+        :param palette: an array of palette colors as returned by
+            getPaletteColors.
+        :param minimum: the band value that maps to the start of the palette.
+        :param maximum: the band value that maps to the end of the palette.
+        :param nodata: if not None, band values equal to this are not
+            composited.
+        :param clamp: if False, band values outside of [minimum, maximum] are
+            not composited.
+        :param discrete: if True, the palette is used as discrete steps rather
+            than interpolated.
+        :param composite: either 'multiply' or 'lighten'.
+        :param first: True if this is the first band entry of the style.  The
+            first lighten entry replaces the output rather than combining with
+            it, and a first multiply entry has no effect.
+        :param channels: the number of channels in the output.
+        :param dtype: the dtype of the band.  This must be uint8 or uint16.
+        """
+        self.palette = palette
+        self.min = minimum
+        self.max = maximum
+        self.nodata = nodata
+        self.clamp = clamp
+        self.discrete = discrete
+        self.composite = composite
+        self.first = first
+        values = np.arange(np.iinfo(dtype).max + 1)
+        delta = maximum - minimum if maximum != minimum else 1
+        scaled = (values - minimum) / delta
+        mask = (values != float(nodata) if nodata is not None else
+                np.full(values.shape, True))
+        if not clamp:
+            mask &= (scaled >= 0) & (scaled <= 1)
+        palettebase = np.linspace(0, 1, len(palette), endpoint=True)
+        # Channels that the entry doesn't change get a value that leaves the
+        # output unchanged; outputs are never negative, so 0 is neutral for
+        # lighten.
+        neutral = 1 if composite == 'multiply' else 0
+        columns = [np.full(values.shape, neutral, dtype=scaled.dtype)] * channels
+        used = False
+        if composite != 'multiply' or not first:
+            for channel in range(channels):
+                if np.all(palette[:, channel] == palette[0, channel]):
+                    if ((palette[0, channel] == 0 and composite != 'multiply') or
+                            (palette[0, channel] == 255 and composite == 'multiply')):
+                        continue
+                    clrs = np.full(scaled.shape, palette[0, channel], dtype=scaled.dtype)
+                elif not discrete:
+                    clrs = np.interp(scaled, palettebase, palette[:, channel])
+                else:
+                    clrs = palette[
+                        np.floor(scaled * len(palette)).astype(int).clip(
+                            0, len(palette) - 1), channel]
+                if composite == 'multiply':
+                    columns[channel] = np.where(mask, clrs / 255, 1)
+                else:
+                    columns[channel] = np.where(mask, clrs, 0)
+                used = True
+        # Multiplication must be done at double precision to match evaluating
+        # the style directly; lighten only compares and stores values, so the
+        # output's precision is sufficient.
+        self.table: Optional[np.ndarray] = None
+        if used:
+            self.table = np.stack(columns, axis=1).astype(
+                np.float64 if composite == 'multiply' else np.float32)
+
+    @property
+    def nbytes(self) -> int:
+        return self.table.nbytes if self.table is not None else 0
+
+    def apply(self, output: np.ndarray, band: np.ndarray) -> None:
+        """
+        Composite a band with an output image in place.
+
+        :param output: a float32 output image with the number of channels
+            this was compiled for.  It can be larger than the band.
+        :param band: a two dimensional band of the dtype this was compiled
+            for.
+        """
+        if self.table is None:
+            return
+        values = np.take(self.table, band, axis=0)
+        region = output[:band.shape[0], :band.shape[1]]
+        if self.composite == 'multiply':
+            region[:] = region * values
+        elif self.first:
+            region[:] = values
+        else:
+            np.maximum(region, values, out=region)
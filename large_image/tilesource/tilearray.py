@@ -0,0 +1,247 @@
+import math
+from typing import TYPE_CHECKING, Any, List, Optional, Tuple, Union
+
+import numpy as np
+
+from .utilities import _imageToNumpy
+
+if TYPE_CHECKING:
+    from .. import tilesource
+
+
+def _asSlice(positions: np.ndarray) -> Union[slice, np.ndarray]:
+    """
+    Convert an array of positions to a slice if they are evenly spaced and
+    increasing, since slicing is much faster than indexing with an array.
+
+    :param positions: a one-dimensional array of positions.
+    :returns: a slice or the array of positions.
+    """
+    if len(positions) == 1:
+        return slice(int(positions[0]), int(positions[0]) + 1)
+    step = int(positions[1] - positions[0])
+    if step > 0 and np.all(np.diff(positions) == step):
+        return slice(int(positions[0]), int(positions[-1]) + 1, step)
+    return positions
+
+
+def _gridIndex(
+        rows: np.ndarray, cols: np.ndarray) -> Tuple[Union[slice, np.ndarray], ...]:
+    """
+    Get an index that selects the pixels at every combination of some rows
+    and columns.
+
+    :param rows: a one-dimensional array of rows.
+    :param cols: a one-dimensional array of columns.
+    :returns: a tuple to index the first two axes of an array.
+    """
+    rowIndex = _asSlice(rows)
+    colIndex = _asSlice(cols)
+    if not isinstance(rowIndex, slice) and not isinstance(colIndex, slice):
+        rowIndex = rowIndex[:, np.newaxis]
+    return rowIndex, colIndex
+
+
+class TileArray:
+    """
+    A lazily evaluated, read-only array view of one level of a tile source.
+    The array has axes (y, x, bands), or (frames, y, x, bands) if it spans
+    several frames.  Nothing is read until the array is indexed; indexing
+    with integers and slices only reads the tiles that contain the selected
+    pixels and returns a numpy array.  Integer arrays index each axis
+    independently (orthogonal indexing, as in dask and zarr's oindex), so
+    ``arr[[1, 3], [2, 4]]`` is a 2x2 selection rather than two pixels.
+
+    The array is chunked by the source's native tiles, which are listed in
+    the dask-style `chunks` attribute, so it can be passed to
+    ``dask.array.from_array(tileArray, chunks=tileArray.chunks)`` for
+    parallel, out-of-core computation.
+    """
+
+    def __init__(
+            self, source: 'tilesource.TileSource', level: Optional[int] = None,
+            frame: Optional[int] = None, frames: Optional[List[int]] = None) -> None:
+        """
+        Create an array view of a tile source.
+
+        :param source: the tile source.
+        :param level: the level of the source to use.  None is the maximum
+            resolution level.
+        :param frame: the frame to use.  Ignored if frames is specified.
+        :param frames: if not None, a list of frames.  The array has a leading
+            axis with one entry per frame.
+        """
+        self.source = source
+        self.level = source.levels - 1 if level is None else int(level)
+        if self.level < 0 or self.level >= source.levels:
+            msg = f'Level {level} does not exist.'
+            raise ValueError(msg)
+        self.frame = frame
+        self.frames = [int(entry) for entry in frames] if frames is not None else None
+        self.tileWidth = source.tileWidth
+        self.tileHeight = source.tileHeight
+        scale = 2 ** (source.levels - 1 - self.level)
+        self.width = max(1, int(source.sizeX / scale))
+        self.height = max(1, int(source.sizeY / scale))
+        # The band count and dtype of the output (which depend on the style
+        # if there is one) are determined from a single tile
+        sample = self._getTile(0, 0, self.frames[0] if self.frames else frame)
+        self.bands = sample.shape[2]
+        self.dtype = sample.dtype
+        self.shape: Tuple[int, ...] = (self.height, self.width, self.bands)
+        self.chunks: Tuple[Tuple[int, ...], ...] = (
+            self._axisChunks(self.height, self.tileHeight),
+            self._axisChunks(self.width, self.tileWidth),
+            (self.bands, ))
+        if self.frames is not None:
+            self.shape = (len(self.frames), ) + self.shape
+            self.chunks = ((1, ) * len(self.frames), ) + self.chunks
+
+    @staticmethod
+    def _axisChunks(size: int, tileSize: int) -> Tuple[int, ...]:
+        return tuple(min(tileSize, size - start) for start in range(0, size, tileSize))
+
+    @property
+    def ndim(self) -> int:
+        return len(self.shape)
+
+    @property
+    def size(self) -> int:
+        return math.prod(self.shape)
+
+    @property
+    def nbytes(self) -> int:
+        return self.size * self.dtype.itemsize
+
+    def __len__(self) -> int:
+        return self.shape[0]
+
+    def __repr__(self) -> str:
+        return (f'TileArray<{self.source}: level {self.level}; shape {self.shape}; '
+                f'dtype {self.dtype}>')
+
+    def __array__(self, dtype: Any = None, copy: Any = None) -> np.ndarray:
+        result = self[...]
+        return result if dtype is None else result.astype(dtype, copy=False)
+
+    def _getTile(self, x: int, y: int, frame: Optional[int]) -> np.ndarray:
+        tile = self.source.getTile(
+            x, y, self.level, frame=frame, numpyAllowed='always', sparseFallback=True)
+        tile, _ = _imageToNumpy(tile)
+        return tile
+
+    def _normalizeKey(self, key: Any) -> List[Any]:
+        """
+        Expand an index to have one entry per axis.
+
+        :param key: an index as passed to __getitem__.
+        :returns: a list of indices, one per axis.
+        """
+        if not isinstance(key, tuple):
+            key = (key, )
+        if any(entry is None for entry in key):
+            msg = 'TileArray does not support adding axes with None.'
+            raise IndexError(msg)
+        ellipses = [pos for pos, entry in enumerate(key) if entry is Ellipsis]
+        if len(ellipses) > 1:
+            msg = 'An index can only have a single ellipsis.'
+            raise IndexError(msg)
+        if ellipses:
+            pos = ellipses[0]
+            key = (key[:pos] + (slice(None), ) * (self.ndim - len(key) + 1) +
+                   key[pos + 1:])
+        if len(key) > self.ndim:
+            msg = f'Too many indices for an array with {self.ndim} dimensions.'
+            raise IndexError(msg)
+        return list(key) + [slice(None)] * (self.ndim - len(key))
+
+    @staticmethod
+    def _axisIndices(index: Any, size: int) -> Tuple[np.ndarray, bool]:
+        """
+        Convert the index of one axis to a list of positions.
+
+        :param index: an integer, slice, or sequence of integers.
+        :param size: the length of the axis.
+        :returns: an array of positions and a boolean that is True if the
+            axis is removed from the result.
+        """
+        if isinstance(index, slice):
+            return np.arange(*index.indices(size)), False
+        if isinstance(index, (int, np.integer)):
+            if index < -size or index >= size:
+                msg = f'Index {index} is out of bounds for an axis of size {size}.'
+                raise IndexError(msg)
+            return np.array([index % size]), True
+        positions = np.asarray(index)
+        if positions.dtype == bool:
+            positions = np.nonzero(positions)[0]
+        if positions.ndim != 1 or positions.dtype.kind not in {'i', 'u'}:
+            msg = ('Only integers, slices, and one-dimensional integer or boolean '
+                   'arrays are valid indices.')
+            raise IndexError(msg)
+        if len(positions) and (positions.min() < -size or positions.max() >= size):
+            msg = f'Index is out of bounds for an axis of size {size}.'
+            raise IndexError(msg)
+        return positions % size, False
+
+    def __getitem__(self, key: Any) -> np.ndarray:
+        """
+        Read part of the array.  Only the tiles that contain selected pixels
+        are read.
+
+        :param key: an index of integers, slices, or one-dimensional integer
+            arrays for each axis.
+        :returns: a numpy array.
+        """
+        key = self._normalizeKey(key)
+        frameList: List[Optional[int]] = [self.frame]
+        dropFrames = True
+        if self.frames is not None:
+            frameIndices, dropFrames = self._axisIndices(key.pop(0), len(self.frames))
+            frameList = [self.frames[idx] for idx in frameIndices.tolist()]
+        rows, dropRows = self._axisIndices(key[0], self.height)
+        cols, dropCols = self._axisIndices(key[1], self.width)
+        region = self._readRegion(frameList, rows, cols)
+        region = region[:, :, :, key[2]]
+        if dropCols:
+            region = region[:, :, 0]
+        if dropRows:
+            region = region[:, 0]
+        if dropFrames:
+            region = region[0]
+        return region
+
+    def _readRegion(
+            self, frameList: List[Optional[int]], rows: np.ndarray,
+            cols: np.ndarray) -> np.ndarray:
+        """
+        Read the selected rows and columns of several frames.
+
+        :param frameList: a list of frames.
+        :param rows: an array of rows to read.
+        :param cols: an array of columns to read.
+        :returns: an array of shape (frames, rows, columns, bands).
+        """
+        result = np.zeros((len(frameList), len(rows), len(cols), self.bands), dtype=self.dtype)
+        if not result.size:
+            return result
+        rowTiles = rows // self.tileHeight
+        colTiles = cols // self.tileWidth
+        for ty in np.unique(rowTiles):
+            rowSel = np.nonzero(rowTiles == ty)[0]
+            tileRows = rows[rowSel] - ty * self.tileHeight
+            for tx in np.unique(colTiles):
+                colSel = np.nonzero(colTiles == tx)[0]
+                tileCols = cols[colSel] - tx * self.tileWidth
+                if len(frameList) > 1:
+                    tiles = self.source.getFrameTiles(
+                        int(tx), int(ty), self.level, frameList,
+                        numpyAllowed='always', sparseFallback=True)
+                for fidx, frame in enumerate(frameList):
+                    tile = (_imageToNumpy(tiles[frame])[0] if len(frameList) > 1 else
+                            self._getTile(int(tx), int(ty), frame))
+                    bands = min(self.bands, tile.shape[2])
+                    output = result[fidx]
+                    output[_gridIndex(rowSel, colSel) + (slice(bands), )] = tile[
+                        _gridIndex(tileRows, tileCols) + (slice(bands), )]
+        return result
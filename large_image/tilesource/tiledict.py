@@ -1,4 +1,5 @@
-from typing import Any, Dict, Optional, Tuple, cast
+import threading
+from typing import Any, Dict, List, Optional, Tuple, cast
 
 import numpy as np
 import PIL
@@ -7,10 +8,67 @@ import PIL.ImageColor
 import PIL.ImageDraw
 
 from .. import exceptions
+from ..cache_util.cache import getCacheMany
 from ..constants import TILE_FORMAT_IMAGE, TILE_FORMAT_NUMPY, TILE_FORMAT_PIL
+from .resample import resizeArray, resizeMethod
 from .utilities import _encodeImage, _imageToNumpy, _imageToPIL
 
 
+class TileCachePrefetch:
+    """
+    Look up the cached tiles for a group of tile positions with a single
+    cache request.  This is done the first time a tile from the group is
+    loaded; tiles that are found are held until the matching LazyTileDict is
+    loaded.  With remote caches, this replaces a network round trip per tile
+    with one per group.
+    """
+
+    def __init__(
+            self, source: Any, positions: List[Tuple[int, int]], level: int,
+            frame: Optional[int]) -> None:
+        """
+        Create a prefetch group.
+
+        :param source: the tile source.
+        :param positions: a list of (x, y) tile positions in the group.
+        :param level: the level of the tiles.
+        :param frame: the frame of the tiles.
+        """
+        self.source = source
+        self.positions = positions
+        self.level = level
+        self.frame = frame
+        self.values: Optional[Dict[Tuple[int, int], Any]] = None
+        self.getTileKwargs: Optional[Dict[str, Any]] = None
+        self.lock = threading.Lock()
+
+    def get(self, x: int, y: int, getTileKwargs: Dict[str, Any]) -> Any:
+        """
+        Get a tile if it was found in the cache.
+
+        :param x: the tile x position.
+        :param y: the tile y position.
+        :param getTileKwargs: the keyword arguments that will be passed to
+            getTile.  The first request determines the arguments used for the
+            group; other arguments are not prefetched.
+        :returns: the cached tile or None if it wasn't prefetched.
+        """
+        with self.lock:
+            if self.values is None:
+                self.values = {}
+                self.getTileKwargs = getTileKwargs
+                cacheKey = getattr(self.source.getTile, 'cacheKey', None)
+                if cacheKey is not None:
+                    keys = {cacheKey(
+                        self.source, px, py, self.level, **getTileKwargs): (px, py)
+                        for px, py in self.positions}
+                    found = getCacheMany(self.source.cache, self.source.cache_lock, keys)
+                    self.values = {keys[key]: value for key, value in found.items()}
+            if getTileKwargs != self.getTileKwargs:
+                return None
+            return self.values.pop((x, y), None)
+
+
 class LazyTileDict(dict):
     """
     Tiles returned from the tile iterator and dictionaries of information with
@@ -31,11 +89,15 @@ class LazyTileDict(dict):
         load the tile image.  ang and kwargs are as for the dict() class.
 
         :param tileInfo: a dictionary of x, y, level, format, encoding, crop,
-            and source, used for fetching the tile image.
+            and source, used for fetching the tile image.  This may also
+            contain a cachePrefetch TileCachePrefetch object shared with other
+            tiles, and a list of frames to load the tile from each of them.
         """
         self.x = tileInfo['x']
         self.y = tileInfo['y']
         self.frame = tileInfo.get('frame')
+        self.frames = cast(Optional[List[int]], tileInfo.get('frames'))
+        self.bands = tileInfo.get('bands')
         self.level = tileInfo['level']
         self.format = tileInfo['format']
         self.encoding = tileInfo['encoding']
@@ -45,6 +107,7 @@ class LazyTileDict(dict):
         self.requestedScale = tileInfo.get('requestedScale')
         self.metadata = cast(Dict[str, Any], tileInfo.get('metadata'))
         self.retile = tileInfo.get('retile') and self.metadata
+        self.cachePrefetch = cast(Optional[TileCachePrefetch], tileInfo.get('cachePrefetch'))
 
         self.deferredKeys = ('tile', 'format')
         self.alwaysAllowPIL = True
@@ -115,15 +178,26 @@ class LazyTileDict(dict):
             self.imageKwargs = imageKwargs
             self.loaded = False
 
-    def _retileTile(self) -> np.ndarray:
+    def _getTileBands(self) -> Dict[str, Any]:
+        """
+        Get the band selection to pass to getTile.  This is omitted when no
+        bands were selected so that the tile cache keys are unchanged.
+
+        :returns: a dictionary to add to the getTile parameters.
+        """
+        return {'bands': self.bands} if self.bands is not None else {}
+
+    def _retileTile(self, frame: Optional[int] = None) -> np.ndarray:
         """
         Given the tile information, create a numpy array and merge multiple
         tiles together to form a tile of a different size.
+
+        :param frame: the frame to use.  If None, use the tile's frame.
         """
         tileWidth = self.metadata['tileWidth']
         tileHeight = self.metadata['tileHeight']
         level = self.level
-        frame = self.frame
+        frame = self.frame if frame is None else frame
         width = self.width
         height = self.height
         tx = self['x']
@@ -138,7 +212,8 @@ class LazyTileDict(dict):
             for x in range(xmin, xmax):
                 tileData = self.source.getTile(
                     x, y, level,
-                    numpyAllowed='always', sparseFallback=True, frame=frame)
+                    numpyAllowed='always', sparseFallback=True, frame=frame,
+                    **self._getTileBands())
                 if not isinstance(tileData, np.ndarray) or len(tileData.shape) != 3:
                     tileData, _ = _imageToNumpy(tileData)
                 x0 = int(x * tileWidth - tx)
@@ -159,6 +234,86 @@ class LazyTileDict(dict):
                     :th, :tw, :retile.shape[2]]  # type: ignore[misc]
         return cast(np.ndarray, retile)
 
+    def _getTileData(self) -> Any:
+        """
+        Load the tile image, cropping or retiling it as needed.
+
+        :returns: the tile image in any format returned by getTile.
+        """
+        if self.retile:
+            return self._retileTile()
+        getTileKwargs = dict(
+            pilImageAllowed=True,
+            numpyAllowed='always' if TILE_FORMAT_NUMPY in self.format else True,
+            sparseFallback=True, frame=self.frame, **self._getTileBands())
+        tileData = None
+        if self.cachePrefetch is not None:
+            tileData = self.cachePrefetch.get(self.x, self.y, getTileKwargs)
+        if tileData is None:
+            tileData = self.source.getTile(
+                self.x, self.y, self.level, **getTileKwargs)
+        if self.crop:
+            tileData, _ = _imageToNumpy(tileData)
+            tileData = tileData[self.crop[1]:self.crop[3], self.crop[0]:self.crop[2]]
+        return tileData
+
+    def _frameStack(self) -> np.ndarray:
+        """
+        Load the tile from each of the tile's frames.  The tiles are fetched
+        with a single getFrameTiles call unless they need to be retiled.
+
+        :returns: a numpy array of shape (frames, height, width, bands).  If
+            the frames have different numbers of bands, only the bands that
+            they all have are included.
+        """
+        frames = cast(List[int], self.frames)
+        if self.retile:
+            tiles = [self._retileTile(frame) for frame in frames]
+        else:
+            frameTiles = self.source.getFrameTiles(
+                self.x, self.y, self.level, frames, numpyAllowed='always',
+                sparseFallback=True, **self._getTileBands())
+            tiles = [frameTiles[frame] for frame in frames]
+        stack = []
+        for tileData in tiles:
+            tileData, _ = _imageToNumpy(tileData)
+            if self.crop and not self.retile:
+                tileData = tileData[self.crop[1]:self.crop[3], self.crop[0]:self.crop[2]]
+            if self.resample not in (False, None) and self.requestedScale:
+                tileData, _ = _imageToNumpy(self._resampleTile(tileData)[0])
+            stack.append(tileData)
+        bands = min(tileData.shape[2] for tileData in stack)
+        return np.stack([tileData[:, :, :bands] for tileData in stack])
+
+    def _resampleTile(self, tileData: Any) -> Tuple[Any, Optional[PIL.Image.Image]]:
+        """
+        Resample a tile to the requested scale, setting the width and height
+        of this tile.  Numpy tiles that PIL can't represent without losing
+        precision or bands are resized with numpy.
+
+        :param tileData: the tile as returned from getTile.
+        :returns: the resampled tile and, if the tile was resampled with PIL,
+            the PIL image.
+        """
+        method = resizeMethod(self.resample)
+        if (isinstance(tileData, np.ndarray) and method is not None and (
+                tileData.dtype != np.uint8 or
+                (len(tileData.shape) == 3 and tileData.shape[2] > 4))):
+            self['width'] = max(1, int(tileData.shape[1] / self.requestedScale))
+            self['height'] = max(1, int(tileData.shape[0] / self.requestedScale))
+            return resizeArray(tileData, self['width'], self['height'], method), None
+        pilData = _imageToPIL(tileData)
+
+        self['width'] = max(1, int(
+            pilData.size[0] / self.requestedScale))
+        self['height'] = max(1, int(
+            pilData.size[1] / self.requestedScale))
+        pilData = pilData.resize(
+            (self['width'], self['height']),
+            resample=getattr(PIL.Image, 'Resampling', PIL.Image).LANCZOS
+            if self.resample is True else self.resample)
+        return pilData, pilData
+
     def __getitem__(self, key: str, *args, **kwargs) -> Any:
         """
         If this is the first time either the tile or format key is requested,
@@ -172,31 +327,15 @@ class LazyTileDict(dict):
             # tile's own values.
             self.loaded = True
 
-            if not self.retile:
-                tileData = self.source.getTile(
-                    self.x, self.y, self.level,
-                    pilImageAllowed=True,
-                    numpyAllowed='always' if TILE_FORMAT_NUMPY in self.format else True,
-                    sparseFallback=True, frame=self.frame)
-                if self.crop:
-                    tileData, _ = _imageToNumpy(tileData)
-                    tileData = tileData[self.crop[1]:self.crop[3], self.crop[0]:self.crop[2]]
-            else:
-                tileData = self._retileTile()
-
+            if self.frames is not None:
+                self['tile'] = self._frameStack()
+                self['format'] = TILE_FORMAT_NUMPY
+                return super().__getitem__(key, *args, **kwargs)
+            tileData = self._getTileData()
             pilData = None
             # resample if needed
             if self.resample not in (False, None) and self.requestedScale:
-                pilData = _imageToPIL(tileData)
-
-                self['width'] = max(1, int(
-                    pilData.size[0] / self.requestedScale))
-                self['height'] = max(1, int(
-                    pilData.size[1] / self.requestedScale))
-                pilData = tileData = pilData.resize(
-                    (self['width'], self['height']),
-                    resample=getattr(PIL.Image, 'Resampling', PIL.Image).LANCZOS
-                    if self.resample is True else self.resample)
+                tileData, pilData = self._resampleTile(tileData)
 
             tileFormat = (TILE_FORMAT_PIL if isinstance(tileData, PIL.Image.Image)
                           else (TILE_FORMAT_NUMPY if isinstance(tileData, np.ndarray)
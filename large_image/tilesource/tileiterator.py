@@ -1,9 +1,18 @@
+import collections
+import concurrent.futures
+import hashlib
+import json
 import math
-from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Tuple, Union, cast
+from typing import TYPE_CHECKING, Any, Deque, Dict, Iterator, Optional, Tuple, Union, cast
 
+import numpy as np
+
+from .. import config
+from ..cache_util.base import BaseCache
 from ..constants import TILE_FORMAT_IMAGE, TILE_FORMAT_NUMPY, TILE_FORMAT_PIL, TileOutputMimeTypes
 from . import utilities
-from .tiledict import LazyTileDict
+from .tiledict import LazyTileDict, TileCachePrefetch
+from .tileplan import TilePlan
 
 if TYPE_CHECKING:
     from .. import tilesource
@@ -12,21 +21,44 @@ if TYPE_CHECKING:
 class TileIterator:
     """
     A tile iterator on a TileSource.  Details about the iterator can be read
-    via the `info` attribute on the iterator.
+    via the `info` attribute on the iterator, and the tiles it will yield via
+    the `plan` attribute, a TilePlan.  Tile dictionaries are only made from
+    the plan as the tiles are yielded.
+
+    If prefetch is set, the tile data of up to that many upcoming tiles is
+    loaded on a pool of threads while the current tile is processed.  Tiles
+    are still yielded in order and are loaded when they are yielded.
     """
 
     def __init__(
             self, source: 'tilesource.TileSource',
             format: Union[str, Tuple[str]] = (TILE_FORMAT_NUMPY, ),
-            resample: Optional[bool] = True, **kwargs) -> None:
+            resample: Optional[bool] = True, prefetch: Optional[int] = None,
+            workers: Optional[int] = None, **kwargs) -> None:
+        self._pool: Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self._pending: Deque[Tuple[LazyTileDict, concurrent.futures.Future]] = (
+            collections.deque())
+        self._iter: Optional[Iterator[LazyTileDict]] = None
         self.source = source
+        self.plan: Optional[TilePlan] = None
+        self._start = 0
+        self._yielded = 0
         self._kwargs = kwargs
+        self._prefetch = max(0, int(prefetch or 0))
+        if workers is None:
+            workers = -self._prefetch
+        if workers < 0:
+            workers = min(-workers, config.cpu_count(False))
+        self._workers = max(1, workers)
         if not isinstance(format, tuple):
             format = (format, )
         if TILE_FORMAT_IMAGE in format:
             encoding = kwargs.get('encoding')
             if encoding not in TileOutputMimeTypes:
                 raise ValueError('Invalid encoding "%s"' % encoding)
+        if kwargs.get('frames') is not None and TILE_FORMAT_NUMPY not in format:
+            msg = 'Tiles with several frames can only be returned as numpy arrays.'
+            raise ValueError(msg)
         self.format = format
         self.resample = resample
         iterFormat = format if resample in (False, None) else (TILE_FORMAT_PIL, )
@@ -36,20 +68,157 @@ class TileIterator:
             return
         if resample in (False, None) or round(self.info['requestedScale'], 2) == 1.0:
             self.resample = False
+        self.plan = TilePlan(source, self.info)
+        if self.info['foreground'] is not None:
+            foreground = self.info['foreground'].copy()
+            if 'frame' not in foreground:
+                foreground['frame'] = (
+                    self.info['frames'][0] if self.info['frames'] else self.info['frame'])
+            self.plan = cast(TilePlan, self.plan[self.plan.intersects(
+                source.getForegroundMask(**foreground))])
+        if self.info['shard'] is not None:
+            self.plan = cast(TilePlan, self.plan.shard(*self.info['shard']))
+        self.info['tile_count'] = len(self.plan)
+        self._start = self._startIndex(kwargs.get('start_position'), kwargs.get('checkpoint'))
+        self.plan = cast(TilePlan, self.plan[self._start:])
         self._iter = self._tileIterator(self.info)
 
     def __iter__(self) -> Iterator[LazyTileDict]:
         return self
 
     def __next__(self) -> LazyTileDict:
-        if self._iter is None:
+        if not self._prefetch:
+            if self._iter is None:
+                raise StopIteration
+            try:
+                tile = next(self._iter)
+                tile.setFormat(self.format, bool(self.resample), self._kwargs)
+                self._yielded += 1
+                return tile
+            except StopIteration:
+                raise
+        # Keep the next tile and up to prefetch more tiles loading
+        while self._iter is not None and len(self._pending) <= self._prefetch:
+            try:
+                tile = next(self._iter)
+            except StopIteration:
+                self._iter = None
+                break
+            tile.setFormat(self.format, bool(self.resample), self._kwargs)
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._workers)
+            self._pending.append((tile, self._pool.submit(self._loadTile, tile)))
+        if not self._pending:
+            self.close()
             raise StopIteration
+        tile, future = self._pending.popleft()
+        future.result()
+        self._yielded += 1
+        return tile
+
+    def _checkpointKey(self) -> str:
+        """
+        Get a value that identifies the tiles and the order of an iteration.
+
+        :returns: a hex digest of the iteration parameters.
+        """
+        info = cast(Dict[str, Any], self.info)
+        params = {key: info[key] for key in (
+            'region', 'level', 'xmin', 'ymin', 'xmax', 'ymax', 'frame', 'frames',
+            'tile_overlap', 'tile_position', 'tile_size', 'shard', 'foreground')}
+        return hashlib.sha256(json.dumps(
+            params, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+    def _startIndex(self, startPosition: Optional[int], checkpoint: Optional[str]) -> int:
+        """
+        Get the index within the plan of the first tile to yield.
+
+        :param startPosition: if not None, the position of the first tile to
+            yield, as in tile['tile_position']['position'].
+        :param checkpoint: if not None, a value from checkpoint().
+        :returns: the number of tiles of the plan to skip.
+        """
+        plan = cast(TilePlan, self.plan)
+        if startPosition is not None and checkpoint is not None:
+            msg = 'Only one of start_position and checkpoint can be specified.'
+            raise ValueError(msg)
+        if startPosition is not None:
+            indices = np.flatnonzero(plan.positions == int(startPosition))
+            if not len(indices):
+                msg = f'Tile position {startPosition} is not part of this iteration.'
+                raise ValueError(msg)
+            return int(indices[0])
+        if checkpoint is not None:
+            try:
+                token = json.loads(checkpoint)
+                key, start = token['iteration'], int(token['next'])
+            except (TypeError, ValueError, KeyError):
+                msg = 'Invalid checkpoint.'
+                raise ValueError(msg)
+            if key != self._checkpointKey() or not 0 <= start <= len(plan):
+                msg = 'The checkpoint is from a different iteration.'
+                raise ValueError(msg)
+            return start
+        return 0
+
+    def checkpoint(self) -> Optional[str]:
+        """
+        Get a token that records the progress of the iteration.  Passing it as
+        the checkpoint parameter of an iterator with the same parameters
+        (including the shard) continues after the last tile that this
+        iterator has yielded.  Prefetched tiles that have not been yielded are
+        not counted.
+
+        :returns: a string or None if the iterator has no tiles.
+        """
+        if self.info is None:
+            return None
+        return json.dumps({
+            'iteration': self._checkpointKey(),
+            'next': self._start + self._yielded,
+        })
+
+    def tile(self, index: int) -> LazyTileDict:
+        """
+        Get a tile of the iterator's plan as it would be yielded, without
+        iterating.  Iterators with the same parameters have the same plan, so
+        an index identifies the same tile in each of them.
+
+        :param index: the index of the tile in the plan.
+        :returns: the tile dictionary.  The data is loaded when it is used.
+        """
+        tile = cast(TilePlan, self.plan).tileDict(index)
+        tile.setFormat(self.format, bool(self.resample), self._kwargs)
+        return tile
+
+    @staticmethod
+    def _loadTile(tile: LazyTileDict) -> None:
+        """
+        Load the data for a tile.  If this fails, the tile is left unloaded, so
+        the error is raised when the tile's data is accessed.
+
+        :param tile: the tile to load.
+        """
         try:
-            tile = next(self._iter)
-            tile.setFormat(self.format, bool(self.resample), self._kwargs)
-            return tile
-        except StopIteration:
-            raise
+            tile['tile']
+        except Exception:
+            tile.loaded = False
+
+    def close(self) -> None:
+        """
+        Stop iterating.  Tiles that were being prefetched and have not been
+        yielded are discarded.
+        """
+        self._iter = None
+        while self._pending:
+            tile, future = self._pending.pop()
+            future.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def __del__(self) -> None:
+        self.close()
 
     def __repr__(self) -> str:
         repr = f'TileIterator<{self.source}'
@@ -60,6 +229,10 @@ class TileIterator:
                 f'; region: {self.info["region"]}')
             if self.info['frame'] is not None:
                 repr += f'; frame: {self.info["frame"]}>'
+            if self.info['frames'] is not None:
+                repr += f'; frames: {self.info["frames"]}'
+            if self.info['shard'] is not None:
+                repr += f'; shard: {self.info["shard"]}'
         repr += '>'
         return repr
 
@@ -68,6 +241,46 @@ class TileIterator:
             return self.info
         return {}
 
+    @staticmethod
+    def _shardArgs(shard: Any) -> Optional[Tuple[int, int, str]]:
+        """
+        Parse and validate the shard parameter of an iterator.
+
+        :param shard: None, a tuple of (index, count) or (index, count,
+            method), or a dictionary with index, count, and optionally method.
+        :returns: None or a tuple of (index, count, method).  The values are
+            validated by TilePlan.shard.
+        """
+        if shard is None:
+            return None
+        if isinstance(shard, dict):
+            shard = (shard.get('index'), shard.get('count'),
+                     shard.get('method', 'contiguous'))
+        try:
+            index, count = int(shard[0]), int(shard[1])
+            method = shard[2] if len(shard) > 2 else 'contiguous'
+        except (TypeError, ValueError, IndexError):
+            msg = 'shard must be (index, count) or (index, count, method).'
+            raise ValueError(msg)
+        return (index, count, method)
+
+    @staticmethod
+    def _foregroundArgs(foreground: Any) -> Optional[Dict[str, Any]]:
+        """
+        Parse the foreground parameter of an iterator.
+
+        :param foreground: None, False, True, a method name or function, or a
+            dictionary of parameters for TileSource.getForegroundMask.
+        :returns: None or a dictionary of parameters for getForegroundMask.
+        """
+        if foreground is None or foreground is False:
+            return None
+        if foreground is True:
+            return {}
+        if isinstance(foreground, dict):
+            return dict(foreground)
+        return {'method': foreground}
+
     def _tileIteratorInfo(self, **kwargs) -> Optional[Dict[str, Any]]:  # noqa
         """
         Get information necessary to construct a tile iterator.
@@ -152,6 +365,20 @@ class TileIterator:
             :auto: a boolean, if True, automatically set the offset to align
                 with the region's left and top.
 
+        :param bands: if present, a 1-based band number or a list of band
+            numbers to include in each tile.  Sources may read only these
+            bands.  If the source has a style, the bands are selected from the
+            styled tile.
+        :param frames: if present, a list of frame numbers.  Each tile is a
+            numpy array of shape (frames, height, width, bands) with the same
+            tile from each frame, fetched together with getFrameTiles.
+        :param shard: if present, a tuple of (index, count) or (index, count,
+            method) to only iterate one of count disjoint parts of the tiles.
+            See TilePlan.shard for the methods.
+        :param foreground: if present and not False, only iterate tiles that
+            overlap the foreground mask of the image.  This is True, a method
+            for TileSource.getForegroundMask, or a dictionary of parameters
+            for it.
         :param kwargs: optional arguments.  Some options are encoding,
             jpegQuality, jpegSubsampling, tiffCompression, frame.
         :returns: a dictionary of information needed for the tile iterator.
@@ -170,6 +397,10 @@ class TileIterator:
 
             :xmin, ymin, xmax, ymax: the tiles that will be included during the
                 iteration: [xmin, xmax) and [ymin, ymax).
+            :tile_count: the number of tiles in the iteration.  The tile
+                iterator reduces this to the number of tiles that are left
+                after selecting a tile_position, shard, or foreground.  Tiles
+                skipped by a start_position or checkpoint are still counted.
             :mode: either 'RGB' or 'RGBA'.  This determines the color space
                 used for tiles.
             :level: the tile level used for iteration.
@@ -182,6 +413,10 @@ class TileIterator:
                     is being delivered.
 
             :frame: the frame value for the base image.
+            :frames: the list of frames in each tile or None.
+            :shard: None or a tuple of (index, count, method).
+            :foreground: None or a dictionary of parameters for
+                getForegroundMask.
             :format: a tuple of allowed output formats.
             :encoding: if the output format is TILE_FORMAT_IMAGE, the desired
                 encoding.
@@ -343,6 +578,11 @@ class TileIterator:
                 'height': outHeight,
             },
             'frame': kwargs.get('frame'),
+            'frames': ([int(frame) for frame in kwargs['frames']]
+                       if kwargs.get('frames') is not None else None),
+            'shard': self._shardArgs(kwargs.get('shard')),
+            'foreground': self._foregroundArgs(kwargs.get('foreground')),
+            'bands': kwargs.get('bands'),
             'format': kwargs.get('format', (TILE_FORMAT_NUMPY, )),
             'encoding': kwargs.get('encoding'),
             'requestedScale': requestedScale,
@@ -410,135 +650,26 @@ class TileIterator:
         :yields: an iterator that returns a dictionary as listed above.
         """
         source = self.source
-        regionWidth = iterInfo['region']['width']
-        regionHeight = iterInfo['region']['height']
-        left = iterInfo['region']['left']
-        top = iterInfo['region']['top']
-        xmin = iterInfo['xmin']
-        ymin = iterInfo['ymin']
-        xmax = iterInfo['xmax']
-        ymax = iterInfo['ymax']
-        level = iterInfo['level']
-        metadata = iterInfo['metadata']
-        tileSize = iterInfo['tile_size']
-        tileOverlap = iterInfo['tile_overlap']
-        format = iterInfo['format']
-        encoding = iterInfo['encoding']
-
+        plan = self.plan
+        if plan is None:
+            return
         source.logger.debug(
             'Fetching region of an image with a source size of %d x %d; '
             'getting %d tile%s',
-            regionWidth, regionHeight, (xmax - xmin) * (ymax - ymin),
-            '' if (xmax - xmin) * (ymax - ymin) == 1 else 's')
-
-        # If tile is specified, return at most one tile
-        if iterInfo.get('tile_position') is not None:
-            tilePos = iterInfo.get('tile_position')
-            if isinstance(tilePos, dict):
-                if tilePos.get('position') is not None:
-                    tilePos = tilePos['position']
-                elif 'region_x' in tilePos and 'region_y' in tilePos:
-                    tilePos = (tilePos['region_x'] +
-                               tilePos['region_y'] * (xmax - xmin))
-                elif 'level_x' in tilePos and 'level_y' in tilePos:
-                    tilePos = ((tilePos['level_x'] - xmin) +
-                               (tilePos['level_y'] - ymin) * (xmax - xmin))
-            if tilePos < 0 or tilePos >= (ymax - ymin) * (xmax - xmin):
-                xmax = xmin
-            else:
-                ymin += int(tilePos / (xmax - xmin))
-                ymax = ymin + 1
-                xmin += int(tilePos % (xmax - xmin))
-                xmax = xmin + 1
-        mag = source.getMagnificationForLevel(level)
-        scale = mag.get('scale', 1.0)
-        retile = (tileSize['width'] != metadata['tileWidth'] or
-                  tileSize['height'] != metadata['tileHeight'] or
-                  tileOverlap['x'] or tileOverlap['y'])
-        for y in range(ymin, ymax):
-            for x in range(xmin, xmax):
-                crop = None
-                posX = int(x * tileSize['width'] - tileOverlap['x'] // 2 +
-                           tileOverlap['offset_x'] - left)
-                posY = int(y * tileSize['height'] - tileOverlap['y'] // 2 +
-                           tileOverlap['offset_y'] - top)
-                tileWidth = tileSize['width'] + tileOverlap['x']
-                tileHeight = tileSize['height'] + tileOverlap['y']
-                # crop as needed
-                if (posX < 0 or posY < 0 or posX + tileWidth > regionWidth or
-                        posY + tileHeight > regionHeight):
-                    crop = (max(0, -posX),
-                            max(0, -posY),
-                            int(min(tileWidth, regionWidth - posX)),
-                            int(min(tileHeight, regionHeight - posY)))
-                    posX += crop[0]
-                    posY += crop[1]
-                    tileWidth = crop[2] - crop[0]
-                    tileHeight = crop[3] - crop[1]
-                overlap = {
-                    'left': max(0, x * tileSize['width'] + tileOverlap['offset_x'] - left - posX),
-                    'top': max(0, y * tileSize['height'] + tileOverlap['offset_y'] - top - posY),
-                }
-                overlap['right'] = (
-                    max(0, tileWidth - tileSize['width'] - overlap['left'])
-                    if x != xmin or not tileOverlap['range_x'] else
-                    min(tileWidth, tileOverlap['range_x'] - tileOverlap['offset_x']))
-                overlap['bottom'] = (
-                    max(0, tileHeight - tileSize['height'] - overlap['top'])
-                    if y != ymin or not tileOverlap['range_y'] else
-                    min(tileHeight, tileOverlap['range_y'] - tileOverlap['offset_y']))
-                if tileOverlap['range_x']:
-                    overlap['left'] = 0 if x == tileOverlap['xmin'] else overlap['left']
-                    overlap['right'] = 0 if x + 1 == tileOverlap['xmax'] else overlap['right']
-                if tileOverlap['range_y']:
-                    overlap['top'] = 0 if y == tileOverlap['ymin'] else overlap['top']
-                    overlap['bottom'] = 0 if y + 1 == tileOverlap['ymax'] else overlap['bottom']
-                tile = LazyTileDict({
-                    'x': x,
-                    'y': y,
-                    'frame': iterInfo.get('frame'),
-                    'level': level,
-                    'format': format,
-                    'encoding': encoding,
-                    'crop': crop,
-                    'requestedScale': iterInfo['requestedScale'],
-                    'retile': retile,
-                    'metadata': metadata,
-                    'source': source,
-                }, {
-                    'x': posX + left,
-                    'y': posY + top,
-                    'width': tileWidth,
-                    'height': tileHeight,
-                    'level': level,
-                    'level_x': x,
-                    'level_y': y,
-                    'magnification': mag['magnification'],
-                    'mm_x': mag['mm_x'],
-                    'mm_y': mag['mm_y'],
-                    'tile_position': {
-                        'level_x': x,
-                        'level_y': y,
-                        'region_x': x - iterInfo['xmin'],
-                        'region_y': y - iterInfo['ymin'],
-                        'position': ((x - iterInfo['xmin']) +
-                                     (y - iterInfo['ymin']) *
-                                     (iterInfo['xmax'] - iterInfo['xmin'])),
-                    },
-                    'iterator_range': {
-                        'level_x_min': iterInfo['xmin'],
-                        'level_y_min': iterInfo['ymin'],
-                        'level_x_max': iterInfo['xmax'],
-                        'level_y_max': iterInfo['ymax'],
-                        'region_x_max': iterInfo['xmax'] - iterInfo['xmin'],
-                        'region_y_max': iterInfo['ymax'] - iterInfo['ymin'],
-                        'position': ((iterInfo['xmax'] - iterInfo['xmin']) *
-                                     (iterInfo['ymax'] - iterInfo['ymin'])),
-                    },
-                    'tile_overlap': overlap,
-                })
-                tile['gx'] = tile['x'] * scale
-                tile['gy'] = tile['y'] * scale
-                tile['gwidth'] = tile['width'] * scale
-                tile['gheight'] = tile['height'] * scale
-                yield tile
+            iterInfo['region']['width'], iterInfo['region']['height'],
+            iterInfo['tile_count'], '' if iterInfo['tile_count'] == 1 else 's')
+        # Caches that are not in process can look up a row of tiles in one
+        # request
+        prefetch = (not plan.retile and iterInfo.get('frames') is None and
+                    isinstance(getattr(source, 'cache', None), BaseCache) and
+                    hasattr(source.getTile, 'cacheKey'))
+        levelX = plan.level_x
+        levelY = plan.level_y
+        rowStarts = np.flatnonzero(np.diff(levelY, prepend=-1)).tolist() + [len(plan)]
+        for rowStart, rowEnd in zip(rowStarts[:-1], rowStarts[1:]):
+            cachePrefetch = TileCachePrefetch(
+                source, [(x, int(levelY[rowStart])) for x in levelX[rowStart:rowEnd].tolist()],
+                plan.level, iterInfo.get('frame'),
+            ) if prefetch and rowEnd - rowStart > 1 else None
+            for position in plan.positions[rowStart:rowEnd].tolist():
+                yield plan._positionTileDict(position, cachePrefetch)
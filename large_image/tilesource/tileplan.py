@@ -0,0 +1,410 @@
+import copy
+from typing import TYPE_CHECKING, Any, Dict, Iterator, Optional, Tuple, Union, cast
+
+import numpy as np
+
+from .tiledict import LazyTileDict, TileCachePrefetch
+
+if TYPE_CHECKING:
+    from .. import tilesource
+
+
+ShardMethods = ('contiguous', 'roundrobin', 'zorder')
+
+
+def _mortonCode(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    """
+    Interleave the bits of two arrays of non-negative integers.  Sorting by
+    the result orders tiles along a Z-order curve, so tiles that are close in
+    the order are close in the image.
+
+    :param x: an array of integers less than 2^32.
+    :param y: an array of integers less than 2^32.
+    :returns: an array of uint64 codes.
+    """
+    codes = np.zeros(x.shape, dtype=np.uint64)
+    for value, shift in ((x, 0), (y, 1)):
+        value = value.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+        for bitShift, mask in ((16, 0x0000FFFF0000FFFF), (8, 0x00FF00FF00FF00FF),
+                               (4, 0x0F0F0F0F0F0F0F0F), (2, 0x3333333333333333),
+                               (1, 0x5555555555555555)):
+            value = (value | (value << np.uint64(bitShift))) & np.uint64(mask)
+        codes |= value << np.uint64(shift)
+    return codes
+
+
+class TilePlanEntry:
+    """
+    A lightweight view of one tile of a TilePlan.  The values are read from
+    the plan's arrays when they are accessed.
+    """
+
+    __slots__ = ('plan', 'index')
+
+    def __init__(self, plan: 'TilePlan', index: int) -> None:
+        self.plan = plan
+        self.index = index
+
+    def __repr__(self) -> str:
+        return (f'TilePlanEntry<position {self.position}: level_x {self.level_x}, '
+                f'level_y {self.level_y}>')
+
+    @property
+    def position(self) -> int:
+        return int(self.plan.positions[self.index])
+
+    @property
+    def level_x(self) -> int:
+        return self.plan._xmin + self.position % self.plan._regionTilesX
+
+    @property
+    def level_y(self) -> int:
+        return self.plan._ymin + self.position // self.plan._regionTilesX
+
+    def tileDict(self, cachePrefetch: Optional[TileCachePrefetch] = None) -> LazyTileDict:
+        """
+        Get the tile dictionary for this tile.  See TilePlan.tileDict.
+        """
+        return self.plan.tileDict(self.index, cachePrefetch)
+
+
+class TilePlan:
+    """
+    The tiles that a tile iterator yields, stored as arrays rather than as a
+    dictionary per tile.  The placement, crop, and overlap of a tile only
+    depend on its column and its row, so these are computed once per column
+    and row; the plan itself is an array of tile positions.  This makes it
+    cheap to count, split, or filter the tiles of very large iterations.  The
+    tile dictionaries that TileIterator yields are made with tileDict when a
+    tile is used.  The coordinates in the plan are in the pixels of the
+    iterator's level; if the iterator resamples tiles, the yielded tiles are
+    scaled from these.
+
+    Indexing a plan with an integer returns a TilePlanEntry.  Indexing with a
+    slice, an integer array, or a boolean array returns a plan with a subset
+    of the tiles.
+    """
+
+    def __init__(self, source: 'tilesource.TileSource', iterInfo: Dict[str, Any]) -> None:
+        """
+        Create the plan of a tile iterator.
+
+        :param source: the tile source.
+        :param iterInfo: tile iterator information.  See
+            TileIterator._tileIteratorInfo.  If this has a tile_position, the
+            plan has at most one tile.
+        """
+        self.source = source
+        self.info = iterInfo
+        self.level = iterInfo['level']
+        self._xmin = iterInfo['xmin']
+        self._ymin = iterInfo['ymin']
+        self._regionTilesX = iterInfo['xmax'] - iterInfo['xmin']
+        xmin, xmax, ymin, ymax = self._planRange(iterInfo)
+        self.positions = (
+            np.arange(ymin - self._ymin, ymax - self._ymin, dtype=np.int64)[:, np.newaxis] *
+            self._regionTilesX +
+            np.arange(xmin - self._xmin, xmax - self._xmin, dtype=np.int64)).ravel()
+        self._columns = self._axisTable(
+            np.arange(xmin, xmax), xmin, iterInfo['tile_size']['width'],
+            iterInfo['region']['left'], iterInfo['region']['width'], 'x')
+        self._rows = self._axisTable(
+            np.arange(ymin, ymax), ymin, iterInfo['tile_size']['height'],
+            iterInfo['region']['top'], iterInfo['region']['height'], 'y')
+        # Python lists are faster than numpy arrays for getting single values
+        self._columnValues = {key: value.tolist() for key, value in self._columns.items()}
+        self._rowValues = {key: value.tolist() for key, value in self._rows.items()}
+        self._columnOffset = xmin - self._xmin
+        self._rowOffset = ymin - self._ymin
+        self.mag = source.getMagnificationForLevel(self.level)
+        self.scale = self.mag.get('scale', 1.0)
+        metadata = iterInfo['metadata']
+        tileSize = iterInfo['tile_size']
+        # Tiles that are offset from the level's grid are also assembled from
+        # several native tiles, even without an overlap
+        self.retile = bool(
+            tileSize['width'] != metadata['tileWidth'] or
+            tileSize['height'] != metadata['tileHeight'] or
+            iterInfo['tile_overlap']['x'] or iterInfo['tile_overlap']['y'] or
+            iterInfo['tile_overlap']['offset_x'] or iterInfo['tile_overlap']['offset_y'])
+
+    @staticmethod
+    def _planRange(iterInfo: Dict[str, Any]) -> Tuple[int, int, int, int]:
+        """
+        Get the range of tiles in a plan.
+
+        :param iterInfo: tile iterator information.
+        :returns: xmin, xmax, ymin, ymax of the tiles in the plan.  This is
+            the full range of the iterator unless there is a tile_position.
+        """
+        xmin, xmax = iterInfo['xmin'], iterInfo['xmax']
+        ymin, ymax = iterInfo['ymin'], iterInfo['ymax']
+        # If tile is specified, return at most one tile
+        if iterInfo.get('tile_position') is not None:
+            tilePos = iterInfo.get('tile_position')
+            if isinstance(tilePos, dict):
+                if tilePos.get('position') is not None:
+                    tilePos = tilePos['position']
+                elif 'region_x' in tilePos and 'region_y' in tilePos:
+                    tilePos = (tilePos['region_x'] +
+                               tilePos['region_y'] * (xmax - xmin))
+                elif 'level_x' in tilePos and 'level_y' in tilePos:
+                    tilePos = ((tilePos['level_x'] - xmin) +
+                               (tilePos['level_y'] - ymin) * (xmax - xmin))
+            if tilePos < 0 or tilePos >= (ymax - ymin) * (xmax - xmin):
+                xmax = xmin
+            else:
+                ymin += int(tilePos / (xmax - xmin))
+                ymax = ymin + 1
+                xmin += int(tilePos % (xmax - xmin))
+                xmax = xmin + 1
+        return xmin, xmax, ymin, ymax
+
+    def _axisTable(
+            self, tiles: np.ndarray, first: int, tileSize: int, regionStart: int,
+            regionSize: int, axis: str) -> Dict[str, np.ndarray]:
+        """
+        Compute the placement of the tiles along one axis.
+
+        :param tiles: an array of tile numbers in the level.
+        :param first: the first tile number of the plan.
+        :param tileSize: the tile size without the overlap.
+        :param regionStart: the left or top of the region.
+        :param regionSize: the width or height of the region.
+        :param axis: 'x' or 'y'.
+        :returns: a dictionary of arrays with the position in the region,
+            size, crop start and end, whether the axis needs to be cropped,
+            and the overlap at the start and end of each tile.
+        """
+        tileOverlap = self.info['tile_overlap']
+        overlapSize = tileOverlap[axis]
+        offset = tileOverlap['offset_' + axis]
+        overlapRange = tileOverlap['range_' + axis]
+        pos = (tiles * tileSize - overlapSize // 2 + offset - regionStart).astype(np.int64)
+        size = np.full(tiles.shape, tileSize + overlapSize, dtype=np.int64)
+        cropped = (pos < 0) | (pos + size > regionSize)
+        cropStart = np.maximum(0, -pos)
+        cropEnd = np.minimum(size, regionSize - pos).astype(np.int64)
+        pos = np.where(cropped, pos + cropStart, pos)
+        size = np.where(cropped, cropEnd - cropStart, size)
+        overlapStart = np.maximum(0, tiles * tileSize + offset - regionStart - pos)
+        overlapEnd = np.maximum(0, size - tileSize - overlapStart)
+        if overlapRange:
+            overlapEnd = np.where(
+                tiles != first, overlapEnd, np.minimum(size, overlapRange - offset))
+            overlapStart = np.where(tiles == tileOverlap[axis + 'min'], 0, overlapStart)
+            overlapEnd = np.where(tiles + 1 == tileOverlap[axis + 'max'], 0, overlapEnd)
+        return {
+            'pos': pos,
+            'size': size,
+            'cropStart': cropStart,
+            'cropEnd': cropEnd,
+            'cropped': cropped,
+            'overlapStart': overlapStart,
+            'overlapEnd': overlapEnd,
+        }
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def __repr__(self) -> str:
+        return f'TilePlan<{self.source}: level {self.level}; tiles: {len(self)}>'
+
+    def __iter__(self) -> Iterator[TilePlanEntry]:
+        for index in range(len(self)):
+            yield TilePlanEntry(self, index)
+
+    def __getitem__(self, key: Any) -> Union[TilePlanEntry, 'TilePlan']:
+        if isinstance(key, (int, np.integer)):
+            if key < -len(self) or key >= len(self):
+                msg = 'Tile index out of range.'
+                raise IndexError(msg)
+            return TilePlanEntry(self, int(key) % len(self))
+        plan = copy.copy(self)
+        plan.positions = self.positions[key]
+        return plan
+
+    def shard(self, index: int, count: int, method: str = 'contiguous') -> 'TilePlan':
+        """
+        Get one of several disjoint parts of the plan.  The parts together
+        contain every tile of the plan, and the split only depends on the
+        plan, so separate processes can each iterate one part.
+
+        :param index: the 0-based part to get.
+        :param count: the number of parts.
+        :param method: one of ShardMethods.  'contiguous' splits the plan into
+            blocks of consecutive tiles of nearly equal size.  'roundrobin'
+            gives every count-th tile to each part.  'zorder' orders the tiles
+            along a Z-order curve and then splits them into blocks, so each
+            part is a compact area of the image; the tiles of a part are
+            yielded in Z-order.
+        :returns: a plan with the tiles of the part.
+        """
+        if method not in ShardMethods:
+            msg = f'Shard method must be one of {", ".join(ShardMethods)}.'
+            raise ValueError(msg)
+        if count < 1 or index < 0 or index >= count:
+            msg = 'Shard index must be at least 0 and less than the shard count.'
+            raise ValueError(msg)
+        if method == 'roundrobin':
+            return cast(TilePlan, self[index::count])
+        plan = self
+        if method == 'zorder':
+            plan = cast(TilePlan, self[np.argsort(_mortonCode(
+                self.level_x - self._xmin, self.level_y - self._ymin), kind='stable')])
+        return cast(TilePlan, plan[len(plan) * index // count:len(plan) * (index + 1) // count])
+
+    def intersects(self, mask: np.ndarray) -> np.ndarray:
+        """
+        Determine which tiles overlap the true pixels of a mask that covers
+        the whole image, such as one from TileSource.getForegroundMask.  A
+        tile overlaps every mask pixel that it partially covers.
+
+        :param mask: a two dimensional boolean array.
+        :returns: a boolean array with a value for each tile of the plan.
+        """
+        maskHeight, maskWidth = mask.shape[:2]
+        sizeX = self.info['metadata']['sizeX']
+        sizeY = self.info['metadata']['sizeY']
+        # A summed-area table gives the number of true mask pixels within any
+        # rectangle with four lookups.
+        table = np.zeros((maskHeight + 1, maskWidth + 1), dtype=np.int64)
+        table[1:, 1:] = np.asarray(mask, dtype=bool).cumsum(axis=0).cumsum(axis=1)
+        x, y = self.x * self.scale, self.y * self.scale
+        left = np.clip(np.floor(x * maskWidth / sizeX), 0, maskWidth - 1).astype(int)
+        top = np.clip(np.floor(y * maskHeight / sizeY), 0, maskHeight - 1).astype(int)
+        right = np.clip(np.ceil((x + self.width * self.scale) * maskWidth / sizeX),
+                        left + 1, maskWidth).astype(int)
+        bottom = np.clip(np.ceil((y + self.height * self.scale) * maskHeight / sizeY),
+                         top + 1, maskHeight).astype(int)
+        counts = (table[bottom, right] - table[top, right] -
+                  table[bottom, left] + table[top, left])
+        return counts > 0
+
+    def _columnIndex(self) -> np.ndarray:
+        return self.positions % self._regionTilesX - self._columnOffset
+
+    def _rowIndex(self) -> np.ndarray:
+        return self.positions // self._regionTilesX - self._rowOffset
+
+    @property
+    def level_x(self) -> np.ndarray:
+        """The tile column in the level of each tile."""
+        return self._xmin + self.positions % self._regionTilesX
+
+    @property
+    def level_y(self) -> np.ndarray:
+        """The tile row in the level of each tile."""
+        return self._ymin + self.positions // self._regionTilesX
+
+    @property
+    def x(self) -> np.ndarray:
+        """The left coordinate of each tile in level pixels."""
+        return self._columns['pos'][self._columnIndex()] + self.info['region']['left']
+
+    @property
+    def y(self) -> np.ndarray:
+        """The top coordinate of each tile in level pixels."""
+        return self._rows['pos'][self._rowIndex()] + self.info['region']['top']
+
+    @property
+    def width(self) -> np.ndarray:
+        """The width of each tile in level pixels."""
+        return self._columns['size'][self._columnIndex()]
+
+    @property
+    def height(self) -> np.ndarray:
+        """The height of each tile in level pixels."""
+        return self._rows['size'][self._rowIndex()]
+
+    def tileDict(
+            self, index: int,
+            cachePrefetch: Optional[TileCachePrefetch] = None) -> LazyTileDict:
+        """
+        Get the dictionary for a tile as yielded by TileIterator.  See
+        TileIterator._tileIterator for the keys.
+
+        :param index: the index of the tile in the plan.
+        :param cachePrefetch: an optional TileCachePrefetch object shared with
+            the other tiles in the same row.
+        :returns: a LazyTileDict.  The tile data is not loaded.
+        """
+        return self._positionTileDict(int(self.positions[index]), cachePrefetch)
+
+    def _positionTileDict(
+            self, position: int,
+            cachePrefetch: Optional[TileCachePrefetch] = None) -> LazyTileDict:
+        """
+        Get the dictionary for a tile from its position in the iterator.
+
+        :param position: the position of the tile in the full iteration.
+        :param cachePrefetch: an optional TileCachePrefetch object.
+        :returns: a LazyTileDict.
+        """
+        iterInfo = self.info
+        col = position % self._regionTilesX - self._columnOffset
+        row = position // self._regionTilesX - self._rowOffset
+        x = self._xmin + position % self._regionTilesX
+        y = self._ymin + position // self._regionTilesX
+        columns, rows = self._columnValues, self._rowValues
+        crop = None
+        if columns['cropped'][col] or rows['cropped'][row]:
+            crop = (columns['cropStart'][col], rows['cropStart'][row],
+                    columns['cropEnd'][col], rows['cropEnd'][row])
+        tile = LazyTileDict({
+            'x': x,
+            'y': y,
+            'frame': iterInfo.get('frame'),
+            'frames': iterInfo.get('frames'),
+            'bands': iterInfo.get('bands'),
+            'level': self.level,
+            'format': iterInfo['format'],
+            'encoding': iterInfo['encoding'],
+            'crop': crop,
+            'requestedScale': iterInfo['requestedScale'],
+            'retile': self.retile,
+            'metadata': iterInfo['metadata'],
+            'source': self.source,
+            'cachePrefetch': cachePrefetch,
+        }, {
+            'x': columns['pos'][col] + iterInfo['region']['left'],
+            'y': rows['pos'][row] + iterInfo['region']['top'],
+            'width': columns['size'][col],
+            'height': rows['size'][row],
+            'level': self.level,
+            'level_x': x,
+            'level_y': y,
+            'magnification': self.mag['magnification'],
+            'mm_x': self.mag['mm_x'],
+            'mm_y': self.mag['mm_y'],
+            'tile_position': {
+                'level_x': x,
+                'level_y': y,
+                'region_x': x - iterInfo['xmin'],
+                'region_y': y - iterInfo['ymin'],
+                'position': position,
+            },
+            'iterator_range': {
+                'level_x_min': iterInfo['xmin'],
+                'level_y_min': iterInfo['ymin'],
+                'level_x_max': iterInfo['xmax'],
+                'level_y_max': iterInfo['ymax'],
+                'region_x_max': iterInfo['xmax'] - iterInfo['xmin'],
+                'region_y_max': iterInfo['ymax'] - iterInfo['ymin'],
+                'position': ((iterInfo['xmax'] - iterInfo['xmin']) *
+                             (iterInfo['ymax'] - iterInfo['ymin'])),
+            },
+            'tile_overlap': {
+                'left': columns['overlapStart'][col],
+                'top': rows['overlapStart'][row],
+                'right': columns['overlapEnd'][col],
+                'bottom': rows['overlapEnd'][row],
+            },
+        })
+        if iterInfo.get('frames') is not None:
+            tile['frames'] = iterInfo['frames']
+        tile['gx'] = tile['x'] * self.scale
+        tile['gy'] = tile['y'] * self.scale
+        tile['gwidth'] = tile['width'] * self.scale
+        tile['gheight'] = tile['height'] * self.scale
+        return tile
@@ -1,5 +1,6 @@
 import io
 import math
+import os
 import threading
 import types
 import xml.etree.ElementTree
@@ -799,9 +800,36 @@ def _makeSameChannelDepth(arr1: np.ndarray, arr2: np.ndarray) -> Tuple[np.ndarra
     return arrays['arr1'], arrays['arr2']
 
 
+def _regionOutput(
+        out: Union[np.ndarray, str, os.PathLike], subimage: np.ndarray,
+        width: int, height: int) -> np.ndarray:
+    """
+    Get a caller-supplied array to assemble an image in.
+
+    :param out: either a three dimensional numpy array, such as a
+        numpy.memmap, whose first two dimensions are the output image size, or
+        the path of a file to create as a numpy.memmap.  A memmap file has the
+        data type and number of bands of the subimage.
+    :param subimage: a numpy array with the first sub-image that will be added.
+    :param width: the output image size.
+    :param height: the output image size.
+    :returns: out or the created numpy.memmap.
+    """
+    if isinstance(out, (str, os.PathLike)):
+        return np.memmap(
+            out, dtype=subimage.dtype, mode='w+',
+            shape=(height, width, subimage.shape[2] if len(subimage.shape) == 3 else 1))
+    if not isinstance(out, np.ndarray) or out.shape[:2] != (height, width) or (
+            len(out.shape) != 3):
+        msg = 'The out array must have a shape of (%d, %d, bands).' % (height, width)
+        raise ValueError(msg)
+    return out
+
+
 def _addSubimageToImage(
         image: Optional[np.ndarray], subimage: np.ndarray, x: int, y: int,
-        width: int, height: int) -> np.ndarray:
+        width: int, height: int,
+        out: Optional[Union[np.ndarray, str, os.PathLike]] = None) -> np.ndarray:
     """
     Add a subimage to a larger image as numpy arrays.
 
@@ -813,16 +841,28 @@ def _addSubimageToImage(
         the output image.
     :param width: the output image size.
     :param height: the output image size.
+    :param out: if not None, the output image is allocated by the caller.  See
+        _regionOutput.  Sub-images are converted to the number of bands of
+        the output image; the output image is never replaced.
     :returns: the output image record.
     """
     if image is None:
-        if (x, y, width, height) == (0, 0, subimage.shape[1], subimage.shape[0]):
+        if out is not None:
+            image = _regionOutput(out, subimage, width, height)
+        elif (x, y, width, height) == (0, 0, subimage.shape[1], subimage.shape[0]):
             return subimage
-        image = np.empty(
-            (height, width, subimage.shape[2]),  # type: ignore[misc]
-            dtype=subimage.dtype)
-    elif len(image.shape) != len(subimage.shape) or image.shape[-1] != subimage.shape[-1]:
-        image, subimage = _makeSameChannelDepth(image, subimage)
+        else:
+            image = np.empty(
+                (height, width, subimage.shape[2]),  # type: ignore[misc]
+                dtype=subimage.dtype)
+    if len(image.shape) != len(subimage.shape) or image.shape[-1] != subimage.shape[-1]:
+        if out is None:
+            image, subimage = _makeSameChannelDepth(image, subimage)
+        else:
+            _, subimage = _makeSameChannelDepth(image[:1, :1], subimage)
+            if subimage.shape[-1] != image.shape[-1]:
+                msg = 'The out array has fewer bands than the image.'
+                raise ValueError(msg)
     if subimage.shape[-1] in {2, 4}:
         mask = (subimage[:, :, -1] > 0)[:, :, np.newaxis]
         image[y:y + subimage.shape[0], x:x + subimage.shape[1]] = np.where(
@@ -832,6 +872,47 @@ def _addSubimageToImage(
     return image
 
 
+def _isTiledOutput(
+        format: Union[str, Tuple[str, ...], List[str], Set[str]], encoding: Optional[str],
+        out: Optional[Union[np.ndarray, str, os.PathLike]] = None) -> bool:
+    """
+    Check if an image will be output with the TILED encoding.
+
+    :param format: a tuple of allowed formats.
+    :param encoding: the requested encoding.
+    :param out: None or a caller-supplied output.  See _regionOutput.
+    :returns: True if the output uses the TILED encoding.
+    :raises ValueError: if there is a caller-supplied output and the TILED
+        encoding is used.
+    """
+    tiled = TILE_FORMAT_IMAGE in format and encoding == 'TILED'
+    if tiled and out is not None:
+        msg = 'An out array cannot be used with the TILED encoding.'
+        raise ValueError(msg)
+    return tiled
+
+
+def _regionResult(
+        image: Any, out: Optional[Union[np.ndarray, str, os.PathLike]],
+        assembled: bool) -> Any:
+    """
+    Get the result of an image that may need to be stored in a caller-supplied
+    output.
+
+    :param image: the image.
+    :param out: None or a caller-supplied output.  See _regionOutput.
+    :param assembled: True if the image was assembled in the output.
+        Otherwise, it is copied to the output.
+    :returns: the image, out if it is an array, or the created memmap.
+    """
+    if out is None:
+        return image
+    if not assembled:
+        image, _ = _imageToNumpy(image)
+        image = _addSubimageToImage(None, image, 0, 0, image.shape[1], image.shape[0], out)
+    return out if isinstance(out, np.ndarray) else image
+
+
 def _vipsAddAlphaBand(vimg: Any, otherImages: List[Any]) -> Any:
     """
     Add an alpha band to a vips image.  The alpha value is either 1, 255, or
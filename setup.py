@@ -41,6 +41,7 @@ extraReqs = {
     'colormaps': ['matplotlib'],
     'tiledoutput': ['pyvips'],
     'performance': [
+        'lz4',
         'psutil>=4.2.0',
         'simplejpeg',
     ],
@@ -116,4 +117,10 @@ setup(
     url='https://github.com/girder/large_image',
     python_requires='>=3.8',
     zip_safe=False,
+    entry_points={
+        'large_image.cache': [
+            'sharedmemory = large_image.cache_util.shmcache:SharedMemoryCache',
+            'tiered = large_image.cache_util.tieredcache:TieredCache',
+        ],
+    },
 )
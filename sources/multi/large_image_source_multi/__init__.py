@@ -439,6 +439,15 @@ class MultiFileTileSource(FileTileSource, metaclass=LruCacheMetaclass):
                 self._axesList.append(axis)
         self._collectFrames()
 
+    def _sourceFingerprint(self):
+        """
+        The data of a multi source is in the files it refers to, so changes
+        can't be detected from the specification file.
+
+        :returns: None.
+        """
+        return None
+
     def _resolvePathPatterns(self, sources, source):
         """
         Given a source resolve pathPattern entries to specific paths.
@@ -104,6 +104,10 @@ class PILFileTileSource(FileTileSource, metaclass=LruCacheMetaclass):
         'image/jpeg': SourcePriority.LOW,
     }
 
+    # Frames are decoded and tiles are cropped and converted by PIL while
+    # holding the GIL, so threads don't help to read them in parallel
+    _readsReleaseGIL = False
+
     def __init__(self, path, maxSize=None, **kwargs):
         """
         Initialize the tile class.  See the base class for other available
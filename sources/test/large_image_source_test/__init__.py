@@ -49,6 +49,10 @@ class TestTileSource(TileSource, metaclass=LruCacheMetaclass):
         None: SourcePriority.MANUAL,
     }
 
+    # Tiles are drawn in python, which holds the GIL, so threads don't help
+    # to read them in parallel
+    _readsReleaseGIL = False
+
     def __init__(self, ignored_path=None, minLevel=0, maxLevel=9,
                  tileWidth=256, tileHeight=256, sizeX=None, sizeY=None,
                  fractal=False, frames=None, monochrome=False, bands=None,
@@ -507,6 +507,10 @@ class TifffileFileTileSource(FileTileSource, metaclass=LruCacheMetaclass):
     def getTile(self, x, y, z, pilImageAllowed=False, numpyAllowed=False, **kwargs):
         frame = self._getFrame(**kwargs)
         self._xyzInRange(x, y, z, frame, self._framecount)
+        bands = self._sourceBands(**kwargs)
+        firstBand = 0
+        if bands is not None:
+            kwargs['bands'] = None
         x0, y0, x1, y1, step = self._xyzToCorners(x, y, z)
         if len(self._series) > 1:
             sidx = frame // self._basis['P'][0]
@@ -546,7 +550,13 @@ class TifffileFileTileSource(FileTileSource, metaclass=LruCacheMetaclass):
                     sel.append(slice(y0, y1, step))
                     baxis += 'Y'
                 elif axis == 'S':
-                    sel.append(slice(series.shape[aidx]))
+                    if bands is not None:
+                        # Only read the range of samples that includes the
+                        # bands
+                        firstBand = min(bands)
+                        sel.append(slice(firstBand, max(bands) + 1))
+                    else:
+                        sel.append(slice(series.shape[aidx]))
                     baxis += 'S'
                 else:
                     sel.append((frame // self._basis[axis][0]) % self._basis[axis][2])
@@ -555,6 +565,9 @@ class TifffileFileTileSource(FileTileSource, metaclass=LruCacheMetaclass):
             if baxis not in {'YXS', 'YX'}:
                 tile = np.moveaxis(
                     tile, [baxis.index(a) for a in 'YXS' if a in baxis], range(len(baxis)))
+        if bands is not None:
+            tile = large_image.tilesource.base._imageToNumpy(tile)[0]
+            tile = tile[:, :, [band - firstBand for band in bands]]
         return self._outputTile(tile, TILE_FORMAT_NUMPY, x, y, z,
                                 pilImageAllowed, numpyAllowed, **kwargs)
 
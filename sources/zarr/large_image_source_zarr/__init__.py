@@ -14,11 +14,14 @@ import packaging.version
 import zarr
 
 import large_image
-from large_image.cache_util import LruCacheMetaclass, methodcache
+from large_image.cache_util import LruCacheMetaclass, getCacheMany, methodcache
+from large_image.cache_util.cache import _methodcacheStore
 from large_image.constants import NEW_IMAGE_PATH_FLAG, TILE_FORMAT_NUMPY, SourcePriority
 from large_image.exceptions import TileSourceError, TileSourceFileNotFoundError
 from large_image.tilesource import FileTileSource
-from large_image.tilesource.resample import ResampleMethod, downsampleTileHalfRes
+from large_image.tilesource.resample import (ResampleMethod,
+                                             downsampleTileHalfRes,
+                                             downsampleTileLevels)
 from large_image.tilesource.utilities import _imageToNumpy, nearPowerOfTwo
 
 try:
@@ -486,6 +489,10 @@ class ZarrFileTileSource(FileTileSource, metaclass=LruCacheMetaclass):
 
         frame = self._getFrame(**kwargs)
         self._xyzInRange(x, y, z, frame, self._framecount)
+        bands = self._sourceBands(**kwargs)
+        firstBand = 0
+        if bands is not None:
+            kwargs['bands'] = None
         x0, y0, x1, y1, step = self._xyzToCorners(x, y, z)
         sidx = 0 if len(self._series) <= 1 else frame // self._strides['xy']
         targlevel = self.levels - 1 - z
@@ -502,29 +509,132 @@ class ZarrFileTileSource(FileTileSource, metaclass=LruCacheMetaclass):
             tile = self._getTileFromEmptyLevel(x, y, z, **kwargs)
             tile = large_image.tilesource.base._imageToNumpy(tile)[0]
         else:
-            idx = [slice(None) for _ in arr.shape]
-            idx[self._axes['x']] = slice(x0, x1, step)
-            idx[self._axes['y']] = slice(y0, y1, step)
-            for key in self._axes:
-                if key in self._strides:
-                    pos = (frame // self._strides[key]) % self._axisCounts[key]
-                    idx[self._axes[key]] = slice(pos, pos + 1)
-            trans = [idx for idx in range(len(arr.shape))
-                     if idx not in {self._axes['x'], self._axes['y'],
-                                    self._axes.get('s', self._axes['x'])}]
-            squeezeCount = len(trans)
-            trans += [self._axes['y'], self._axes['x']]
+            lastBand = None
+            if bands is not None and 's' in self._axes:
+                # Only read the range of channels that includes the bands
+                firstBand = min(bands)
+                lastBand = max(bands) + 1
+            tile = self._readFrameTiles(
+                arr, (x0, y0, x1, y1, step), [frame], firstBand, lastBand)[0]
+        if bands is not None:
+            tile = tile[:, :, [band - firstBand for band in bands]]
+        return self._outputTile(tile, TILE_FORMAT_NUMPY, x, y, z,
+                                pilImageAllowed, numpyAllowed, **kwargs)
+
+    def getFrameTiles(self, x, y, z, frames, max_workers=-4, **kwargs):
+        """
+        Get the same tile from several frames.  When the frames are near each
+        other in the zarr array, the frames that aren't in the tile cache are
+        read with a single request rather than one request per frame and are
+        added to the tile cache.  Otherwise, this is the same as the base
+        class.
+
+        :param x: the 0-based x position of the tile on the specified z level.
+        :param y: the 0-based y position of the tile on the specified z level.
+        :param z: the z level of the tile.
+        :param frames: a list of frame numbers.
+        :param max_workers: maximum workers for reading tiles in parallel.
+        :param kwargs: additional parameters to pass to getTile, such as
+            numpyAllowed.
+        :returns: a dictionary of tiles keyed by frame number.
+        """
+        if self._levels is None:
+            self._validateZarr()
+        frames = [int(frame) for frame in dict.fromkeys(frames)]
+        if (len(frames) < 2 or len(self._series) > 1 or getattr(self, '_style', None) or
+                kwargs.get('frame') is not None):
+            return super().getFrameTiles(x, y, z, frames, max_workers, **kwargs)
+        for frame in frames:
+            self._xyzInRange(x, y, z, frame, self._framecount)
+        # Use the tiles that getTile has already cached
+        keys = {self.getTile.cacheKey(self, x, y, z, frame=frame, **kwargs): frame
+                for frame in frames}
+        found = getCacheMany(self.cache, self.cache_lock, keys)
+        results = {keys[key]: tile for key, tile in found.items()}
+        missing = [frame for frame in frames if frame not in results]
+        if len(missing) < 2:
+            results.update({frame: self.getTile(x, y, z, frame=frame, **kwargs)
+                            for frame in missing})
+            return {frame: results[frame] for frame in frames}
+        frameKeys = {frame: key for key, frame in keys.items()}
+        frames = missing
+        # Only read frames together if that doesn't read many unused planes
+        planes = 1
+        for key in self._strides:
+            positions = [(frame // self._strides[key]) % self._axisCounts[key]
+                         for frame in frames]
+            planes *= max(positions) - min(positions) + 1
+        targlevel = self.levels - 1 - z
+        while targlevel and self._levels[0][targlevel] is None:
+            targlevel -= 1
+        scale = int(2 ** targlevel)
+        corners = [value // scale for value in self._xyzToCorners(x, y, z)]
+        if planes > 2 * len(frames) or corners[4] > 2 ** self._maxSkippedLevels:
+            results.update(super().getFrameTiles(x, y, z, frames, max_workers, **kwargs))
+            return {frame: results[frame] for frame in frameKeys}
+        bands = self._sourceBands(**kwargs)
+        firstBand, lastBand = 0, None
+        if bands is not None:
+            kwargs['bands'] = None
             if 's' in self._axes:
-                trans.append(self._axes['s'])
-            with self._tileLock:
-                tile = arr[tuple(idx)]
-                tile = np.transpose(tile, trans)
-            for _ in range(squeezeCount):
-                tile = tile.squeeze(0)
+                firstBand, lastBand = min(bands), max(bands) + 1
+        tiles = self._readFrameTiles(
+            self._levels[0][targlevel], corners, frames, firstBand, lastBand)
+        for frame, tile in zip(frames, tiles):
+            if bands is not None:
+                tile = tile[:, :, [band - firstBand for band in bands]]
+            results[frame] = self._outputTile(
+                tile, TILE_FORMAT_NUMPY, x, y, z, frame=frame, **kwargs)
+            _methodcacheStore(self, self.cache_lock, frameKeys[frame], results[frame])
+        return {frame: results[frame] for frame in frameKeys}
+
+    def _readFrameTiles(self, arr, corners, frames, firstBand=0, lastBand=None):
+        """
+        Read the same area of several frames from a zarr array with a single
+        request covering all of them.
+
+        :param arr: the zarr array of the level to read.
+        :param corners: a tuple of (x0, y0, x1, y1, step) in the array's
+            pixels.
+        :param frames: a list of frame numbers.
+        :param firstBand: the first band to read.
+        :param lastBand: one more than the last band to read, or None to read
+            the rest of the bands.
+        :returns: a list with a numpy array of shape (height, width, bands)
+            for each frame.
+        """
+        x0, y0, x1, y1, step = corners
+        idx = [slice(None) for _ in arr.shape]
+        idx[self._axes['x']] = slice(x0, x1, step)
+        idx[self._axes['y']] = slice(y0, y1, step)
+        positions = {}
+        for key in self._axes:
+            if key in self._strides:
+                positions[key] = [
+                    (frame // self._strides[key]) % self._axisCounts[key] for frame in frames]
+                idx[self._axes[key]] = slice(min(positions[key]), max(positions[key]) + 1)
+        if 's' in self._axes:
+            idx[self._axes['s']] = slice(firstBand, lastBand)
+        frameAxes = [axis for axis in range(len(arr.shape))
+                     if axis not in {self._axes['x'], self._axes['y'],
+                                     self._axes.get('s', self._axes['x'])}]
+        trans = frameAxes + [self._axes['y'], self._axes['x']]
+        if 's' in self._axes:
+            trans.append(self._axes['s'])
+        with self._tileLock:
+            data = arr[tuple(idx)]
+            data = np.transpose(data, trans)
+        axisKeys = {v: k for k, v in self._axes.items()}
+        tiles = []
+        for fidx in range(len(frames)):
+            tile = data[tuple(
+                positions[axisKeys[axis]][fidx] - idx[axis].start
+                if axisKeys.get(axis) in positions else 0
+                for axis in frameAxes)]
             if len(tile.shape) == 2:
                 tile = np.expand_dims(tile, axis=2)
-        return self._outputTile(tile, TILE_FORMAT_NUMPY, x, y, z,
-                                pilImageAllowed, numpyAllowed, **kwargs)
+            tiles.append(tile)
+        return tiles
 
     def _validateNewTile(self, tile, mask, placement, axes):
         if not isinstance(tile, np.ndarray) or axes is None:
@@ -850,6 +960,9 @@ class ZarrFileTileSource(FileTileSource, metaclass=LruCacheMetaclass):
             raise TileSourceError(msg)
 
         metadata = self.getMetadata()
+        if resample_method.value > ResampleMethod.PIL_MAX_ENUM.value:
+            self._generateDownsampledLevelsSweep(resample_method, metadata)
+            return
 
         if (
             resample_method.value < ResampleMethod.PIL_MAX_ENUM.value and
@@ -902,6 +1015,58 @@ class ZarrFileTileSource(FileTileSource, metaclass=LruCacheMetaclass):
                     )
             self._validateZarr()  # refresh self._levels before continuing
 
+    def _generateDownsampledLevelsSweep(self, resample_method, metadata):
+        """
+        Generate lower resolution levels with a numpy resample method.  Each
+        tile of a level is read once and reduced to as many of the following
+        levels as it can fill, so most images need only one pass over the
+        full resolution data.
+
+        :param resample_method: a numpy ``ResampleMethod``.
+        :param metadata: the metadata of this source.
+        """
+        sweep_size = 4096
+        sweep_levels = int(math.log2(sweep_size))
+        sorted_axes = [a[0] for a in sorted(self._axes.items(), key=lambda item: item[1])]
+        base = 0
+        while base < self.levels - 1:
+            count = min(self.levels - 1 - base, sweep_levels)
+            iterator_output = dict(
+                maxWidth=self.sizeX // 2 ** (base + 1),
+                maxHeight=self.sizeY // 2 ** (base + 1),
+            )
+            for frame in metadata.get('frames', [{'Index': 0}]):
+                frame_position = {
+                    k.replace('Index', '').lower(): v
+                    for k, v in frame.items()
+                    if k.replace('Index', '').lower() in self._axes
+                }
+                for tile in self.tileIterator(
+                    tile_size=dict(width=sweep_size, height=sweep_size),
+                    frame=frame['Index'],
+                    output=iterator_output,
+                    resample=False,
+                ):
+                    # Levels are limited to the size that reading them with
+                    # the tile iterator would give
+                    limits = [(
+                        self.sizeY // 2 ** (base + level) - tile['y'] // 2 ** level,
+                        self.sizeX // 2 ** (base + level) - tile['x'] // 2 ** level,
+                    ) for level in range(1, count)]
+                    new_tiles = downsampleTileLevels(
+                        tile['tile'], resample_method, count, limits)
+                    for level, new_tile in enumerate(new_tiles, 1):
+                        self.addTile(
+                            new_tile,
+                            x=tile['x'] // 2 ** level,
+                            y=tile['y'] // 2 ** level,
+                            **frame_position,
+                            axes=sorted_axes,
+                            level=base + level,
+                        )
+            self._validateZarr()  # refresh self._levels before continuing
+            base += count
+
     def write(
         self,
         path,
@@ -1,16 +1,24 @@
 import concurrent.futures
+import multiprocessing
 import os
 import threading
 import time
 
 import cachetools
+import large_image_source_test
+import numpy as np
+import PIL.Image
 import pytest
 
 import large_image.cache_util.cache
 from large_image import config
-from large_image.cache_util import (LruCacheMetaclass, MemCache, RedisCache,
-                                    cachesClear, cachesInfo, getTileCache,
-                                    methodcache, strhash)
+from large_image.cache_util import (CacheFactory, LruCacheMetaclass, MemCache,
+                                    PythonCache, RedisCache, SharedMemoryCache,
+                                    TieredCache, cachesClear, cachesInfo,
+                                    cachesStats, cachesStatsReset, decodeValue,
+                                    encodeValue, estimateSize, getCacheMany,
+                                    getTileCache, methodcache, strhash)
+from large_image.exceptions import TileCacheCodecError
 
 
 class Fib:
@@ -35,6 +43,346 @@ def testLRUCacheTools():
     cache_test(cachetools.Cache(1000))
 
 
+def testPythonCache():
+    cache_test(PythonCache(1000))
+
+
+def testEstimateSize():
+    assert estimateSize(b'abcd') == 4
+    assert estimateSize(np.zeros((16, 16, 3), dtype=np.uint16)) == 16 * 16 * 3 * 2
+    assert estimateSize(PIL.Image.new('RGBA', (16, 8))) == 16 * 8 * 4
+    assert estimateSize(PIL.Image.new('I;16', (16, 8))) == 16 * 8 * 2
+    assert estimateSize((b'abcd', np.zeros(10, dtype=np.float32))) > 44
+
+
+@pytest.mark.parametrize('value', [
+    np.arange(24, dtype='>f8').reshape((2, 3, 4)),
+    np.zeros((0, 3), dtype=np.uint8),
+    np.array(5),
+    np.arange(10)[::2],
+    np.asfortranarray(np.ones((3, 4))),
+    np.array(['2020-01-01'], dtype='M8[D]'),
+    np.array([1, None], dtype=object),
+])
+def testCacheCodecNumpy(value):
+    result = decodeValue(encodeValue(value))
+    assert result.dtype == value.dtype
+    assert result.shape == value.shape
+    assert list(result.flat) == list(value.flat)
+    assert result.flags.writeable
+
+
+def testCacheCodec():
+    for value in [354224848179261915075, 'abc', b'abc', {'a': [1, 2]}, None]:
+        assert decodeValue(encodeValue(value)) == value
+    tile = np.ones((256, 256, 3), dtype=np.uint16)
+    result = decodeValue(encodeValue((tile, 'image/png', b'abc')))
+    assert np.array_equal(result[0], tile)
+    assert result[0].flags.writeable
+    assert result[1:] == ('image/png', b'abc')
+    image = PIL.Image.new('RGB', (16, 8), (1, 2, 3))
+    assert decodeValue(encodeValue(image)).tobytes() == image.tobytes()
+    # The raw array is stored rather than a pickle of it
+    assert len(encodeValue(tile)) < tile.nbytes + 64
+    # Values written in a different format are refused
+    encoded = bytearray(encodeValue(tile))
+    encoded[3] += 1
+    with pytest.raises(TileCacheCodecError):
+        decodeValue(encoded)
+    with pytest.raises(TileCacheCodecError):
+        decodeValue(b'\x80\x04')
+
+
+@pytest.mark.parametrize('compression', ['lz4', 'zstd'])
+def testCacheCodecCompression(compression):
+    pytest.importorskip({'lz4': 'lz4', 'zstd': 'zstandard'}[compression])
+    tile = np.zeros((256, 256, 3), dtype=np.uint8)
+    config.setConfig('cache_codec_compression', compression)
+    try:
+        encoded = encodeValue(tile)
+        assert len(encoded) < tile.nbytes // 10
+        assert np.array_equal(decodeValue(encoded), tile)
+        assert decodeValue(encodeValue((tile, 1)))[1] == 1
+        # small values are not compressed
+        assert len(encodeValue(tile[:4])) > tile[:4].nbytes
+        config.setConfig('cache_codec_compression_threshold', 0)
+        assert len(encodeValue(tile[:64])) < tile[:64].nbytes
+    finally:
+        config.setConfig('cache_codec_compression', None)
+        config.setConfig('cache_codec_compression_threshold', 65536)
+
+
+def testPythonCacheByteLimit():
+    cache = PythonCache(1000, getsizeof=estimateSize)
+    for idx in range(10):
+        cache[idx] = np.zeros(100, dtype=np.uint8)
+    assert len(cache) == 10
+    assert cache.currsize == 1000
+    # A larger tile evicts several small ones
+    cache['large'] = np.zeros(100, dtype=np.float32)
+    assert len(cache) == 7
+    assert cache.evictions == 4
+    assert 0 not in cache
+    with pytest.raises(ValueError):
+        cache['toolarge'] = np.zeros(1001, dtype=np.uint8)
+    assert cache[9] is not None
+    with pytest.raises(KeyError):
+        cache[0]
+    assert cache.hits == 1
+    assert cache.misses == 1
+    cache.clear()
+    assert cache.currsize == 0
+    assert cache.evictions == 4
+
+
+def testPythonCacheMaxItems():
+    cache = PythonCache(1000, getsizeof=estimateSize, maxitems=3)
+    for idx in range(10):
+        cache[idx] = b'a'
+    assert len(cache) == 3
+    assert cache.currsize == 3
+    assert cache.evictions == 7
+
+
+def testCacheFactoryMemoryBytes():
+    try:
+        config.setConfig('cache_python_memory_bytes', 123456)
+        assert CacheFactory().getCacheMemorySize('tileCache') == 123456
+        config.setConfig('cache_tileCache_memory_bytes', 654321)
+        assert CacheFactory().getCacheMemorySize('tileCache') == 654321
+        assert CacheFactory().getCacheMemorySize('other') == 123456
+        cache, _ = CacheFactory().getCache(cacheName='tileCache', inProcess=True)
+        assert isinstance(cache, PythonCache)
+        assert cache.maxsize == 654321
+        config.setConfig('cache_python_memory_bytes', 0)
+        config.setConfig('cache_tileCache_memory_bytes', None)
+        assert CacheFactory().getCacheMemorySize('tileCache') == (
+            config.total_memory() // 32)
+    finally:
+        config.setConfig('cache_python_memory_bytes', 0)
+        config.setConfig('cache_tileCache_memory_bytes', None)
+
+
+def testCacheSharedMemory(tmp_path):
+    cache_test(SharedMemoryCache(str(tmp_path / 'cache'), 1024 ** 2 * 16))
+
+
+def testCheckCacheSharedMemory(tmp_path):
+    cache = SharedMemoryCache(str(tmp_path / 'cache'), 1024 ** 2 * 16)
+    cache_test(cache)
+    assert cache['(2,)'] == 1
+    assert cache['(100,)'] == 354224848179261915075
+    assert '(100,)' in cache
+    tile = np.arange(256 * 256 * 3, dtype=np.uint16).reshape((256, 256, 3))
+    cache['tile'] = tile
+    result = cache['tile']
+    assert result.dtype == tile.dtype
+    assert result.shape == tile.shape
+    assert np.array_equal(result, tile)
+    result[0, 0, 0] = 7
+    assert cache['tile'][0, 0, 0] == 0
+    assert cache.curritems >= 100
+    del cache['tile']
+    with pytest.raises(KeyError):
+        cache['tile']
+    # Another instance with the same path shares values
+    other = SharedMemoryCache(str(tmp_path / 'cache'))
+    assert other['(100,)'] == 354224848179261915075
+    other.clear()
+    assert '(100,)' not in cache
+    assert cache.curritems == 0
+
+
+def testSharedMemoryCacheOverwritesOldest(tmp_path):
+    cache = SharedMemoryCache(str(tmp_path / 'cache'), 1024 ** 2 * 16)
+    tile = np.zeros((256, 256), dtype=np.uint8)
+    for idx in range(1000):
+        cache['tile%d' % idx] = tile
+    assert cache.currsize <= cache.maxsize
+    assert 'tile0' not in cache
+    assert 'tile999' in cache
+    # values too large for a shard are not cached
+    cache['large'] = np.zeros(cache.maxsize, dtype=np.uint8)
+    assert 'large' not in cache
+
+
+def testSharedMemoryCacheLayoutChange(tmp_path):
+    path = str(tmp_path / 'cache')
+    cache = SharedMemoryCache(path, 1024 ** 2 * 16)
+    cache['a'] = 1
+    inode = os.stat(path).st_ino
+
+    class FewerShards(SharedMemoryCache):
+        shards = 4
+
+    # A different layout replaces the file rather than changing it under
+    # processes that have it mapped
+    other = FewerShards(path, 1024 ** 2 * 16)
+    assert os.stat(path).st_ino != inode
+    assert os.listdir(str(tmp_path)) == ['cache']
+    assert 'a' not in other
+    cache['b'] = np.zeros(1000)
+    assert cache['a'] == 1
+    # Keys are handled the same way by every method
+    other[5] = 'five'
+    assert 5 in other
+    assert other[5] == other['5'] == 'five'
+    assert FewerShards(path)[5] == 'five'
+    del other[5]
+    assert 5 not in other
+
+
+def testCacheTiered(tmp_path):
+    cache_test(TieredCache(SharedMemoryCache(str(tmp_path / 'cache'), 1024 ** 2 * 16)))
+
+
+def testTieredCache():
+    l2 = PythonCache(1000)
+    cache = TieredCache(l2, threading.Lock(), maxsize=256 * 256 * 2)
+    tile = np.zeros((256, 256), dtype=np.uint8)
+    cache['a'] = tile
+    # values are written to both tiers
+    assert 'a' in cache.l1
+    assert 'a' in l2
+    cache['b'] = tile
+    cache['c'] = tile
+    assert 'a' not in cache.l1
+    assert cache['c'] is tile
+    # a second tier hit is promoted
+    assert cache['a'] is tile
+    assert 'a' in cache.l1
+    stats = cache.tierStats()
+    assert stats['l1']['hits'] == 1
+    assert stats['l1']['evictions'] == 2
+    assert stats['l1']['promotions'] == 1
+    assert stats['l1']['items'] == 2
+    assert stats['l1']['maxsize'] == 256 * 256 * 2
+    assert stats['l2'] == {'hits': 1, 'misses': 0}
+    with pytest.raises(KeyError):
+        cache['d']
+    assert cache.tierStats()['l2']['misses'] == 1
+    results = cache.getMany(['a', 'b', 'c', 'd'])
+    assert set(results) == {'a', 'b', 'c'}
+    assert cache.tierStats()['l2'] == {'hits': 2, 'misses': 2}
+    del cache['a']
+    assert 'a' not in cache
+    cache.clear()
+    assert cache.curritems == 0
+    # without promotion, the first tier only holds written values
+    cache = TieredCache(l2, maxsize=256 * 256 * 2, promote=False)
+    l2['e'] = tile
+    assert cache['e'] is tile
+    assert 'e' not in cache.l1
+    assert cache.tierStats()['l1']['promotions'] == 0
+
+
+@pytest.mark.parametrize('cacheClass', [
+    PythonCache, SharedMemoryCache, TieredCache, cachetools.LRUCache])
+def testGetSetMany(tmp_path, cacheClass):
+    if cacheClass is SharedMemoryCache:
+        cache = SharedMemoryCache(str(tmp_path / 'cache'), 1024 ** 2 * 16)
+    elif cacheClass is TieredCache:
+        cache = TieredCache(SharedMemoryCache(str(tmp_path / 'cache'), 1024 ** 2 * 16))
+    else:
+        cache = cacheClass(100)
+    if hasattr(cache, 'setMany'):
+        cache.setMany({'a': 1, 'b': np.ones((2, 2)), 'c': 'three'})
+    else:
+        cache.update({'a': 1, 'b': np.ones((2, 2)), 'c': 'three'})
+    results = getCacheMany(cache, threading.Lock(), ['a', 'b', 'c', 'd'])
+    assert set(results.keys()) == {'a', 'b', 'c'}
+    assert results['a'] == 1
+    assert np.array_equal(results['b'], np.ones((2, 2)))
+    assert results['c'] == 'three'
+
+
+def testTileIteratorCachePrefetch(tmp_path):
+    source = large_image_source_test.TestTileSource(
+        None, sizeX=2000, sizeY=1000, tileWidth=256, tileHeight=256, noCache=True)
+    source.cache = SharedMemoryCache(str(tmp_path / 'cache'), 1024 ** 2 * 64)
+    source.cache_lock = threading.Lock()
+    calls = []
+    originalGetMany = source.cache.getMany
+
+    def getMany(keys):
+        calls.append(len(keys))
+        return originalGetMany(keys)
+
+    source.cache.getMany = getMany
+    first = [tile['tile'] for tile in source.tileIterator(format='numpy')]
+    # one request per row of 8 tiles
+    assert calls == [8, 8, 8, 8]
+    tileCount = large_image_source_test._counters['tiles']
+    second = [tile['tile'] for tile in source.tileIterator(format='numpy')]
+    assert large_image_source_test._counters['tiles'] == tileCount
+    assert len(calls) == 8
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    # If tiles aren't loaded, the cache isn't queried
+    assert len(list(source.tileIterator(format='numpy'))) == 32
+    assert len(calls) == 8
+
+
+def _sharedMemorySetValue(path):
+    cache = SharedMemoryCache(path)
+    cache['fromChild'] = np.ones((4, 4), dtype=np.float32)
+
+
+def testSharedMemoryCacheAcrossProcesses(tmp_path):
+    path = str(tmp_path / 'cache')
+    cache = SharedMemoryCache(path, 1024 ** 2 * 16)
+    proc = multiprocessing.get_context('spawn').Process(
+        target=_sharedMemorySetValue, args=(path, ))
+    proc.start()
+    proc.join()
+    assert np.array_equal(cache['fromChild'], np.ones((4, 4), dtype=np.float32))
+
+
+@pytest.mark.singular()
+def testGetTileCacheSharedMemory(tmp_path):
+    large_image.cache_util.cache._tileCache = None
+    large_image.cache_util.cache._tileLock = None
+    config.setConfig('cache_backend', 'sharedmemory')
+    config.setConfig('cache_sharedmemory_path', str(tmp_path / 'cache'))
+    config.setConfig('cache_sharedmemory_bytes', 1024 ** 2 * 16)
+    try:
+        tileCache, tileLock = getTileCache()
+        assert isinstance(tileCache, SharedMemoryCache)
+        assert 'tileCache' in cachesInfo()
+    finally:
+        config.setConfig('cache_sharedmemory_path', None)
+        config.setConfig('cache_sharedmemory_bytes', 0)
+        config.setConfig('cache_backend', None)
+        large_image.cache_util.cache._tileCache = None
+        large_image.cache_util.cache._tileLock = None
+
+
+@pytest.mark.singular()
+def testGetTileCacheTiered(tmp_path):
+    large_image.cache_util.cache._tileCache = None
+    large_image.cache_util.cache._tileLock = None
+    config.setConfig('cache_backend', 'tiered')
+    config.setConfig('cache_tiered_backend', 'sharedmemory')
+    config.setConfig('cache_tiered_memory_bytes', 1024 ** 2)
+    config.setConfig('cache_sharedmemory_path', str(tmp_path / 'cache'))
+    config.setConfig('cache_sharedmemory_bytes', 1024 ** 2 * 16)
+    try:
+        tileCache, tileLock = getTileCache()
+        assert isinstance(tileCache, TieredCache)
+        assert isinstance(tileCache.l2, SharedMemoryCache)
+        assert tileCache.l1.maxsize == 1024 ** 2
+        assert tileLock is None
+        tileCache['a'] = 1
+        assert cachesInfo()['tileCache']['tiers']['l1']['items'] == 1
+    finally:
+        config.setConfig('cache_sharedmemory_path', None)
+        config.setConfig('cache_sharedmemory_bytes', 0)
+        config.setConfig('cache_tiered_backend', None)
+        config.setConfig('cache_tiered_memory_bytes', 0)
+        config.setConfig('cache_backend', None)
+        large_image.cache_util.cache._tileCache = None
+        large_image.cache_util.cache._tileLock = None
+
+
 @pytest.mark.singular()
 def testCacheMemcached():
     cache_test(MemCache())
@@ -50,6 +398,9 @@ def testCheckCacheMemcached():
     assert val == 1
     val = cache['(100,)']
     assert val == 354224848179261915075
+    cache.setMany({'many_a': 1, 'many_b': 'two'})
+    assert cache.getMany(['(2,)', 'many_a', 'many_b', 'many_missing']) == {
+        '(2,)': 1, 'many_a': 1, 'many_b': 'two'}
 
 
 @pytest.mark.singular()
@@ -71,6 +422,9 @@ def testCheckCacheRedis():
     assert val == 1
     val = cache['(100,)']
     assert val == 354224848179261915075
+    cache.setMany({'many_a': 1, 'many_b': 'two'})
+    assert cache.getMany(['(2,)', 'many_a', 'many_b', 'many_missing']) == {
+        '(2,)': 1, 'many_a': 1, 'many_b': 'two'}
 
 
 def testBadMemcachedUrl():
@@ -90,7 +444,9 @@ def testGetTileCachePython():
     config.setConfig('cache_backend', 'python')
     tileCache, tileLock = getTileCache()
     assert isinstance(tileCache, cachetools.LRUCache)
+    assert isinstance(tileCache, PythonCache)
     assert 'tileCache' in cachesInfo()
+    assert cachesInfo()['tileCache']['items'] == 0
 
 
 @pytest.mark.singular()
@@ -164,6 +520,81 @@ class TestClass:
         for sum in sums:
             assert sum == loopSize * (loopSize - 1) / 2 + loopSize * sumDelta
 
+    def testMethodcacheCoalescing(self):
+        self.cache = cachetools.LRUCache(10)
+        self.cache_lock = threading.Lock()
+        calls = []
+        started = threading.Event()
+        release = threading.Event()
+
+        def keyFunc(x):
+            return str(x)
+
+        @methodcache(keyFunc)
+        def slow(self, x):
+            calls.append(x)
+            started.set()
+            release.wait(10)
+            if x < 0:
+                msg = 'negative'
+                raise ValueError(msg)
+            return [x]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+            first = executor.submit(slow, self, 3)
+            started.wait(10)
+            others = [executor.submit(slow, self, 3) for _ in range(3)]
+            time.sleep(0.1)
+            release.set()
+            results = [first.result()] + [other.result() for other in others]
+        # Only one thread computed the value; the others shared it
+        assert calls == [3]
+        assert all(result is results[0] for result in results)
+        assert slow(self, 3) is results[0]
+
+        # If the computing thread fails, the waiting threads compute it
+        calls[:] = []
+        started.clear()
+        release.clear()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(slow, self, -1)
+            started.wait(10)
+            other = executor.submit(slow, self, -1)
+            time.sleep(0.1)
+            release.set()
+            with pytest.raises(ValueError):
+                first.result()
+            with pytest.raises(ValueError):
+                other.result()
+        assert calls == [-1, -1]
+        assert not large_image.cache_util.cache._inFlightCalls
+
+        # A recursive call with the same key doesn't wait for itself
+        @methodcache(keyFunc)
+        def recurse(self, x):
+            calls.append(x)
+            return recurse(self, x) if len(calls) < 2 else x
+
+        calls[:] = []
+        assert recurse(self, 5) == 5
+        assert calls == [5, 5]
+
+        # If another thread stores the value after the first lookup, the
+        # leader uses it rather than computing it again
+        class LateCache(cachetools.LRUCache):
+            def __getitem__(self, key):
+                if key not in self:
+                    self[key] = ['stored']
+                    raise KeyError(key)
+                return super().__getitem__(key)
+
+        self.cache = LateCache(10)
+        calls[:] = []
+        release.set()
+        assert slow(self, 7) == ['stored']
+        assert calls == []
+        assert not large_image.cache_util.cache._inFlightCalls
+
     class ExampleWithMetaclass(metaclass=LruCacheMetaclass):
         cacheName = 'test'
         cacheMaxSize = 4
@@ -191,6 +622,54 @@ class TestClass:
         # memcached shows an items record as well
         assert 'items' in cachesInfo()['tileCache']
 
+    @pytest.mark.singular()
+    def testCachesStats(self):
+        cachesClear()
+        cachesStatsReset()
+        large_image.cache_util.cache._tileCache = None
+        large_image.cache_util.cache._tileLock = None
+        config.setConfig('cache_backend', 'python')
+        try:
+            self.ExampleWithMetaclass('stats')
+            self.ExampleWithMetaclass('stats')
+            stats = cachesInfo()['test']['stats']
+            assert stats['hits'] == 1
+            assert stats['misses'] == 1
+            assert stats['hitRatio'] == 0.5
+            assert stats['evictions'] == 0
+            assert stats['bytes'] is None
+            assert stats['classes']['ExampleWithMetaclass']['misses'] == 1
+
+            source = large_image_source_test.TestTileSource(None, noCache=True)
+            source.getTile(0, 0, 0)
+            source.getTile(0, 0, 0)
+            stats = cachesInfo()['tileCache']['stats']
+            assert stats['hits'] == 1
+            assert stats['misses'] == 1
+            assert stats['averageComputeTime'] > 0
+            assert stats['bytes'] > 0
+            assert stats['classes']['TestTileSource']['hits'] == 1
+            assert cachesStats()['tileCache']['hits'] == 1
+
+            self.cache = cachetools.LRUCache(10)
+            self.cache_lock = None
+
+            @methodcache(lambda x: str(x))
+            def double(self, x):
+                return x * 2
+
+            double(self, 1)
+            double(self, 1)
+            assert cachesStats()['methodcache']['classes']['TestClass']['hits'] == 1
+
+            cachesStatsReset()
+            assert cachesInfo()['tileCache']['stats']['hits'] == 0
+            assert cachesInfo()['tileCache']['stats']['hitRatio'] is None
+        finally:
+            config.setConfig('cache_backend', None)
+            large_image.cache_util.cache._tileCache = None
+            large_image.cache_util.cache._tileLock = None
+
     @pytest.mark.singular()
     def testCachesKeyLock(self):
         cachesClear()
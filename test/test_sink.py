@@ -8,7 +8,9 @@ from PIL import Image
 
 import large_image
 from large_image.constants import NEW_IMAGE_PATH_FLAG
-from large_image.tilesource.resample import ResampleMethod
+from large_image.tilesource.resample import (ResampleMethod,
+                                             downsampleTileHalfRes,
+                                             downsampleTileLevels)
 
 TMP_DIR = 'tmp/zarr_sink'
 FILE_TYPES = [
@@ -282,6 +284,117 @@ def testImageCopySmallDownsampling(resample_method, tmp_path):
     assert white_mask in expected_masks[resample_method]
 
 
+@pytest.mark.parametrize('resample_method', [
+    method for method in ResampleMethod
+    if method.value > ResampleMethod.PIL_MAX_ENUM.value])
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16, np.float32])
+def testDownsampleTileLevels(resample_method, dtype):
+    tile = np.random.default_rng(0).integers(0, 4, (83, 61, 3)).astype(dtype)
+    levels = downsampleTileLevels(tile, resample_method, 4)
+    assert len(levels) == 4
+    expected = tile
+    for level in levels:
+        expected = downsampleTileHalfRes(expected, resample_method)
+        assert level.dtype == tile.dtype
+        assert level.shape == expected.shape
+        assert np.array_equal(level, expected)
+    assert levels[-1].shape == (6, 4, 3)
+    levels = downsampleTileLevels(tile, resample_method, 4, [(40, 30), (20, 7), (0, 5)])
+    assert [level.shape[:2] for level in levels] == [(42, 31), (20, 15), (10, 4)]
+    assert np.array_equal(levels[2], downsampleTileHalfRes(levels[1][:20, :7], resample_method))
+    with pytest.raises(ValueError, match='not a numpy method'):
+        downsampleTileLevels(tile, ResampleMethod.PIL_LANCZOS, 2)
+
+
+def _stackHalfRes(tile, resample_method):
+    # The implementation of the numpy resample methods before they were
+    # rewritten, kept as a reference.
+    if resample_method == ResampleMethod.NP_NEAREST:
+        return tile[::2, ::2]
+    if tile.shape[0] % 2 != 0:
+        tile = np.append(tile, np.expand_dims(tile[-1], axis=0), axis=0)
+    if tile.shape[1] % 2 != 0:
+        tile = np.append(tile, np.expand_dims(tile[:, -1], axis=1), axis=1)
+    subarrays = np.asarray([
+        tile[0::2, 0::2], tile[1::2, 0::2], tile[0::2, 1::2], tile[1::2, 1::2]])
+    reductions = {
+        ResampleMethod.NP_MEAN: np.mean,
+        ResampleMethod.NP_MEDIAN: np.median,
+        ResampleMethod.NP_MAX: np.max,
+        ResampleMethod.NP_MIN: np.min,
+    }
+    if resample_method in reductions:
+        return reductions[resample_method](subarrays, axis=0).astype(tile.dtype)
+    if resample_method == ResampleMethod.NP_MAX_COLOR:
+        pixel_selection = np.argmax(np.sum(subarrays, axis=3), axis=0)
+    elif resample_method == ResampleMethod.NP_MIN_COLOR:
+        pixel_selection = np.argmin(np.sum(subarrays, axis=3), axis=0)
+    else:
+        pixel_selection = np.where(
+            ((subarrays[1] == subarrays[2]).all(axis=2) |
+             (subarrays[1] == subarrays[3]).all(axis=2)),
+            1, np.where((subarrays[2] == subarrays[3]).all(axis=2), 2, 0))
+    pixel_selection = np.repeat(np.expand_dims(pixel_selection, axis=2), tile.shape[2], axis=2)
+    return np.choose(pixel_selection, subarrays).astype(tile.dtype)
+
+
+@pytest.mark.parametrize('resample_method', [
+    method for method in ResampleMethod
+    if method.value > ResampleMethod.PIL_MAX_ENUM.value])
+@pytest.mark.parametrize(('dtype', 'maxValue'), [
+    (np.uint8, 4), (np.uint8, 256), (np.uint16, 65536), (np.float32, 4), (np.float32, None)])
+def testDownsampleTileHalfResMatchesStack(resample_method, dtype, maxValue):
+    rng = np.random.default_rng(0)
+    for shape in [(83, 61, 3), (64, 48, 4), (1, 7, 3), (9, 1, 5)]:
+        # Few distinct values give ties for the median and mode
+        tile = (rng.integers(0, maxValue, shape) if maxValue else rng.random(shape)).astype(dtype)
+        result = downsampleTileHalfRes(tile, resample_method)
+        expected = _stackHalfRes(tile, resample_method)
+        assert result.dtype == expected.dtype
+        assert np.array_equal(result, expected)
+
+
+def testTileIteratorFrames(monkeypatch):
+    sink = large_image_source_zarr.new()
+    for c in range(3):
+        for z in range(4):
+            sink.addTile(np.random.random((700, 900, 2)), 0, 0, c=c, z=z)
+    reads = []
+    readFrameTiles = sink._readFrameTiles
+
+    def countReads(arr, corners, frames, *args):
+        reads.append(frames)
+        return readFrameTiles(arr, corners, frames, *args)
+
+    monkeypatch.setattr(sink, '_readFrameTiles', countReads)
+    # Frames 0-5 are read together; 0 and 11 are too far apart
+    for frames, together in [([0, 1, 2, 3, 4, 5], True), ([0, 11], False)]:
+        reads[:] = []
+        for tile in sink.tileIterator(frames=frames, format='numpy'):
+            assert tile['tile'].shape == (len(frames), tile['height'], tile['width'], 2)
+            for idx, frame in enumerate(frames):
+                single = sink.getTile(
+                    tile['level_x'], tile['level_y'], tile['level'], frame=frame,
+                    numpyAllowed='always')
+                assert np.array_equal(
+                    tile['tile'][idx], single[:tile['height'], :tile['width']])
+        assert (frames in reads) == together
+    # Tiles read together are cached, so only uncached frames are read
+    reads[:] = []
+    tiles = sink.getFrameTiles(0, 0, sink.levels - 1, [4, 5, 6, 7], numpyAllowed='always')
+    assert reads == [[6, 7]]
+    reads[:] = []
+    again = sink.getFrameTiles(0, 0, sink.levels - 1, [4, 5, 6, 7], numpyAllowed='always')
+    assert reads == []
+    for frame in [4, 5, 6, 7]:
+        assert np.array_equal(again[frame], tiles[frame])
+        assert np.array_equal(tiles[frame], sink.getTile(
+            0, 0, sink.levels - 1, frame=frame, numpyAllowed='always'))
+    tiles = sink.getFrameTiles(0, 0, sink.levels - 1, [1, 2], bands=[2], numpyAllowed='always')
+    single = sink.getTile(0, 0, sink.levels - 1, frame=2, numpyAllowed='always')
+    assert np.array_equal(tiles[2][:, :, 0], single[:, :, 1])
+
+
 def testCropAndDownsample(tmp_path):
     output_file = tmp_path / 'cropped.db'
     sink = large_image_source_zarr.new()
@@ -481,3 +594,71 @@ def testAddAssociatedImages(tmp_path):
             assert isinstance(retrieved, Image.Image)
             # PIL Image size doesn't include bands and swaps x & y
             assert retrieved.size == (expected_size[1], expected_size[0])
+
+
+def _maxFilter(tile):
+    # A 3x3 maximum filter that repeats the edge pixels of the tile
+    image = tile['tile'][:, :, :3]
+    padded = np.pad(image, ((1, 1), (1, 1), (0, 0)), mode='edge')
+    return np.max([
+        padded[y:y + image.shape[0], x:x + image.shape[1]]
+        for y in range(3) for x in range(3)], axis=0)
+
+
+def _tilePosition(tile):
+    return np.full(tile['tile'].shape[:2], tile['tile_position']['position'], dtype=np.uint8)
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def testMapTilesToSink(tmp_path, executor):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=5, tileWidth=256, tileHeight=256, sizeX=1300, sizeY=1100)
+    region = dict(left=100, top=50, width=1150, height=1000)
+    image = ts.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY, region=region)[0]
+    expected = _maxFilter({'tile': image})
+
+    output_file = tmp_path / 'filtered.db'
+    progress = []
+    sink = ts.mapTilesToSink(
+        _maxFilter, halo=1, path=str(output_file), writeParams={'lossy': False},
+        workers=2, executor=executor, region=region,
+        progress=lambda done, total: progress.append((done, total)))
+    assert sink.sizeX == 1150
+    assert sink.sizeY == 1000
+    assert progress[-1] == (6, 6)
+    result = sink.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY)[0]
+    np.testing.assert_array_equal(result, expected)
+
+    written = large_image.open(output_file)
+    assert written.sizeX == 1150
+    assert written.levels == sink.levels
+    np.testing.assert_array_equal(
+        written.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY)[0], expected)
+
+    # Each tile fills whole chunks of the sink
+    sink = ts.mapTilesToSink(_tilePosition, halo=5, workers=1, region=region)
+    result = sink.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY)[0][:, :, 0]
+    assert result.shape == (1000, 1150)
+    np.testing.assert_array_equal(
+        result, np.arange(6).reshape(2, 3).repeat(512, 0).repeat(512, 1)[:1000, :1150])
+
+    # Without a halo, tiles still start at the region, even when they are
+    # the same size as the source's tiles
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=5, tileWidth=512, tileHeight=512, sizeX=1300, sizeY=1100)
+    region = dict(left=300, top=200, width=700, height=600)
+    sink = ts.mapTilesToSink(_maxFilter, workers=1, region=region)
+    assert sink.tileWidth == 512
+    image = ts.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY, region=region)[0]
+    result = sink.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY)[0]
+    assert result.shape == (600, 700, 3)
+    for y in range(0, 600, 512):
+        for x in range(0, 700, 512):
+            np.testing.assert_array_equal(
+                result[y:y + 512, x:x + 512],
+                _maxFilter({'tile': image[y:y + 512, x:x + 512]}))
+
+    with pytest.raises(ValueError, match='same size'):
+        ts.mapTilesToSink(lambda tile: tile['tile'][::2, ::2], workers=1)
+    with pytest.raises(ValueError, match='tile_size'):
+        ts.mapTilesToSink(_maxFilter, tile_size=dict(width=100, height=100))
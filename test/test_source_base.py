@@ -5,6 +5,7 @@ import re
 import sys
 from pathlib import Path
 
+import large_image_source_test
 import numpy as np
 import PIL.Image
 import pytest
@@ -358,6 +359,36 @@ def testLazyTileRelease():
     assert tiles[5]['tile'] == data
 
 
+def testTileIteratorPrefetch():
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=4, tileWidth=64, tileHeight=64)
+    tiles = list(ts.tileIterator(format=large_image.constants.TILE_FORMAT_NUMPY))
+    tileIter = ts.tileIterator(
+        format=large_image.constants.TILE_FORMAT_NUMPY, prefetch=3, workers=2)
+    prefetched = []
+    for tile in tileIter:
+        assert tile.loaded
+        assert len(tileIter._pending) <= 3
+        prefetched.append(tile)
+    assert len(prefetched) == len(tiles) == 256
+    for tile, other in zip(tiles, prefetched):
+        assert tile['tile_position'] == other['tile_position']
+        assert np.array_equal(tile['tile'], other['tile'])
+    assert tileIter._pool is None
+    prefetched[5].release()
+    assert not prefetched[5].loaded
+    assert np.array_equal(prefetched[5]['tile'], tiles[5]['tile'])
+
+    tileIter = ts.tileIterator(
+        format=large_image.constants.TILE_FORMAT_NUMPY, prefetch=4, workers=-2)
+    tile = next(tileIter)
+    assert tile['tile_position']['position'] == 0
+    assert len(tileIter._pending) == 4
+    tileIter.close()
+    assert not len(tileIter._pending)
+    assert next(tileIter, None) is None
+
+
 def testTileOverlapWithRegionOffset():
     imagePath = datastore.fetch('sample_image.ptif')
     ts = large_image.open(imagePath)
@@ -382,6 +413,703 @@ def testGetRegionAutoOffset():
     assert np.all(region2 == region1)
 
 
+@pytest.mark.parametrize('dtype', [np.uint8, np.int16, np.uint16])
+def testHistogramAccumulatorExact(dtype):
+    from large_image.tilesource.histogram import HistogramAccumulator
+
+    rng = np.random.default_rng(0)
+    info = np.iinfo(dtype)
+    data = rng.integers(max(info.min, -1000), min(info.max, 3000), (300, 400, 3)).astype(dtype)
+    for histRange in [None, 'round', [10, 500]]:
+        accumulator = HistogramAccumulator(bins=17, histRange=histRange)
+        accumulator.add(data[:150])
+        other = HistogramAccumulator(bins=17, histRange=histRange)
+        other.add(data[150:, :100])
+        other.add(data[150:, 100:])
+        accumulator.merge(other)
+        result = accumulator.result()
+        for idx, entry in enumerate(result['histogram']):
+            band = data[:, :, idx]
+            assert entry['min'] == band.min()
+            assert entry['max'] == band.max()
+            assert entry['mean'] == pytest.approx(band.mean())
+            assert entry['stdev'] == pytest.approx(band.std())
+            hist, edges = np.histogram(band, entry['bins'], entry['range'])
+            assert np.array_equal(entry['hist'], hist)
+            assert np.array_equal(entry['bin_edges'], edges)
+            assert entry['samples'] == hist.sum()
+
+
+def testHistogramAccumulatorSketch():
+    from large_image.tilesource.histogram import HistogramAccumulator
+
+    rng = np.random.default_rng(0)
+    data = (rng.normal(size=(300, 400, 2)) * 100).astype(np.float32)
+    accumulator = HistogramAccumulator(bins=32)
+    accumulator.add(data[:150] / 100)
+    other = HistogramAccumulator(bins=32)
+    other.add(data[150:])
+    accumulator.merge(other)
+    single = HistogramAccumulator(bins=32)
+    single.add(np.concatenate([data[:150] / 100, data[150:]]))
+    merged = accumulator.result()
+    result = single.result()
+    for idx in range(2):
+        assert np.array_equal(merged['histogram'][idx]['hist'], result['histogram'][idx]['hist'])
+    band = data[:, :, 1]
+    band[:150] /= 100
+    entry = result['histogram'][1]
+    assert entry['min'] == band.min()
+    hist, edges = np.histogram(band, entry['bins'], entry['range'])
+    # Values within one fine bin of an edge may be counted in the next bin
+    assert np.abs(entry['hist'] - hist).max() <= 0.001 * band.size
+    assert entry['samples'] == band.size
+    # Integer valued data spanning fewer values than the number of fine bins
+    # is exact
+    data = rng.integers(-50, 5000, (200, 300, 1)).astype(np.int32)
+    accumulator = HistogramAccumulator(bins=13, histRange='round')
+    accumulator.add(data)
+    entry = accumulator.result()['histogram'][0]
+    hist, edges = np.histogram(data, entry['bins'], entry['range'])
+    assert np.array_equal(entry['hist'], hist)
+
+
+def testTileBands():
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=3, tileWidth=128, tileHeight=128,
+        bands='a=0-1000,b=0-2000,c=0-3000,d=0-4000,e=0-5000')
+    full = ts.getTile(1, 2, 2, numpyAllowed='always')
+    tile = ts.getTile(1, 2, 2, numpyAllowed='always', bands=[4, 2])
+    assert np.array_equal(tile, full[:, :, [3, 1]])
+    tile = ts.getTile(1, 2, 2, pilImageAllowed=True, bands=3)
+    assert isinstance(tile, PIL.Image.Image)
+    assert len(tile.getbands()) == 1
+    for tile in ts.tileIterator(format=large_image.constants.TILE_FORMAT_NUMPY, bands=[5, 1]):
+        assert tile['tile'].shape[2] == 2
+    region, _ = ts.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY)
+    bandRegion, _ = ts.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY, bands=[2, 3])
+    assert np.array_equal(bandRegion, region[:, :, [1, 2]])
+    with pytest.raises(large_image.exceptions.TileSourceError, match='Band 6 does not'):
+        ts.getTile(1, 2, 2, numpyAllowed='always', bands=[6])
+    # With a style, bands are selected from the styled tile
+    styled = large_image_source_test.TestTileSource(
+        None, maxLevel=3, tileWidth=128, tileHeight=128,
+        bands='a=0-1000,b=0-2000,c=0-3000,d=0-4000,e=0-5000',
+        style={'band': 5, 'palette': ['#000', '#f80']})
+    full = styled.getTile(1, 2, 2, numpyAllowed='always')
+    assert full.shape[2] == 4
+    tile = styled.getTile(1, 2, 2, numpyAllowed='always', bands=[2])
+    assert np.array_equal(tile, full[:, :, [1]])
+
+
+def testTileBandsTifffile(tmp_path):
+    large_image_source_tifffile = pytest.importorskip('large_image_source_tifffile')
+    tifffile = pytest.importorskip('tifffile')
+
+    data = np.random.default_rng(0).integers(0, 65535, (6, 700, 900), dtype=np.uint16)
+    path = str(tmp_path / 'planar.tiff')
+    tifffile.imwrite(
+        path, data, tile=(256, 256), planarconfig='separate', photometric='minisblack')
+    ts = large_image_source_tifffile.open(path, noCache=True)
+    z = ts.levels - 1
+    full = ts.getTile(1, 1, z, numpyAllowed='always')
+    assert full.shape[2] == 6
+    tile = ts.getTile(1, 1, z, numpyAllowed='always', bands=[5, 2])
+    assert np.array_equal(tile, full[:, :, [4, 1]])
+    region, _ = ts.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY, bands=3)
+    assert np.array_equal(region[:, :, 0], data[2])
+
+
+@pytest.mark.parametrize('bands', [None, 'a=1000-60000,b=0-4000,c=0-65535'])
+@pytest.mark.parametrize('style', [
+    {'bands': [
+        {'band': 1, 'palette': '#f00'},
+        {'band': 2, 'palette': 'viridis', 'min': 'min', 'max': 'max:0.02'},
+        {'band': 3, 'palette': ['#000', '#f80', '#fff'], 'scheme': 'discrete',
+         'min': 100, 'max': 20000, 'clamp': False, 'nodata': 5}]},
+    {'bands': [
+        {'band': 2, 'palette': '#0ff'},
+        {'band': 1, 'palette': ['#fff', '#f00'], 'composite': 'multiply'},
+        {'band': 'alpha'}], 'dtype': 'source'},
+    {'band': 2, 'palette': '#fff'},
+])
+def testStyleBandLUT(monkeypatch, bands, style):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=5, tileWidth=128, tileHeight=128, bands=bands,
+        style=style, noCache=True)
+    image = ts._unstyledInstance.getTile(3, 2, 5, numpyAllowed='always')
+    compiled = ts._applyStyle(image, ts.style, 3, 2, 5)
+    assert len(ts._styleLUTs)
+    monkeypatch.setattr(ts, '_styleBandLUT', lambda *args: None)
+    direct = ts._applyStyle(image, ts.style, 3, 2, 5)
+    assert compiled.dtype == direct.dtype
+    assert np.array_equal(compiled, direct)
+
+
+def testGetFrameTiles(monkeypatch):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=5, tileWidth=128, tileHeight=128, frames=6)
+    tiles = ts.getFrameTiles(1, 2, 4, [3, 0, 3, 5], numpyAllowed='always')
+    assert list(tiles) == [3, 0, 5]
+    for frame, tile in tiles.items():
+        assert np.array_equal(tile, ts.getTile(1, 2, 4, frame=frame, numpyAllowed='always'))
+    assert ts.getFrameTiles(1, 2, 4, [1, 2], max_workers=1)[2] == ts.getTile(1, 2, 4, frame=2)
+
+    style = {'bands': [
+        {'frame': 1, 'band': 1, 'palette': '#f00', 'min': 0, 'max': 255},
+        {'framedelta': 2, 'band': 1, 'palette': '#0f0', 'min': 0, 'max': 255},
+        {'band': 1, 'palette': '#00f', 'min': 0, 'max': 255},
+    ]}
+    styled = large_image_source_test.TestTileSource(
+        None, maxLevel=5, tileWidth=128, tileHeight=128, frames=6, style=style,
+        noCache=True)
+    calls = []
+    unstyled = styled._unstyledInstance
+    original = unstyled.getFrameTiles
+
+    def getFrameTiles(*args, **kwargs):
+        calls.append(args[3])
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(unstyled, 'getFrameTiles', getFrameTiles)
+    tile = styled.getTile(1, 2, 4, frame=3, numpyAllowed='always')
+    assert calls == [[1, 5]]
+    for band, frame in enumerate([1, 5, 3]):
+        image = unstyled.getTile(1, 2, 4, frame=frame, numpyAllowed='always')
+        assert np.array_equal(tile[:, :, band], image[:, :, 0])
+
+
+def testBandRangesCache(monkeypatch):
+    style = {'bands': [
+        {'frame': frame, 'band': 1, 'palette': color, 'min': 'min', 'max': 'max:0.01'}
+        for frame, color in enumerate(['#f00', '#0f0', '#00f'])]}
+    kwargs = {'maxLevel': 5, 'tileWidth': 128, 'tileHeight': 128,
+              'frames': 4, 'bands': 'a=1000-60000,b=0-4000', 'style': style}
+    ts = large_image_source_test.TestTileSource(None, noCache=True, **kwargs)
+    tile = ts.getTile(1, 2, 4, numpyAllowed='always')
+    # All of the frames the style uses are scanned on the first tile
+    assert sorted(ts._bandRanges) == [0, 1, 2]
+    assert all('histogram' in ts._bandRanges[frame] for frame in range(3))
+
+    def histogram(*args, **kwargs):
+        raise AssertionError
+
+    # Reopening the source reuses the stored band ranges
+    ts2 = large_image_source_test.TestTileSource(None, noCache=True, **kwargs)
+    monkeypatch.setattr(ts2._unstyledInstance, 'histogram', histogram)
+    assert np.array_equal(ts2.getTile(1, 2, 4, numpyAllowed='always'), tile)
+    # A different source doesn't
+    kwargs['bands'] = 'a=1000-60000,b=0-4001'
+    ts3 = large_image_source_test.TestTileSource(None, noCache=True, **kwargs)
+    monkeypatch.setattr(ts3._unstyledInstance, 'histogram', histogram)
+    with pytest.raises(AssertionError):
+        ts3.getTile(1, 2, 4, numpyAllowed='always')
+
+
+def testSourceCacheKey(monkeypatch, tmp_path):
+    ts = large_image_source_test.TestTileSource(None, maxLevel=5)
+    assert ts._sourceCacheKey('kind') is not None
+    # A directory could change without changing its modification time
+    monkeypatch.setattr(ts, '_initValues', ((str(tmp_path), ), {}))
+    assert ts._sourceCacheKey('kind') is None
+    monkeypatch.setattr(ts, '_initValues', ((str(tmp_path / 'missing'), ), {}))
+    assert ts._sourceCacheKey('kind') is None
+    path = tmp_path / 'file.txt'
+    path.write_text('data')
+    monkeypatch.setattr(ts, '_initValues', ((str(path), ), {}))
+    key = ts._sourceCacheKey('kind')
+    assert key is not None
+    path.write_text('changed data')
+    assert ts._sourceCacheKey('kind') != key
+
+
+def testStyleBandLUTCache():
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=5, tileWidth=128, tileHeight=128, frames=30,
+        bands='a=1000-60000,b=0-4000', noCache=True, style={'bands': [
+            {'band': 1, 'palette': '#f00', 'min': 1000, 'max': 50000},
+            {'band': 2, 'palette': '#0f0', 'min': 0, 'max': 'full'}]})
+    unstyled = ts._unstyledInstance
+    for frame in range(30):
+        image = unstyled.getTile(0, 0, 5, frame=frame, numpyAllowed='always')
+        ts._applyStyle(image, ts.style, 0, 0, 5, frame)
+    # Explicit ranges are the same for every frame
+    assert len(ts._styleLUTs) == 2
+    ts.style = {'bands': [{'band': 1, 'palette': '#f00', 'max': 'max'}]}
+    for frame in range(30):
+        image = unstyled.getTile(0, 0, 5, frame=frame, numpyAllowed='always')
+        ts._applyStyle(image, ts.style, 0, 0, 5, frame)
+    assert len(ts._styleLUTs) == 30
+    # The tables are limited by their total size
+    ts._styleLUTCacheBytes = 0
+    ts.style = {'bands': [{'band': 1, 'palette': '#f00', 'max': 'max'}]}
+    for frame in range(30):
+        image = unstyled.getTile(0, 0, 5, frame=frame, numpyAllowed='always')
+        ts._applyStyle(image, ts.style, 0, 0, 5, frame)
+    assert 0 < len(ts._styleLUTs) < 30
+    assert ts._styleLUTs.currsize <= ts._styleLUTs.maxsize
+
+
+def testStyleBandLUTCacheManyBands(monkeypatch):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=5, tileWidth=128, tileHeight=128, frames=20,
+        bands='a=1000-60000', noCache=True, style={'bands': [
+            {'frame': frame, 'band': 1, 'palette': '#f00', 'max': 'max'}
+            for frame in range(20)]})
+    builds = []
+    original = large_image.tilesource.base.StyleBandLUT
+
+    def countingLUT(*args, **kwargs):
+        builds.append(1)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(large_image.tilesource.base, 'StyleBandLUT', countingLUT)
+    ts.getTile(0, 0, 5, numpyAllowed='always')
+    assert len(builds) == 20
+    # Every table is reused for other tiles
+    ts.getTile(1, 0, 5, numpyAllowed='always')
+    ts.getTile(0, 1, 5, numpyAllowed='always')
+    assert len(builds) == 20
+
+
+def testHistogramParallelDefault(monkeypatch):
+    import concurrent.futures
+
+    def noPool(*args, **kwargs):
+        msg = 'No pool should be used'
+        raise AssertionError(msg)
+
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=6, tileWidth=64, tileHeight=64)
+    # The test source holds the GIL, so its tiles are read in this thread
+    # unless processes are requested
+    monkeypatch.setattr(concurrent.futures, 'ProcessPoolExecutor', noPool)
+    monkeypatch.setattr(concurrent.futures, 'ThreadPoolExecutor', noPool)
+    assert ts.histogram.__wrapped__(ts, max_workers=3, output={'maxWidth': 1000})
+    with pytest.raises(AssertionError, match='No pool'):
+        ts.histogram.__wrapped__(ts, max_workers=3, executor='thread', output={'maxWidth': 1000})
+    with pytest.raises(ValueError, match='executor must'):
+        ts.histogram.__wrapped__(ts, executor='fiber')
+
+
+@pytest.mark.parametrize('executor', ['thread', 'process'])
+def testHistogramParallel(executor):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=6, tileWidth=64, tileHeight=64)
+    kwargs = {'output': {'maxWidth': 1000}, 'bins': 19}
+    # The number of workers doesn't change the result, so it isn't cached
+    # separately
+    assert (ts.histogram.cacheKey(ts, max_workers=1, **kwargs) ==
+            ts.histogram.cacheKey(ts, max_workers=3, executor=executor, **kwargs))
+    serial = ts.histogram(max_workers=1, **kwargs)
+    # Call the uncached method, since the result is cached
+    parallel = ts.histogram.__wrapped__(ts, max_workers=3, executor=executor, **kwargs)
+    assert len(parallel['histogram']) == len(serial['histogram'])
+    for entry, expected in zip(parallel['histogram'], serial['histogram']):
+        for key in {'min', 'max', 'samples', 'range'}:
+            assert entry[key] == expected[key]
+        assert entry['mean'] == pytest.approx(expected['mean'])
+        assert np.array_equal(entry['hist'], expected['hist'])
+    # uint8 tiles are scaled when asking for uint16 and skipped otherwise
+    result = ts.histogram(dtype=np.uint16, max_workers=3, **kwargs)
+    assert result['histogram'][0]['max'] == int(serial['histogram'][0]['max']) * 257
+    result = ts.histogram(dtype=np.float32, max_workers=3, **kwargs)
+    assert result == {}
+
+
+@pytest.mark.parametrize('max_workers', [4, -2, None])
+def testGetRegionParallel(max_workers):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=6, tileWidth=64, tileHeight=64)
+    for kwargs in [
+        dict(region=dict(left=20, top=40, width=4000, height=3000),
+             output=dict(maxWidth=1000)),
+        dict(region=dict(left=100, top=30, width=700, height=500),
+             tile_size=dict(width=128, height=96)),
+        dict(region=dict(left=100, top=30, width=700, height=500),
+             tile_size=dict(width=128, height=96), tile_overlap=dict(x=16, y=16)),
+    ]:
+        region1, _ = ts.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY, **kwargs)
+        region2, _ = ts.getRegion(
+            format=large_image.constants.TILE_FORMAT_NUMPY, max_workers=max_workers, **kwargs)
+        assert region1.shape == region2.shape
+        assert np.array_equal(region1, region2)
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def testGetRegionOut(tmp_path, max_workers):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=6, tileWidth=64, tileHeight=64)
+    kwargs = dict(
+        region=dict(left=100, top=30, width=700, height=500),
+        tile_size=dict(width=128, height=96),
+        format=large_image.constants.TILE_FORMAT_NUMPY,
+        max_workers=max_workers)
+    region, _ = ts.getRegion(**kwargs)
+    out = np.zeros((500, 700, region.shape[2]), dtype=region.dtype)
+    result, _ = ts.getRegion(out=out, **kwargs)
+    assert result is out
+    assert np.array_equal(out, region)
+    # Tiles are converted to the bands of the output
+    out = np.zeros((500, 700, 4), dtype=np.uint16)
+    ts.getRegion(out=out, **kwargs)
+    assert np.array_equal(out[:, :, :3], region)
+    assert np.all(out[:, :, 3] == 255)
+    # A memmap is created with the dtype and bands of the region
+    result, _ = ts.getRegion(out=tmp_path / 'region.raw', **kwargs)
+    assert isinstance(result, np.memmap)
+    assert np.array_equal(result, region)
+    assert os.path.getsize(tmp_path / 'region.raw') == region.size * region.itemsize
+    # Scaled regions are copied to out
+    scaled, _ = ts.getRegion(output=dict(maxWidth=350), **kwargs)
+    out = np.zeros(scaled.shape, dtype=scaled.dtype)
+    ts.getRegion(output=dict(maxWidth=350), out=out, **kwargs)
+    assert np.array_equal(out, scaled)
+    with pytest.raises(ValueError, match='must have a shape'):
+        ts.getRegion(out=np.zeros((500, 600, 3), dtype=np.uint8), **kwargs)
+    out = np.zeros((500, 700, 1), dtype=np.uint8)
+    with pytest.raises(ValueError, match='fewer bands'):
+        ts.getRegion(out=out, **kwargs)
+    with pytest.raises(ValueError, match='TILED'):
+        ts.getRegion(
+            region=kwargs['region'], format=large_image.constants.TILE_FORMAT_IMAGE,
+            encoding='TILED', out=out)
+
+
+def testTileIteratorFrames(monkeypatch):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=4, tileWidth=64, tileHeight=64, sizeX=300, sizeY=200, frames=5)
+    calls = []
+    getFrameTiles = ts.getFrameTiles
+
+    def countFrameTiles(*args, **kwargs):
+        calls.append(args[3])
+        return getFrameTiles(*args, **kwargs)
+
+    monkeypatch.setattr(ts, 'getFrameTiles', countFrameTiles)
+    frames = [3, 1, 4]
+    for kwargs in [
+        {},
+        {'region': {'left': 10, 'top': 20, 'width': 150, 'height': 100}},
+        {'tile_size': {'width': 100, 'height': 80}, 'tile_overlap': {'x': 4, 'y': 4}},
+        {'output': {'maxWidth': 150}},
+    ]:
+        calls[:] = []
+        count = 0
+        for tile in ts.tileIterator(format=large_image.constants.TILE_FORMAT_NUMPY,
+                                    frames=frames, **kwargs):
+            assert tile['frames'] == frames
+            assert tile['tile'].shape == (3, tile['height'], tile['width'], 3)
+            for idx, frame in enumerate(frames):
+                single = ts.getSingleTile(
+                    format=large_image.constants.TILE_FORMAT_NUMPY, frame=frame,
+                    tile_position=tile['tile_position']['position'], **kwargs)
+                assert np.array_equal(tile['tile'][idx], single['tile'])
+            count += 1
+        assert count == tile['iterator_range']['position']
+        if 'tile_size' not in kwargs:
+            assert calls == [frames] * count
+    with pytest.raises(ValueError, match='only be returned as numpy'):
+        ts.tileIterator(format=large_image.constants.TILE_FORMAT_PIL, frames=frames)
+
+
+@pytest.mark.parametrize('kwargs', [
+    {},
+    {'region': {'left': 37, 'top': 11, 'width': 400, 'height': 301}},
+    {'tile_size': {'width': 100}, 'tile_overlap': {'x': 10, 'y': 6}},
+    {'tile_size': {'width': 100}, 'tile_overlap': {'x': 10, 'y': 6, 'edges': True},
+     'region': {'left': 50, 'top': 60, 'right': 600, 'bottom': 420}},
+    {'output': {'maxWidth': 333}, 'tile_overlap': {'x': 8}, 'resample': False},
+    {'tile_offset': {'left': 13, 'top': 7}},
+    {'tile_position': {'region_x': 2, 'region_y': 3}},
+])
+def testTilePlan(kwargs):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=6, tileWidth=64, tileHeight=48, sizeX=700, sizeY=500)
+    tileIter = ts.tileIterator(format=large_image.constants.TILE_FORMAT_NUMPY, **kwargs)
+    plan = tileIter.plan
+    tiles = list(tileIter)
+    assert len(plan) == len(tiles)
+    for key in ['x', 'y', 'width', 'height', 'level_x', 'level_y']:
+        assert getattr(plan, key).tolist() == [tile[key] for tile in tiles]
+    assert plan.positions.tolist() == [tile['tile_position']['position'] for tile in tiles]
+    entry = plan[-1]
+    assert (entry.position, entry.level_x, entry.level_y) == (
+        tiles[-1]['tile_position']['position'], tiles[-1]['level_x'], tiles[-1]['level_y'])
+    subset = plan[plan.width < plan.width.max()]
+    assert len(subset) == sum(1 for tile in tiles if tile['width'] < max(
+        tile['width'] for tile in tiles))
+    for entry in subset:
+        tile = entry.tileDict()
+        assert tile == tiles[entry.position - tiles[0]['tile_position']['position']]
+    with pytest.raises(IndexError):
+        plan[len(plan)]
+
+
+@pytest.mark.parametrize('method', ['contiguous', 'roundrobin', 'zorder'])
+def testTileIteratorShard(method):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=6, tileWidth=64, tileHeight=48, sizeX=700, sizeY=500)
+    kwargs = {'format': large_image.constants.TILE_FORMAT_NUMPY,
+              'tile_overlap': {'x': 8, 'y': 8}}
+    full = {tile['tile_position']['position']: tile
+            for tile in ts.tileIterator(**kwargs)}
+    parts = [list(ts.tileIterator(shard=(idx, 4, method), **kwargs)) for idx in range(4)]
+    assert max(len(part) for part in parts) - min(len(part) for part in parts) <= 1
+    for idx in range(4):
+        assert ts.tileIterator(
+            shard=(idx, 4, method), **kwargs).info['tile_count'] == len(parts[idx])
+    positions = [tile['tile_position']['position'] for part in parts for tile in part]
+    assert sorted(positions) == sorted(full)
+    for tile in parts[2]:
+        assert tile == full[tile['tile_position']['position']]
+    if method == 'roundrobin':
+        assert [tile['tile_position']['position'] for tile in parts[1]][:3] == [1, 5, 9]
+
+    # Resume from a checkpoint or a position
+    tileIter = ts.tileIterator(shard=(2, 4, method), prefetch=2, **kwargs)
+    for idx, _ in enumerate(tileIter):
+        if idx == 9:
+            break
+    checkpoint = tileIter.checkpoint()
+    resumed = list(ts.tileIterator(shard=(2, 4, method), checkpoint=checkpoint, **kwargs))
+    assert resumed == parts[2][10:]
+    resumed = list(ts.tileIterator(
+        shard=(2, 4, method), start_position=parts[2][5]['tile_position']['position'],
+        **kwargs))
+    assert resumed == parts[2][5:]
+    with pytest.raises(ValueError, match='different iteration'):
+        ts.tileIterator(shard=(1, 4, method), checkpoint=checkpoint, **kwargs)
+    with pytest.raises(ValueError, match='not part of this iteration'):
+        ts.tileIterator(shard=(2, 4, method), start_position=parts[1][0][
+            'tile_position']['position'], **kwargs)
+    with pytest.raises(ValueError, match='shard count'):
+        ts.tileIterator(shard=(4, 4, method), **kwargs)
+
+
+def testTileIteratorForeground(tmp_path):
+    large_image_source_tifffile = pytest.importorskip('large_image_source_tifffile')
+    tifffile = pytest.importorskip('tifffile')
+
+    rng = np.random.default_rng(0)
+    data = rng.integers(235, 250, (1500, 2000, 3), dtype=np.uint8)
+    data[500:1050, 250:850] = rng.integers(80, 180, (550, 600, 3), dtype=np.uint8)
+    data[1250:1300, 1750:1800] = 60
+    path = str(tmp_path / 'slide.tiff')
+    tifffile.imwrite(path, data, tile=(128, 128), photometric='rgb')
+    ts = large_image_source_tifffile.open(path, noCache=True)
+    mask = ts.getForegroundMask()
+    assert mask.shape == (384, 512)
+    assert ts.getForegroundMask() is mask
+
+    assert ts.tileIterator(
+        format=large_image.constants.TILE_FORMAT_NUMPY).info['tile_count'] == 192
+    tileIter = ts.tileIterator(format=large_image.constants.TILE_FORMAT_NUMPY, foreground=True)
+    # The tile count is the number of tiles in the foreground
+    assert tileIter.info['tile_count'] == 40
+    tiles = {(tile['level_x'], tile['level_y']) for tile in tileIter}
+    dark = {(tile['level_x'], tile['level_y'])
+            for tile in ts.tileIterator(format=large_image.constants.TILE_FORMAT_NUMPY)
+            if np.any(tile['tile'].mean(axis=2) < 150)}
+    assert tiles == dark
+    assert len(tiles) == 40
+    # Predicates can be functions, and foreground works with other options
+    tiles = [(tile['level_x'], tile['level_y']) for shard in range(2)
+             for tile in ts.tileIterator(
+                 format=large_image.constants.TILE_FORMAT_NUMPY,
+                 foreground=lambda image: image[:, :, 0] < 70, shard=(shard, 2, 'zorder'))]
+    assert sorted(tiles) == [(13, 9), (13, 10), (14, 9), (14, 10)]
+    # Masks from functions aren't kept, and nodata can be a value per band
+    assert ts._foregroundMasks.keys() == {('tissue', None, 512, None, None)}
+    mask = ts.getForegroundMask('nodata', nodata=[60, 60, 60])
+    assert ts.getForegroundMask('nodata', nodata=np.array([60, 60, 60])) is mask
+    assert not mask[325, 453]
+    assert mask[0, 0]
+
+
+@pytest.mark.parametrize(('method', 'kwargs', 'expected'), [
+    ('tissue', {}, [[True, False], [False, False]]),
+    ('tissue', {'threshold': 0.99}, [[True, True], [False, False]]),
+    ('alpha', {}, [[True, True], [False, False]]),
+    ('nodata', {}, [[True, True], [True, False]]),
+    ('nodata', {'nodata': 250}, [[True, True], [True, True]]),
+])
+def testForegroundMask(method, kwargs, expected):
+    image = np.array([
+        [[20, 30, 40, 255], [240, 240, 240, 255]],
+        [[250, 250, 250, 0], [0, 0, 0, 0]],
+    ], dtype=np.uint8)
+    mask = large_image.tilesource.foreground.foregroundMask(image, method, **kwargs)
+    assert mask.tolist() == expected
+
+
+def _tileSum(tile):
+    return tile['tile_position']['position'], int(tile['tile'].astype(int).sum())
+
+
+@pytest.mark.parametrize('executor', ['process', 'thread'])
+def testMapTiles(executor):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=5, tileWidth=64, tileHeight=48, sizeX=700, sizeY=500)
+    expected = [(tile['tile_position']['position'], int(tile['tile'].astype(int).sum()))
+                for tile in ts.tileIterator(format=large_image.constants.TILE_FORMAT_NUMPY)]
+    assert ts.mapTiles(_tileSum, workers=1) == expected
+    progress = []
+    assert ts.mapTiles(
+        _tileSum, workers=3, executor=executor,
+        progress=lambda done, total: progress.append((done, total))) == expected
+    assert progress[-1] == (121, 121)
+    assert len(progress) > 1
+    total = ts.mapTiles(
+        _tileSum, reduce=lambda value, result: value + result[1], initial=0,
+        workers=3, executor=executor)
+    assert total == sum(result[1] for result in expected)
+    assert ts.mapTiles(
+        _tileSum, reduce=lambda value, result: max(value, result), workers=2,
+        executor=executor, shard=(1, 2)) == expected[-1]
+    with pytest.raises(ValueError, match='executor'):
+        ts.mapTiles(_tileSum, executor='cluster')
+
+
+def testTileArray(monkeypatch):
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=4, tileWidth=64, tileHeight=48, sizeX=300, sizeY=200, frames=4)
+    arr = ts.asarray()
+    assert arr.shape == (200, 300, 3)
+    assert arr.chunks == ((48, 48, 48, 48, 8), (64, 64, 64, 64, 44), (3, ))
+    full, _ = ts.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY)
+    assert np.array_equal(np.asarray(arr), full)
+    tiles = []
+    getTile = ts.getTile
+
+    def countTiles(*args, **kwargs):
+        tiles.append(args[:2])
+        return getTile(*args, **kwargs)
+
+    monkeypatch.setattr(ts, 'getTile', countTiles)
+    # Only the tiles with selected pixels are read
+    assert np.array_equal(arr[50:90, 70:120:3, 1], full[50:90, 70:120:3, 1])
+    assert tiles == [(1, 1)]
+    tiles[:] = []
+    assert np.array_equal(arr[100, 60:70], full[100, 60:70])
+    assert tiles == [(0, 2), (1, 2)]
+    for key in [-1, (slice(None, None, -7), 5), (..., 0), (slice(60, 61), slice(None, None, 70))]:
+        assert np.array_equal(arr[key], full[key])
+    # Integer arrays index each axis independently
+    rows, cols = [5, 190, 7], [1, 299, 64]
+    assert np.array_equal(arr[rows, cols], full[np.ix_(rows, cols)])
+    assert np.array_equal(arr[7, :, [2, 0]], full[7][:, [2, 0]])
+    with pytest.raises(IndexError):
+        arr[200]
+    with pytest.raises(ValueError, match='does not exist'):
+        ts.asarray(level=5)
+
+    frames = [2, 0, 3]
+    arr = ts.asarray(level=1, frames=frames)
+    assert arr.shape == (3, 50, 75, 3)
+    for idx, frame in enumerate(frames):
+        region, _ = ts.getRegion(
+            format=large_image.constants.TILE_FORMAT_NUMPY, frame=frame,
+            output={'maxWidth': 75, 'maxHeight': 50}, resample=None)
+        assert np.array_equal(arr[idx], region)
+        assert np.array_equal(arr[idx, 10:40, -30:], region[10:40, -30:])
+    dask = pytest.importorskip('dask.array')
+    darr = dask.from_array(arr, chunks=arr.chunks)
+    assert darr.numblocks == (3, 2, 2, 1)
+    assert np.array_equal(darr[1:, 5:45, 60:].compute(), np.asarray(arr)[1:, 5:45, 60:])
+
+
+@pytest.mark.parametrize(('method', 'pilMethod'), [
+    ('area', PIL.Image.Resampling.BOX),
+    ('bilinear', PIL.Image.Resampling.BILINEAR),
+    ('bicubic', PIL.Image.Resampling.BICUBIC),
+    ('lanczos', PIL.Image.Resampling.LANCZOS),
+])
+def testResizeArray(method, pilMethod):
+    from large_image.tilesource.resample import resizeArray
+
+    # PIL clips to 8 bits between passes, so compare with a smooth image
+    # where filters don't overshoot much
+    yy, xx = np.mgrid[0:300, 0:400]
+    image = np.dstack([
+        127.5 + 127 * np.sin(xx / 17) * np.cos(yy / 23), xx * 255 / 400, yy * 255 / 300,
+    ]).astype(np.uint8)
+    for width, height in [(130, 70), (400, 150), (250, 333)]:
+        result = resizeArray(image, width, height, method)
+        expected = np.asarray(PIL.Image.fromarray(image).resize((width, height), pilMethod))
+        assert result.shape == (height, width, 3)
+        assert result.dtype == np.uint8
+        # PIL uses fixed point arithmetic, so values differ by rounding
+        assert np.abs(result.astype(int) - expected).max() <= 2
+    # Other data types and band counts keep their values and precision
+    wide = image.astype(np.uint16) * 257
+    result = resizeArray(wide, 130, 70, method)
+    assert result.dtype == np.uint16
+    expected = resizeArray(image, 130, 70, method).astype(int) * 257
+    assert np.abs(result.astype(int) - expected).max() <= 2 * 257
+    multi = np.dstack([image, image]).astype(np.float32) / 255
+    result = resizeArray(multi, 130, 70, method)
+    assert result.shape == (70, 130, 6)
+    assert result.dtype == np.float32
+    assert np.allclose(result[:, :, :3], result[:, :, 3:])
+
+
+@pytest.mark.parametrize(('method', 'maxNaN'), [
+    ('area', 1),
+    ('bilinear', 4),
+    ('lanczos', 36),
+])
+def testResizeArrayNaN(method, maxNaN):
+    from large_image.tilesource.resample import resizeArray
+
+    image = np.random.default_rng(0).random((1000, 1000)).astype(np.float32)
+    expected = resizeArray(image, 500, 500, method)
+    image[501, 401] = np.nan
+    result = resizeArray(image, 500, 500, method)
+    # A missing value only affects the pixels whose filter covers it
+    nan = np.isnan(result)
+    assert 0 < nan.sum() <= maxNaN
+    assert np.allclose(result[~nan], expected[~nan])
+    image[0, 0] = np.inf
+    assert np.isnan(resizeArray(image, 500, 500, method)).sum() <= maxNaN + 1
+
+
+def testResizeArrayNearest():
+    from large_image.tilesource.resample import resizeArray, resizeMethod
+
+    image = np.arange(60, dtype=np.int32).reshape(6, 10)
+    result = resizeArray(image, 4, 3, 'nearest')
+    assert np.array_equal(result, image[::2][:, [0, 2, 5, 7]])
+    with pytest.raises(ValueError, match='Unknown resize'):
+        resizeArray(image, 4, 3, 'sharpest')
+    assert resizeMethod(True) == 'lanczos'
+    assert resizeMethod(PIL.Image.Resampling.BILINEAR) == 'bilinear'
+    assert resizeMethod(PIL.Image.Resampling.HAMMING) is None
+
+
+def testGetRegionScaleUint16():
+    ts = large_image_source_test.TestTileSource(
+        None, maxLevel=3, tileWidth=128, tileHeight=128,
+        bands='a=0-60000,b=0-60000,c=0-60000,d=0-60000,e=0-60000')
+    full, _ = ts.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY)
+    assert full.dtype == np.uint16
+    for resample in [True, None]:
+        kwargs = {'output': {'maxWidth': 256}}
+        if resample is None:
+            kwargs['resample'] = None
+        scaled, _ = ts.getRegion(format=large_image.constants.TILE_FORMAT_NUMPY, **kwargs)
+        assert scaled.shape == (full.shape[0] // 4, full.shape[1] // 4, 5)
+        assert scaled.dtype == np.uint16
+        # Values are not reduced to 8 bits
+        assert np.any(scaled % 257)
+    # Resampled tiles keep their dtype and bands
+    for tile in ts.tileIterator(
+            format=large_image.constants.TILE_FORMAT_NUMPY, scale={'magnification': 0.5},
+            resample=True):
+        assert tile['tile'].dtype == np.uint16
+        assert tile['tile'].shape[2] == 5
+
+
 @pytest.mark.parametrize((
     'options', 'lensrc', 'lenquads', 'frame10', 'src0', 'srclast', 'quads10',
 ), [